@@ -9,36 +9,86 @@ from rest_framework.status import HTTP_200_OK, HTTP_404_NOT_FOUND, HTTP_400_BAD_
 from rest_framework.views import APIView
 
 from backpack.models import BackpackCollection, BackpackBadgeShare, BackpackCollectionShare
-from backpack.serializers_v1 import CollectionSerializerV1, LocalBadgeInstanceUploadSerializerV1
+from backpack.serializers_v1 import CollectionSerializerV1, LocalBadgeInstanceUploadSerializerV1, \
+    LocalBadgeInstanceSummarySerializerV1
 from backpack.serializers_v2 import BackpackAssertionSerializerV2, BackpackCollectionSerializerV2, \
-    BackpackImportSerializerV2
-from entity.api import BaseEntityListView, BaseEntityDetailView
+    BackpackImportSerializerV2, BackpackAssertionSummarySerializerV2
+from entity.api import BaseEntityListView, BaseEntityDetailView, UncachedPaginatedViewMixin
 from issuer.models import BadgeInstance
 from issuer.permissions import AuditedModelOwner, VerifiedEmailMatchesRecipientIdentifier, BadgrOAuthTokenHasScope
 from issuer.public_api import ImagePropertyDetailView
 from apispec_drf.decorators import apispec_list_operation, apispec_post_operation, apispec_get_operation, \
     apispec_delete_operation, apispec_put_operation, apispec_operation
+from mainsite.pagination import DateOrderedCursorPagination
 from mainsite.permissions import AuthenticatedWithVerifiedEmail
 
 
-class BackpackAssertionList(BaseEntityListView):
+class BackpackAssertionList(UncachedPaginatedViewMixin, BaseEntityListView):
     model = BadgeInstance
     v1_serializer_class = LocalBadgeInstanceUploadSerializerV1
     v2_serializer_class = BackpackAssertionSerializerV2
+    v1_summary_serializer_class = LocalBadgeInstanceSummarySerializerV1
+    v2_summary_serializer_class = BackpackAssertionSummarySerializerV2
     permission_classes = (AuthenticatedWithVerifiedEmail, VerifiedEmailMatchesRecipientIdentifier, BadgrOAuthTokenHasScope)
     http_method_names = ('get', 'post')
     valid_scopes = {
         'get': ['r:backpack', 'rw:backpack'],
         'post': ['rw:backpack'],
     }
-
-    def get_objects(self, request, **kwargs):
-        return filter(lambda a: (not a.revoked) and a.acceptance != BadgeInstance.ACCEPTANCE_REJECTED,
-                      self.request.user.cached_badgeinstances())
+    sort_fields = ('issued_on', '-issued_on')
+
+    def get_queryset(self, request, **kwargs):
+        queryset = request.user.get_badgeinstances().filter(
+            revoked=False
+        ).exclude(acceptance=BadgeInstance.ACCEPTANCE_REJECTED)
+
+        sort = self.get_sort(request)
+        if sort is not None:
+            queryset = queryset.order_by(sort, sort.replace('issued_on', 'pk'))
+        return queryset
+
+    def get_sort(self, request):
+        sort = request.query_params.get('sort', None)
+        if sort is not None and sort not in self.sort_fields:
+            raise ValidationError("sort must be one of: {}".format(', '.join(self.sort_fields)))
+        return sort
+
+    def get_paginator(self, request, **kwargs):
+        sort = self.get_sort(request)
+        if sort is None:
+            return super(BackpackAssertionList, self).get_paginator(request, **kwargs)
+        return DateOrderedCursorPagination(date_field='issued_on', descending=sort.startswith('-'))
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET' and self.request.query_params.get('summary', '').lower() == 'true':
+            if self.request.version == 'v1':
+                return self.v1_summary_serializer_class
+            return self.v2_summary_serializer_class
+        return super(BackpackAssertionList, self).get_serializer_class()
 
     @apispec_list_operation('Assertion',
         summary="Get a list of Assertions in authenticated user's backpack ",
-        tags=['Backpack']
+        tags=['Backpack'],
+        parameters=[
+            {
+                'in': 'query',
+                'name': "num",
+                'type': "string",
+                'description': 'Request pagination of results'
+            },
+            {
+                'in': 'query',
+                'name': "sort",
+                'type': "string",
+                'description': 'Order by issued_on or -issued_on instead of the default order'
+            },
+            {
+                'in': 'query',
+                'name': "summary",
+                'type': "boolean",
+                'description': 'Return a lightweight representation of each Assertion'
+            }
+        ]
     )
     def get(self, request, **kwargs):
         return super(BackpackAssertionList, self).get(request, **kwargs)
@@ -16,6 +16,7 @@ from backpack.sharing import SharingManager
 from issuer.utils import CURRENT_OBI_VERSION, get_obi_context, add_obi_version_ifneeded
 from mainsite.managers import SlugOrJsonIdCacheModelManager
 from mainsite.models import BadgrApp
+from mainsite.publish import publish_coalesced
 from mainsite.utils import OriginSetting
 
 
@@ -32,6 +33,7 @@ class BackpackCollection(BaseAuditedModel, BaseVersionedEntity):
 
     cached = SlugOrJsonIdCacheModelManager(slug_kwarg_name='entity_id', slug_field_name='entity_id')
 
+    @publish_coalesced
     def publish(self):
         super(BackpackCollection, self).publish()
         self.publish_by('share_hash')
@@ -132,6 +134,12 @@ class BackpackCollection(BaseAuditedModel, BaseVersionedEntity):
 
         return json
 
+    def get_json_version(self):
+        """
+        A string that changes whenever the collection's own part of get_json() may have changed
+        """
+        return '{}.{}.{}'.format(self.entity_version, self.cached_creator.first_name, self.cached_creator.last_name)
+
     @property
     def cached_badgrapp(self):
         id = self.cached_creator.badgrapp_id if self.cached_creator.badgrapp_id else getattr(settings, 'BADGR_APP_ID', 1)
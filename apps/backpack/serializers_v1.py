@@ -20,6 +20,12 @@ from mainsite.utils import OriginSetting
 logger = badgrlog.BadgrLogger()
 
 
+class LocalBadgeInstanceUploadListSerializerV1(serializers.ListSerializer):
+    def to_representation(self, data):
+        data = BadgeInstance.objects.prefetch_cached(data)
+        return super(LocalBadgeInstanceUploadListSerializerV1, self).to_representation(data)
+
+
 class LocalBadgeInstanceUploadSerializerV1(serializers.Serializer):
     image = Base64FileField(required=False, write_only=True)
     url = serializers.URLField(required=False, write_only=True)
@@ -31,6 +37,9 @@ class LocalBadgeInstanceUploadSerializerV1(serializers.Serializer):
 
     extensions = serializers.DictField(source='extension_items', read_only=True)
 
+    class Meta:
+        list_serializer_class = LocalBadgeInstanceUploadListSerializerV1
+
     # Reinstantiation using fields from badge instance when returned by .create
     # id = serializers.IntegerField(read_only=True)
     # json = V1InstanceSerializer(read_only=True)
@@ -65,8 +74,9 @@ class LocalBadgeInstanceUploadSerializerV1(serializers.Serializer):
                 "id": "{}{}?type=png".format(OriginSetting.HTTP, reverse('issuer_image', kwargs={'entity_id': obj.cached_issuer.entity_id}))
             }
 
-        if obj.image:
-            representation['image'] = obj.image_url()
+        image_url = obj.image_url() if obj.image else obj.get_unstored_image_url()
+        if image_url:
+            representation['image'] = image_url
 
         representation['shareUrl'] = obj.share_url
 
@@ -126,6 +136,33 @@ class LocalBadgeInstanceUploadSerializerV1(serializers.Serializer):
         return instance
 
 
+class LocalBadgeInstanceSummarySerializerV1(serializers.Serializer):
+    """
+    Lightweight read-only representation of a backpack assertion for listings, without the nested assertion json
+    """
+    recipient_identifier = serializers.CharField(read_only=True)
+    acceptance = serializers.CharField(read_only=True)
+    issued_on = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        list_serializer_class = LocalBadgeInstanceUploadListSerializerV1
+
+    def to_representation(self, obj):
+        representation = super(LocalBadgeInstanceSummarySerializerV1, self).to_representation(obj)
+        representation['id'] = obj.entity_id
+        representation['badgeclass'] = obj.cached_badgeclass.entity_id
+        representation['issuer'] = obj.cached_issuer.entity_id
+        representation['imagePreview'] = {
+            "type": "image",
+            "id": "{}{}?type=png".format(OriginSetting.HTTP, reverse('badgeclass_image', kwargs={'entity_id': obj.cached_badgeclass.entity_id}))
+        }
+        image_url = obj.image_url() if obj.image else obj.get_unstored_image_url()
+        if image_url:
+            representation['image'] = image_url
+        representation['shareUrl'] = obj.share_url
+        return representation
+
+
 class CollectionBadgesSerializerV1(serializers.ListSerializer):
 
 
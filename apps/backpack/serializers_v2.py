@@ -8,14 +8,20 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError as RestframeworkValidationError
 
 from backpack.models import BackpackCollection
-from entity.serializers import DetailSerializerV2, EntityRelatedFieldV2
+from entity.serializers import DetailSerializerV2, EntityRelatedFieldV2, ListSerializerV2
 from issuer.helpers import BadgeCheckHelper
 from issuer.models import BadgeInstance, BadgeClass, Issuer
 from issuer.serializers_v2 import BadgeRecipientSerializerV2, EvidenceItemSerializerV2
-from mainsite.drf_fields import ValidImageField
+from mainsite.drf_fields import ValidImageField, FileOrFallbackUrlField
 from mainsite.serializers import MarkdownCharField, HumanReadableBooleanField, OriginalJsonSerializerMixin
 
 
+class BackpackAssertionListSerializerV2(ListSerializerV2):
+    def to_representation(self, instance):
+        instance = BadgeInstance.objects.prefetch_cached(instance)
+        return super(BackpackAssertionListSerializerV2, self).to_representation(instance)
+
+
 class BackpackAssertionSerializerV2(DetailSerializerV2, OriginalJsonSerializerMixin):
     acceptance = serializers.ChoiceField(choices=BadgeInstance.ACCEPTANCE_CHOICES, default=BadgeInstance.ACCEPTANCE_ACCEPTED)
 
@@ -26,7 +32,7 @@ class BackpackAssertionSerializerV2(DetailSerializerV2, OriginalJsonSerializerMi
     issuer = EntityRelatedFieldV2(source='cached_issuer', required=False, queryset=Issuer.cached)
     issuerOpenBadgeId = serializers.URLField(source='issuer_jsonld_id', read_only=True)
 
-    image = serializers.FileField(read_only=True)
+    image = FileOrFallbackUrlField(file_attribute='image', fallback_url_method='get_unstored_image_url')
     recipient = BadgeRecipientSerializerV2(source='*')
     issuedOn = serializers.DateTimeField(source='issued_on', read_only=True)
     narrative = MarkdownCharField(required=False)
@@ -37,6 +43,24 @@ class BackpackAssertionSerializerV2(DetailSerializerV2, OriginalJsonSerializerMi
 
     class Meta(DetailSerializerV2.Meta):
         model = BadgeInstance
+        list_serializer_class = BackpackAssertionListSerializerV2
+
+
+class BackpackAssertionSummarySerializerV2(DetailSerializerV2):
+    """
+    Lightweight read-only representation of a backpack assertion for listings
+    """
+    acceptance = serializers.CharField(read_only=True)
+    openBadgeId = serializers.URLField(source='jsonld_id', read_only=True)
+    badgeclass = EntityRelatedFieldV2(source='cached_badgeclass', read_only=True)
+    issuer = EntityRelatedFieldV2(source='cached_issuer', read_only=True)
+    image = FileOrFallbackUrlField(file_attribute='image', fallback_url_method='get_unstored_image_url')
+    issuedOn = serializers.DateTimeField(source='issued_on', read_only=True)
+    expires = serializers.DateTimeField(source='expires_at', read_only=True)
+
+    class Meta(DetailSerializerV2.Meta):
+        model = BadgeInstance
+        list_serializer_class = BackpackAssertionListSerializerV2
 
 
 class BackpackCollectionSerializerV2(DetailSerializerV2):
@@ -14,7 +14,7 @@ from openbadges_bakery import bake, unbake
 
 from badgeuser.models import CachedEmailAddress, BadgeUser
 from issuer.models import BadgeClass, Issuer, BadgeInstance
-from mainsite.tests.base import BadgrTestCase
+from mainsite.tests.base import BadgrTestCase, SetupIssuerHelper
 
 from backpack.models import BackpackCollection, BackpackCollectionBadgeInstance
 from backpack.serializers_v1 import (CollectionSerializerV1)
@@ -1120,3 +1120,62 @@ class TestCollections(BadgrTestCase):
 
         self.assertEqual(response.status_code, 301)
         self.assertEqual(response.get('Location', None), self.local_badge_instance_1.public_url)
+
+
+class TestBackpackAssertionList(SetupIssuerHelper, BadgrTestCase):
+    def setUp(self):
+        super(TestBackpackAssertionList, self).setUp()
+        self.user = self.setup_user(email='earner@example.com', authenticate=True)
+        issuer_owner = self.setup_user(authenticate=False)
+        self.issuer = self.setup_issuer(owner=issuer_owner)
+        self.badgeclass = self.setup_badgeclass(issuer=self.issuer)
+
+        now = timezone.now()
+        self.assertions = [
+            self.badgeclass.issue(recipient_id='earner@example.com', issued_on=now - datetime.timedelta(days=days))
+            for days in (3, 1, 4, 1, 2)
+        ]
+        self.badgeclass.issue(recipient_id='earner@example.com').revoke('revoked')
+        self.badgeclass.issue(recipient_id='earner@example.com', acceptance=BadgeInstance.ACCEPTANCE_REJECTED)
+        self.badgeclass.issue(recipient_id='someone-else@example.com')
+
+    def _get_all_pages(self, url):
+        entity_ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            entity_ids.extend(a['entityId'] for a in response.data['result'])
+            links = dict((rel.split('"')[1], link.strip('<> ')) for link, rel in
+                         (l.split(';') for l in response.get('Link', '').split(',') if l))
+            url = links.get('next')
+        return entity_ids
+
+    def test_excludes_revoked_and_rejected_assertions(self):
+        response = self.client.get('/v2/backpack/assertions')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(a['entityId'] for a in response.data['result']),
+                         set(a.entity_id for a in self.assertions))
+
+    def test_paginate_by_issued_on(self):
+        by_issued_on = sorted(self.assertions, key=lambda a: (a.issued_on, a.pk))
+
+        entity_ids = self._get_all_pages('/v2/backpack/assertions?num=2&sort=issued_on')
+        self.assertEqual(entity_ids, [a.entity_id for a in by_issued_on])
+
+        entity_ids = self._get_all_pages('/v2/backpack/assertions?num=2&sort=-issued_on')
+        self.assertEqual(entity_ids, [a.entity_id for a in reversed(by_issued_on)])
+
+        response = self.client.get('/v2/backpack/assertions?sort=name')
+        self.assertEqual(response.status_code, 400)
+
+    def test_summary_representation(self):
+        response = self.client.get('/v2/backpack/assertions?summary=true&num=10')
+        self.assertEqual(response.status_code, 200)
+        summary = response.data['result'][0]
+        self.assertEqual(summary['badgeclass'], self.badgeclass.entity_id)
+        self.assertNotIn('evidence', summary)
+
+        response = self.client.get('/v1/earner/badges?summary=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), len(self.assertions))
+        self.assertNotIn('json', response.data[0])
@@ -1,15 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, pre_delete
 
 from allauth.account.signals import user_signed_up, email_confirmed
 
-from .signals import log_user_signed_up, log_email_confirmed
+from .signals import log_user_signed_up, log_email_confirmed, index_email_address, unindex_email_address
 
 
 class BadgeUserConfig(AppConfig):
     name='badgeuser'
 
     def ready(self):
+        from allauth.account.models import EmailAddress
+        from badgeuser.models import CachedEmailAddress
+
         user_signed_up.connect(log_user_signed_up,
                                dispatch_uid="user_signed_up")
         email_confirmed.connect(log_email_confirmed,
                                 dispatch_uid="email_confirmed")
+
+        # keep the RecipientIdentifier index in step with verified email addresses and their variants
+        for email_address_class in (EmailAddress, CachedEmailAddress):
+            post_save.connect(index_email_address, sender=email_address_class,
+                              dispatch_uid="index_email_address_{}".format(email_address_class.__name__))
+            pre_delete.connect(unindex_email_address, sender=email_address_class,
+                               dispatch_uid="unindex_email_address_{}".format(email_address_class.__name__))
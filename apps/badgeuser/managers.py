@@ -1,6 +1,7 @@
 from allauth.account.managers import EmailAddressManager
 from django.contrib.auth.models import UserManager
 from django.core.exceptions import ValidationError
+from django.db import models, transaction
 
 from mainsite.models import BadgrApp
 
@@ -75,4 +76,68 @@ class CachedEmailAddressManager(EmailAddressManager):
         if email_address.email.lower() == email.lower() and email_address.email != email:
             self.model.add_variant(email)
 
-        return email_address
\ No newline at end of file
+        return email_address
+
+
+class RecipientIdentifierManager(models.Manager):
+    def sync_email_address(self, email_address):
+        """
+        Index the recipient identifier of email_address while it is verified, and nothing otherwise.  Its variants
+        only differ from it in case, so they are covered by the same lowercased row.  Users whose set of identifiers
+        changed are published.
+        """
+        from recipient.models import RecipientProfile
+
+        identifiers = set()
+        if email_address.pk is not None and email_address.verified:
+            identifiers.add(self.model.normalize(email_address.email))
+
+        changed_users = set()
+        with transaction.atomic():
+            for entry in self.filter(email_address_id=email_address.pk).exclude(identifier__in=identifiers):
+                changed_users.add(entry.user_id)
+                entry.delete()
+
+            existing = {e.identifier: e for e in self.filter(identifier__in=identifiers)}
+            profiles = {}
+            for identifier in identifiers:
+                profile = RecipientProfile.objects.filter(recipient_identifier__iexact=identifier).order_by('pk').first()
+                if profile is not None:
+                    profiles[identifier] = profile.pk
+
+            for identifier in identifiers:
+                entry = existing.get(identifier, self.model(identifier=identifier))
+                if entry.pk is not None and entry.user_id == email_address.user_id \
+                        and entry.email_address_id == email_address.pk:
+                    continue
+                if entry.user_id is not None:
+                    changed_users.add(entry.user_id)
+                changed_users.add(email_address.user_id)
+                entry.user_id = email_address.user_id
+                entry.email_address_id = email_address.pk
+                entry.recipient_profile_id = profiles.get(identifier)
+                entry.save()
+
+        self._publish_users(changed_users)
+
+    def remove_email_address(self, email_address):
+        """
+        Remove the recipient identifier of email_address from the index, handing it to another verified address that
+        differs from it only in case, if there is one.
+        """
+        from badgeuser.models import CachedEmailAddress
+
+        changed_users = set()
+        for entry in self.filter(email_address_id=email_address.pk):
+            changed_users.add(entry.user_id)
+            entry.delete()
+        self._publish_users(changed_users)
+
+        others = CachedEmailAddress.objects.filter(email__iexact=email_address.email, verified=True)
+        for other in others.exclude(pk=email_address.pk):
+            self.sync_email_address(other)
+
+    def _publish_users(self, user_ids):
+        from badgeuser.models import BadgeUser
+        for user in BadgeUser.objects.filter(pk__in=user_ids):
+            user.publish()
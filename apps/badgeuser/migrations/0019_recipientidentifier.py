@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-17 06:40
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_recipientidentifier(apps, schema_editor):
+    EmailAddress = apps.get_model('account', 'EmailAddress')
+    RecipientIdentifier = apps.get_model('badgeuser', 'RecipientIdentifier')
+    RecipientProfile = apps.get_model('recipient', 'RecipientProfile')
+
+    # one row per lowercased address, variants only differ from their address in case.  When verified addresses
+    # differ only in case the most recently added one owns the row, as sync_email_address() would leave it.
+    entries = {}
+    for email_address in EmailAddress.objects.filter(verified=True).order_by('pk'):
+        identifier = email_address.email.lower()
+        entries[identifier] = RecipientIdentifier(
+            identifier=identifier, user_id=email_address.user_id, email_address_id=email_address.pk)
+
+    for profile in RecipientProfile.objects.order_by('-pk').iterator():
+        entry = entries.get(profile.recipient_identifier.lower())
+        if entry is not None:
+            entry.recipient_profile_id = profile.pk
+
+    RecipientIdentifier.objects.bulk_create(entries.values(), batch_size=500)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_email_max_length'),
+        ('recipient', '0011_auto_20171025_1020'),
+        ('badgeuser', '0018_termsversion_short_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipientIdentifier',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier', models.EmailField(max_length=254, unique=True)),
+                ('email_address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='badgeuser.CachedEmailAddress')),
+                ('recipient_profile', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='recipient.RecipientProfile')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(populate_recipientidentifier, reverse_code=noop)
+    ]
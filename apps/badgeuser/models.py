@@ -23,8 +23,11 @@ from rest_framework.authtoken.models import Token
 from backpack.models import BackpackCollection
 from entity.models import BaseVersionedEntity
 from issuer.models import Issuer, BadgeInstance, BaseAuditedModel
-from badgeuser.managers import CachedEmailAddressManager, BadgeUserManager
+from badgeuser.managers import CachedEmailAddressManager, BadgeUserManager, RecipientIdentifierManager
+from mainsite import identity_map
+from mainsite.managers import IdentityMapCacheModelManager
 from mainsite.models import ApplicationInfo
+from mainsite.publish import publish_coalesced
 
 
 class CachedEmailAddress(EmailAddress, cachemodel.CacheModel):
@@ -35,6 +38,7 @@ class CachedEmailAddress(EmailAddress, cachemodel.CacheModel):
         verbose_name = _("email address")
         verbose_name_plural = _("email addresses")
 
+    @publish_coalesced
     def publish(self):
         super(CachedEmailAddress, self).publish()
         self.publish_by('email')
@@ -96,6 +100,12 @@ class EmailAddressVariant(models.Model):
         super(EmailAddressVariant, self).save(*args, **kwargs)
         self.canonical_email.save()
 
+    def delete(self, *args, **kwargs):
+        canonical_email = self.canonical_email
+        super(EmailAddressVariant, self).delete(*args, **kwargs)
+        RecipientIdentifier.objects.sync_email_address(canonical_email)
+        canonical_email.publish()
+
     def __unicode__(self):
         return self.email
 
@@ -123,6 +133,56 @@ class EmailAddressVariant(models.Model):
         return True
 
 
+class RecipientIdentifier(cachemodel.CacheModel):
+    """
+    An index from each email address a user has verified to the user and the RecipientProfile of the address.  Kept up
+    to date by badgeuser.signals as email addresses and variants are saved and deleted.
+
+    Identifiers are stored lowercased, so a verified address and all of its variants, which may only differ from it in
+    case, share one row.  Look rows up by RecipientIdentifier.normalize(recipient_identifier).
+    """
+    identifier = models.EmailField(max_length=254, unique=True)
+    user = models.ForeignKey('badgeuser.BadgeUser', on_delete=models.CASCADE)
+    email_address = models.ForeignKey(CachedEmailAddress, on_delete=models.CASCADE)
+    recipient_profile = models.ForeignKey('recipient.RecipientProfile', blank=True, null=True, default=None,
+                                          on_delete=models.SET_NULL)
+
+    objects = RecipientIdentifierManager()
+    cached = IdentityMapCacheModelManager()
+
+    def __unicode__(self):
+        return self.identifier
+
+    @staticmethod
+    def normalize(recipient_identifier):
+        return recipient_identifier.lower()
+
+    @publish_coalesced
+    def publish(self):
+        super(RecipientIdentifier, self).publish()
+        self.publish_by('identifier')
+        identity_map.evict(self)
+
+    def delete(self, *args, **kwargs):
+        self.publish_delete('identifier')
+        identity_map.evict(self)
+        super(RecipientIdentifier, self).delete(*args, **kwargs)
+
+    @property
+    def cached_user(self):
+        return BadgeUser.cached.get(pk=self.user_id)
+
+    @property
+    def cached_recipient_profile(self):
+        from recipient.models import RecipientProfile
+        if self.recipient_profile_id is None:
+            return None
+        try:
+            return RecipientProfile.cached.get(pk=self.recipient_profile_id)
+        except RecipientProfile.DoesNotExist:
+            return None
+
+
 class BadgeUser(BaseVersionedEntity, AbstractUser, cachemodel.CacheModel):
     """
     A full-featured user model that can be an Earner, Issuer, or Consumer of Open Badges
@@ -137,6 +197,7 @@ class BadgeUser(BaseVersionedEntity, AbstractUser, cachemodel.CacheModel):
     marketing_opt_in = models.BooleanField(default=False)
 
     objects = BadgeUserManager()
+    cached = IdentityMapCacheModelManager()
 
     class Meta:
         verbose_name = _('badge user')
@@ -155,6 +216,7 @@ class BadgeUser(BaseVersionedEntity, AbstractUser, cachemodel.CacheModel):
         """
         send_mail(subject, message, from_email, [self.primary_email], **kwargs)
 
+    @publish_coalesced
     def publish(self):
         super(BadgeUser, self).publish()
         self.publish_by('username')
@@ -262,7 +324,22 @@ class BadgeUser(BaseVersionedEntity, AbstractUser, cachemodel.CacheModel):
 
     @property
     def all_recipient_identifiers(self):
-        return [e.email for e in self.cached_emails() if e.verified] + [e.email for e in self.cached_email_variants()]
+        return [e.email for e in self.verified_emails] + [e.email for e in self.cached_email_variants() if e.verified]
+
+    def has_recipient_identifier(self, recipient_identifier):
+        try:
+            return RecipientIdentifier.cached.get(
+                identifier=RecipientIdentifier.normalize(recipient_identifier)).user_id == self.id
+        except RecipientIdentifier.DoesNotExist:
+            return False
+
+    def get_badgeinstances(self):
+        """
+        Return a queryset of the assertions awarded to any of this user's verified recipient identifiers, compared in
+        the database's case-insensitive collation like the other recipient_identifier lookups
+        """
+        return BadgeInstance.objects.filter(
+            recipient_identifier__in=RecipientIdentifier.objects.filter(user=self).values('identifier'))
 
     @cachemodel.cached_method(auto_publish=True)
     def cached_issuers(self):
@@ -280,7 +357,7 @@ class BadgeUser(BaseVersionedEntity, AbstractUser, cachemodel.CacheModel):
 
     @cachemodel.cached_method(auto_publish=True)
     def cached_badgeinstances(self):
-        return BadgeInstance.objects.filter(recipient_identifier__in=self.all_recipient_identifiers)
+        return self.get_badgeinstances()
 
     @cachemodel.cached_method(auto_publish=True)
     def cached_externaltools(self):
@@ -8,3 +8,15 @@ def log_user_signed_up(sender, **kwargs):
 
 def log_email_confirmed(sender, **kwargs):
     badgrlogger.event(badgrlog.EmailConfirmed(**kwargs))
+
+
+def index_email_address(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from badgeuser.models import RecipientIdentifier
+    RecipientIdentifier.objects.sync_email_address(instance)
+
+
+def unindex_email_address(sender, instance, **kwargs):
+    from badgeuser.models import RecipientIdentifier
+    RecipientIdentifier.objects.remove_email_address(instance)
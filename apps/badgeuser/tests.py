@@ -12,7 +12,7 @@ from mainsite import TOP_DIR
 from rest_framework.authtoken.models import Token
 
 from badgeuser.models import BadgeUser
-from badgeuser.models import EmailAddressVariant, CachedEmailAddress
+from badgeuser.models import EmailAddressVariant, CachedEmailAddress, RecipientIdentifier
 from issuer.models import BadgeClass, Issuer
 from mainsite.models import BadgrApp
 from mainsite.tests.base import BadgrTestCase
@@ -635,3 +635,58 @@ class UserProfileTests(BadgrTestCase):
         if user_pk is not None:
             self.assertEqual(self.client.session[SESSION_KEY], user_pk)
 
+
+class RecipientIdentifierTests(BadgrTestCase):
+    def test_index_follows_verified_emails_and_variants(self):
+        user = self.setup_user(email='indexed@example.com', authenticate=False)
+        self.assertEqual(user.all_recipient_identifiers, ['indexed@example.com'])
+
+        unverified = CachedEmailAddress.objects.create(user=user, email='Pending@example.com', verified=False)
+        self.assertFalse(RecipientIdentifier.objects.filter(identifier__iexact='pending@example.com').exists())
+
+        unverified.verified = True
+        unverified.save()
+        self.assertEqual(set(RecipientIdentifier.objects.filter(user=user).values_list('identifier', flat=True)),
+                         {'indexed@example.com', 'pending@example.com'})
+        self.assertTrue(user.has_recipient_identifier('PENDING@example.com'))
+        self.assertIn('Pending@example.com', BadgeUser.cached.get(pk=user.pk).all_recipient_identifiers)
+
+        unverified.emailaddressvariant_set.get(email='pending@example.com').delete()
+        self.assertTrue(user.has_recipient_identifier('pending@example.com'))
+        self.assertNotIn('pending@example.com', BadgeUser.cached.get(pk=user.pk).all_recipient_identifiers)
+
+        unverified.delete()
+        self.assertFalse(user.has_recipient_identifier('Pending@example.com'))
+        self.assertEqual(BadgeUser.cached.get(pk=user.pk).all_recipient_identifiers, ['indexed@example.com'])
+
+    def test_index_is_current_within_identity_map(self):
+        from mainsite import identity_map
+        from recipient.models import RecipientProfile
+
+        self.setup_user(email='profiled@example.com', authenticate=False)
+        with identity_map.unit_of_work():
+            indexed = RecipientIdentifier.cached.get(identifier='profiled@example.com')
+            self.assertIsNone(indexed.cached_recipient_profile)
+
+            profile = RecipientProfile.objects.create(recipient_identifier='Profiled@example.com')
+            indexed = RecipientIdentifier.cached.get(identifier='profiled@example.com')
+            self.assertEqual(indexed.recipient_profile_id, profile.pk)
+
+    def test_recipient_user_and_badgeinstances_use_index(self):
+        user = self.setup_user(email='earner@example.com', authenticate=False)
+        other = self.setup_user(email='other@example.com', authenticate=False)
+        issuer = Issuer.objects.create(name='Issuer of Testing')
+        with open(os.path.join(TOP_DIR, 'apps', 'issuer', 'testfiles', 'guinea_pig_testing_badge.png'), 'r') as fh:
+            badgeclass = BadgeClass.objects.create(
+                issuer=issuer,
+                name="Badge of Testing",
+                image=SimpleUploadedFile(name='test_image.png', content=fh.read(), content_type='image/png')
+            )
+        mine = badgeclass.issue(recipient_id='earner@example.com')
+        badgeclass.issue(recipient_id='other@example.com')
+        nobody = badgeclass.issue(recipient_id='nobody@example.com')
+
+        self.assertEqual(mine.recipient_user, user)
+        self.assertIsNone(nobody.recipient_user)
+        self.assertEqual([a.pk for a in user.get_badgeinstances()], [mine.pk])
+        self.assertNotIn(mine.pk, [a.pk for a in other.cached_badgeinstances()])
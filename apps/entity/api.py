@@ -178,6 +178,9 @@ class UncachedPaginatedViewMixin(object):
     def get_queryset(self, request, **kwargs):
         raise NotImplementedError
 
+    def get_paginator(self, request, **kwargs):
+        return EncryptedCursorPagination()
+
     def get_objects(self, request, **kwargs):
         queryset = self.get_queryset(request=request, **kwargs)
 
@@ -190,7 +193,7 @@ class UncachedPaginatedViewMixin(object):
 
         # only paginate on request
         if per_page:
-            self.paginator = EncryptedCursorPagination()
+            self.paginator = self.get_paginator(request, **kwargs)
             self.paginator.page_size = per_page
             page = self.paginator.paginate_queryset(queryset, request=request)
         else:
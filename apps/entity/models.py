@@ -4,6 +4,8 @@ from __future__ import unicode_literals
 import cachemodel
 from django.db import models
 
+from mainsite import identity_map
+from mainsite.publish import publish_coalesced
 from mainsite.utils import generate_entity_uri
 
 
@@ -25,12 +27,15 @@ class _AbstractVersionedEntity(cachemodel.CacheModel):
         self.entity_version += 1
         return super(_AbstractVersionedEntity, self).save(*args, **kwargs)
 
+    @publish_coalesced
     def publish(self):
         super(_AbstractVersionedEntity, self).publish()
         self.publish_by('entity_id')
+        identity_map.evict(self)
 
     def delete(self, *args, **kwargs):
         self.publish_delete('entity_id')
+        identity_map.evict(self)
         return super(_AbstractVersionedEntity, self).delete(*args, **kwargs)
 
 
@@ -3,31 +3,36 @@ from collections import OrderedDict
 import datetime
 
 import dateutil.parser
+from django.core.urlresolvers import reverse
 from django.db.models import Q
-from django.http import Http404
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from oauth2_provider.models import AccessToken
 from oauthlib.oauth2.rfc6749.tokens import random_token_generator
 from rest_framework import status, serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, \
+    HTTP_202_ACCEPTED
 
 import badgrlog
 from entity.api import BaseEntityListView, BaseEntityDetailView, VersionedObjectMixin, BaseEntityView, \
     UncachedPaginatedViewMixin
 from entity.serializers import BaseSerializerV2, V2ErrorSerializer
-from issuer.models import Issuer, BadgeClass, BadgeInstance, IssuerStaff
+from issuer import assertion_export
+from issuer.models import Issuer, BadgeClass, BadgeInstance, IssuerStaff, BatchJob, BadgeInstanceChange
 from issuer.permissions import (MayIssueBadgeClass, MayEditBadgeClass,
                                 IsEditor, IsStaff, ApprovedIssuersOnly, BadgrOAuthTokenHasScope,
-                                BadgrOAuthTokenHasEntityScope)
+                                BadgrOAuthTokenHasEntityScope, AuditedModelOwner)
 from issuer.serializers_v1 import (IssuerSerializerV1, BadgeClassSerializerV1,
                                    BadgeInstanceSerializerV1)
 from issuer.serializers_v2 import IssuerSerializerV2, BadgeClassSerializerV2, BadgeInstanceSerializerV2, \
-    IssuerAccessTokenSerializerV2
+    IssuerAccessTokenSerializerV2, BatchJobSerializerV2, BadgeInstanceChangeSerializerV2
+from issuer.tasks import process_batch_job
 from apispec_drf.decorators import apispec_get_operation, apispec_put_operation, \
     apispec_delete_operation, apispec_list_operation, apispec_post_operation
-from mainsite.pagination import EncryptedCursorPagination
+from mainsite.pagination import EncryptedCursorPagination, DateOrderedCursorPagination
 from mainsite.permissions import AuthenticatedWithVerifiedEmail
 from mainsite.serializers import CursorPaginatedListSerializer
 
@@ -277,42 +282,93 @@ class BatchAssertionsRevoke(VersionedObjectMixin, BaseEntityView):
         context['badgeclass'] = self.get_object(self.request, **kwargs)
         return context
 
-    def _process_revoke(self, request, revocation):
-        response = {
-            "revoked": False,
-        }
+    def has_issuer_permissions(self, request, issuer):
+        return self.has_object_permissions(request, issuer) and request.user.has_perm('issuer.is_staff', issuer)
 
-        entity_id = revocation.get("entityId", None)
-        revocation_reason = revocation.get("revocationReason", None)
+    @apispec_post_operation('Assertion',
+        summary='Revoke multiple Assertions',
+        tags=['Assertions'],
+        parameters=[
+            {
+                "in": "body",
+                "name": "body",
+                "required": True,
+                'schema': {
+                    "type": "array",
+                    'items': { '$ref': '#/definitions/Assertion' }
+                },
+            }
+        ]
+    )
+    def post(self, request, **kwargs):
+        result = BadgeInstance.objects.bulk_revoke_entity_ids(
+            request.data,
+            has_issuer_permission=lambda issuer: self.has_issuer_permissions(request, issuer)
+        )
 
-        if entity_id is None:
-            return dict(response, reason="entityId is required")
+        response_data = BaseSerializerV2.response_envelope(result=result, success=True, description="revoked badges")
 
-        response["entityId"] = entity_id
+        return Response(status=HTTP_200_OK, data=response_data)
 
-        if revocation_reason is None:
-            return dict(response, reason="revocationReason is required")
 
-        response["revocationReason"] = revocation_reason
+def _batch_job_response(job, context):
+    serializer = BatchJobSerializerV2(job, context=context)
+    headers = {'Location': reverse('v2_api_batchjob_detail', kwargs={'entity_id': job.entity_id})}
+    return Response(serializer.data, status=HTTP_202_ACCEPTED, headers=headers)
 
-        try:
-            assertion = self.get_object(request, entity_id=entity_id)
-        except Http404:
-            return dict(response, reason="permission denied or object not found")
 
-        if not self.has_object_permissions(request, assertion):
-            dict(response, reason="permission denied or object not found")
+class BatchAssertionsIssueJob(BatchAssertionsIssue):
+    """
+    POST a batch of assertions to be issued in the background
+    """
+    v2_serializer_class = BatchJobSerializerV2
 
+    @apispec_post_operation('BatchJob',
+        summary='Issue the same BadgeClass to many recipients in the background',
+        description='Returns a BatchJob immediately, poll the BatchJob for progress and per-row results',
+        tags=['Assertions'],
+        parameters=[
+            {
+                "in": "body",
+                "name": "body",
+                "required": True,
+                'schema': {
+                    "type": "array",
+                    'items': { '$ref': '#/definitions/Assertion' }
+                },
+            }
+        ]
+    )
+    def post(self, request, **kwargs):
+        # verify the user has permission to the badgeclass
+        badgeclass = self.get_object(request, **kwargs)
+        if not self.has_object_permissions(request, badgeclass):
+            return Response(status=HTTP_404_NOT_FOUND)
 
         try:
-            assertion.revoke(revocation_reason)
-        except Exception as e:
-            return dict(response, reason=e.message)
+            assertions = request.data.get('assertions')
+        except AttributeError:
+            return Response(status=HTTP_400_BAD_REQUEST)
+        if not isinstance(assertions, list) or len(assertions) < 1:
+            return Response(status=HTTP_400_BAD_REQUEST)
 
-        return dict(response, revoked=True)
+        job = BatchJob.objects.create_job(BatchJob.JOB_TYPE_ISSUE, assertions,
+                                          created_by=request.user, badgeclass=badgeclass)
+        process_batch_job.delay(job_pk=job.pk)
+        return _batch_job_response(job, self.get_context_data(**kwargs))
 
-    @apispec_post_operation('Assertion',
-        summary='Revoke multiple Assertions',
+
+class BatchAssertionsRevokeJob(BaseEntityView):
+    """
+    POST a batch of assertions to be revoked in the background
+    """
+    permission_classes = (AuthenticatedWithVerifiedEmail, BadgrOAuthTokenHasEntityScope)
+    v2_serializer_class = BatchJobSerializerV2
+    valid_scopes = ["rw:issuer", "rw:issuer:*"]
+
+    @apispec_post_operation('BatchJob',
+        summary='Revoke multiple Assertions in the background',
+        description='Returns a BatchJob immediately, poll the BatchJob for progress and per-row results',
         tags=['Assertions'],
         parameters=[
             {
@@ -327,14 +383,31 @@ class BatchAssertionsRevoke(VersionedObjectMixin, BaseEntityView):
         ]
     )
     def post(self, request, **kwargs):
-        result = [
-            self._process_revoke(request, revocation)
-            for revocation in self.request.data
-        ]
+        if not isinstance(request.data, list) or len(request.data) < 1:
+            return Response(status=HTTP_400_BAD_REQUEST)
 
-        response_data = BaseSerializerV2.response_envelope(result=result, success=True, description="revoked badges")
+        job = BatchJob.objects.create_job(BatchJob.JOB_TYPE_REVOKE, request.data, created_by=request.user)
+        process_batch_job.delay(job_pk=job.pk)
+        return _batch_job_response(job, self.get_context_data(**kwargs))
 
-        return Response(status=HTTP_200_OK, data=response_data)
+
+class BatchJobDetail(VersionedObjectMixin, BaseEntityView):
+    """
+    GET the progress and results of a BatchJob
+    """
+    model = BatchJob
+    permission_classes = (AuthenticatedWithVerifiedEmail, AuditedModelOwner, BadgrOAuthTokenHasScope)
+    v2_serializer_class = BatchJobSerializerV2
+    valid_scopes = ["rw:issuer"]
+
+    @apispec_get_operation('BatchJob',
+        summary='Get the progress and results of a BatchJob',
+        tags=['Assertions'],
+    )
+    def get(self, request, **kwargs):
+        job = self.get_object(request, **kwargs)
+        serializer = BatchJobSerializerV2(job, context=self.get_context_data(**kwargs))
+        return Response(serializer.data)
 
 
 class BadgeInstanceList(UncachedPaginatedViewMixin, VersionedObjectMixin, BaseEntityListView):
@@ -581,7 +654,14 @@ class PaginatedAssertionsSinceSerializer(CursorPaginatedListSerializer):
         self.timestamp = timezone.now()  # take timestamp now before SQL query is run in super.__init__
         super(PaginatedAssertionsSinceSerializer, self).__init__(*args, **kwargs)
 
+    def get_paginator(self):
+        # page through changes in the order they were made
+        paginator = DateOrderedCursorPagination(date_field='updated_at')
+        paginator.bind_query_params = ('since',)
+        return paginator
+
     def to_representation(self, data):
+        data = BadgeInstance.objects.prefetch_cached(data)
         representation = super(PaginatedAssertionsSinceSerializer, self).to_representation(data)
         representation['timestamp'] = self.timestamp.isoformat()
         return representation
@@ -643,3 +723,164 @@ class AssertionsChangedSince(BaseEntityView):
         return Response(serializer.data)
 
         # return super(AssertionsChangedSince, self).get(request, **kwargs)
+
+
+class AssertionChangesFeed(BaseEntityView):
+    """
+    Changes to the assertions of the token user's issuers, and to assertions in a collection of a user who authorized
+    the token's application, read from the assertion change log by sequence number.
+    """
+    permission_classes = (BadgrOAuthTokenHasScope,)
+    valid_scopes = ["r:assertions"]
+    default_per_page = 100
+    max_per_page = 500
+
+    def get_user(self, request):
+        if request.user:
+            return request.user
+        if request.auth:
+            return request.auth.application.user
+
+    def get(self, request, **kwargs):
+        try:
+            after = int(request.query_params.get('cursor', 0))
+        except ValueError:
+            after = None
+        if after is None or after < 0:
+            err = V2ErrorSerializer(data={}, field_errors={'cursor': ["must be a sequence number"]}, validation_errors=[])
+            err._success = False
+            err._description = "bad request"
+            err.is_valid(raise_exception=False)
+            return Response(err.data, status=HTTP_400_BAD_REQUEST)
+
+        try:
+            per_page = min(max(int(request.query_params.get('num', self.default_per_page)), 1), self.max_per_page)
+        except ValueError:
+            per_page = self.default_per_page
+
+        issuer_ids = [i.id for i in self.get_user(request).cached_issuers()]
+        user_ids = list(request.auth.application.accesstoken_set.values_list('user_id', flat=True).distinct())
+        changes, has_next = BadgeInstanceChange.objects.get_feed(issuer_ids, user_ids, after=after, limit=per_page)
+        # load the changed assertions into the unit of work with one multi-get
+        BadgeInstance.objects.prefetch_cached(
+            BadgeInstance.cached.get_many([c.badgeinstance_id for c in changes]).values())
+
+        # clients resume from the last change they saw, even when there was nothing new
+        next_cursor = changes[-1].sequence if changes else after
+        context = self.get_context_data(**kwargs)
+        serializer = BadgeInstanceChangeSerializerV2(changes, many=True, context=context)
+        envelope = BaseSerializerV2.response_envelope(result=serializer.data, success=True, description='ok')
+        envelope['pagination'] = OrderedDict([
+            ('hasNext', has_next),
+            ('nextCursor', next_cursor),
+            ('nextResults', replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)),
+        ])
+        return Response(envelope)
+
+
+class BaseAssertionsExport(VersionedObjectMixin, BaseEntityView):
+    """
+    Stream the assertions of an object as NDJSON or CSV, subclasses set model and implement get_export_queryset()
+    """
+    valid_scopes = ["rw:issuer", "rw:issuer:*"]
+
+    def get_export_queryset(self, obj):
+        raise NotImplementedError
+
+    def get_export_issuer(self, obj):
+        raise NotImplementedError
+
+    def bad_request(self, field_errors):
+        err = V2ErrorSerializer(data={}, field_errors=field_errors, validation_errors=[])
+        err._success = False
+        err._description = "bad request"
+        err.is_valid(raise_exception=False)
+        return Response(err.data, status=HTTP_400_BAD_REQUEST)
+
+    def get(self, request, **kwargs):
+        obj = self.get_object(request, **kwargs)
+
+        field_errors = {}
+        output_format = request.query_params.get('output', assertion_export.FORMAT_NDJSON)
+        if output_format not in assertion_export.FORMATS:
+            field_errors['output'] = ["must be one of: {}".format(', '.join(assertion_export.FORMATS.keys()))]
+        try:
+            columns = assertion_export.parse_columns(request.query_params.get('columns'))
+        except ValueError as e:
+            field_errors['columns'] = [str(e)]
+        dates = {}
+        for param in ('issuedAfter', 'issuedBefore'):
+            value = request.query_params.get(param)
+            try:
+                dates[param] = dateutil.parser.parse(value) if value else None
+            except (ValueError, OverflowError):
+                field_errors[param] = ["must be an ISO 8601 date"]
+        if field_errors:
+            return self.bad_request(field_errors)
+
+        include_revoked = request.query_params.get('includeRevoked', 'true').lower() not in ('false', '0')
+        queryset = assertion_export.filter_assertions(self.get_export_queryset(obj),
+                                                      issued_after=dates['issuedAfter'],
+                                                      issued_before=dates['issuedBefore'],
+                                                      include_revoked=include_revoked)
+        response = StreamingHttpResponse(
+            assertion_export.iter_export(queryset, self.get_export_issuer(obj), columns, output_format),
+            content_type=assertion_export.FORMATS[output_format])
+        response['Content-Disposition'] = 'attachment; filename="assertions-{}.{}"'.format(obj.entity_id, output_format)
+        return response
+
+
+class IssuerAssertionsExport(BaseAssertionsExport):
+    """
+    Stream all assertions within one issuer
+    """
+    model = Issuer  # used by get_object()
+    permission_classes = (AuthenticatedWithVerifiedEmail, IsStaff, BadgrOAuthTokenHasEntityScope)
+
+    def get_export_queryset(self, obj):
+        return BadgeInstance.objects.filter(issuer=obj)
+
+    def get_export_issuer(self, obj):
+        return obj
+
+    @apispec_get_operation('Assertion',
+        summary='Stream all Assertions for a single Issuer as NDJSON or CSV',
+        tags=['Assertions', 'Issuers'],
+        parameters=[
+            {'in': 'query', 'name': "output", 'type': "string", 'description': 'ndjson (default) or csv'},
+            {'in': 'query', 'name': "columns", 'type': "string", 'description': 'Comma separated columns to include'},
+            {'in': 'query', 'name': "issuedAfter", 'type': "string", 'description': 'Only assertions issued on or after this date'},
+            {'in': 'query', 'name': "issuedBefore", 'type': "string", 'description': 'Only assertions issued before this date'},
+            {'in': 'query', 'name': "includeRevoked", 'type': "boolean", 'description': 'Include revoked assertions, default true'},
+        ]
+    )
+    def get(self, request, **kwargs):
+        return super(IssuerAssertionsExport, self).get(request, **kwargs)
+
+
+class BadgeClassAssertionsExport(BaseAssertionsExport):
+    """
+    Stream all assertions of one badgeclass
+    """
+    model = BadgeClass  # used by get_object()
+    permission_classes = (AuthenticatedWithVerifiedEmail, MayIssueBadgeClass, BadgrOAuthTokenHasEntityScope)
+
+    def get_export_queryset(self, obj):
+        return BadgeInstance.objects.filter(badgeclass=obj)
+
+    def get_export_issuer(self, obj):
+        return obj.cached_issuer
+
+    @apispec_get_operation('Assertion',
+        summary='Stream all Assertions for a single BadgeClass as NDJSON or CSV',
+        tags=['Assertions', 'BadgeClasses'],
+        parameters=[
+            {'in': 'query', 'name': "output", 'type': "string", 'description': 'ndjson (default) or csv'},
+            {'in': 'query', 'name': "columns", 'type': "string", 'description': 'Comma separated columns to include'},
+            {'in': 'query', 'name': "issuedAfter", 'type': "string", 'description': 'Only assertions issued on or after this date'},
+            {'in': 'query', 'name': "issuedBefore", 'type': "string", 'description': 'Only assertions issued before this date'},
+            {'in': 'query', 'name': "includeRevoked", 'type': "boolean", 'description': 'Include revoked assertions, default true'},
+        ]
+    )
+    def get(self, request, **kwargs):
+        return super(BadgeClassAssertionsExport, self).get(request, **kwargs)
@@ -0,0 +1,122 @@
+# encoding: utf-8
+"""
+Streaming export of the assertions of an issuer or badgeclass as NDJSON or CSV.
+
+Assertions are read in keyset chunks of BADGR_ASSERTION_EXPORT_CHUNK_SIZE ordered by pk, and each row is written as
+soon as its chunk is read, so memory use does not grow with the number of assertions exported.  Only columns of the
+BadgeInstance row are exported, besides the entity ids of the issuer and badgeclass, which are looked up once.
+"""
+from __future__ import unicode_literals
+
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+
+from mainsite.renderers import StreamingCSVDictRenderer
+from mainsite.utils import OriginSetting
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+FORMATS = OrderedDict([
+    (FORMAT_NDJSON, 'application/x-ndjson'),
+    (FORMAT_CSV, 'text/csv'),
+])
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+COLUMNS = OrderedDict([
+    ('entityId', lambda a, ids: a.entity_id),
+    ('openBadgeId', lambda a, ids: OriginSetting.HTTP + a.get_absolute_url()),
+    ('issuer', lambda a, ids: ids['issuer'][a.issuer_id]),
+    ('badgeclass', lambda a, ids: ids['badgeclass'][a.badgeclass_id]),
+    ('recipientIdentifier', lambda a, ids: a.recipient_identifier),
+    ('recipientType', lambda a, ids: a.recipient_type),
+    ('issuedOn', lambda a, ids: _isoformat(a.issued_on)),
+    ('createdAt', lambda a, ids: _isoformat(a.created_at)),
+    ('updatedAt', lambda a, ids: _isoformat(a.updated_at)),
+    ('expires', lambda a, ids: _isoformat(a.expires_at)),
+    ('acceptance', lambda a, ids: a.acceptance),
+    ('revoked', lambda a, ids: a.revoked),
+    ('revocationReason', lambda a, ids: a.revocation_reason),
+    ('narrative', lambda a, ids: a.narrative),
+])
+
+
+def get_chunk_size():
+    return getattr(settings, 'BADGR_ASSERTION_EXPORT_CHUNK_SIZE', 1000)
+
+
+def parse_columns(value):
+    """
+    Parse a comma separated list of column names, None selects all columns.  Raises ValueError for unknown columns.
+    """
+    if not value:
+        return list(COLUMNS.keys())
+    columns = [c.strip() for c in value.split(',') if c.strip()]
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown or not columns:
+        raise ValueError("Unknown columns: {}".format(', '.join(unknown)))
+    return columns
+
+
+def filter_assertions(queryset, issued_after=None, issued_before=None, include_revoked=True):
+    if issued_after is not None:
+        queryset = queryset.filter(issued_on__gte=issued_after)
+    if issued_before is not None:
+        queryset = queryset.filter(issued_on__lt=issued_before)
+    if not include_revoked:
+        queryset = queryset.filter(revoked=False)
+    return queryset
+
+
+def iter_assertions(queryset, chunk_size=None):
+    """
+    Yield the assertions of queryset in pk order, one keyset query per chunk
+    """
+    if chunk_size is None:
+        chunk_size = get_chunk_size()
+    queryset = queryset.select_related(None).prefetch_related(None).order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        for assertion in chunk:
+            yield assertion
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def iter_rows(queryset, issuer, columns, chunk_size=None):
+    """
+    Yield an OrderedDict of the selected columns for each assertion of queryset, which must belong to issuer
+    """
+    ids = {
+        'issuer': {issuer.pk: issuer.entity_id},
+        'badgeclass': dict(issuer.badgeclasses.values_list('pk', 'entity_id')),
+    }
+    getters = [(column, COLUMNS[column]) for column in columns]
+    for assertion in iter_assertions(queryset, chunk_size=chunk_size):
+        yield OrderedDict((column, getter(assertion, ids)) for column, getter in getters)
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def iter_csv(rows, columns):
+    return StreamingCSVDictRenderer().iter_text(columns, rows)
+
+
+def iter_export(queryset, issuer, columns, output_format, chunk_size=None):
+    """
+    Yield the export of the assertions of queryset as text chunks of output_format, one of FORMATS
+    """
+    rows = iter_rows(queryset, issuer, columns, chunk_size=chunk_size)
+    if output_format == FORMAT_CSV:
+        return iter_csv(rows, columns)
+    return iter_ndjson(rows)
@@ -0,0 +1,198 @@
+# encoding: utf-8
+"""
+Bake assertions into badgeclass images without decoding them.
+
+The output is byte-for-byte what openbadges_bakery.bake() produces, but each badgeclass image is only read and parsed
+once into a BakingTemplate: the bytes before and after the point where the assertion goes. Baking an assertion then
+just writes those cached bytes around a freshly built openbadges chunk (PNG) or element (SVG).
+"""
+from __future__ import unicode_literals
+
+import StringIO
+import hashlib
+import struct
+import uuid
+import zlib
+from xml.dom.minidom import parseString, Document
+
+import png
+from django.conf import settings
+from json import loads as json_loads
+
+from mainsite.utils import LRUCache
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_ASSERTION_CHUNK_HEADER = b'openbadges\x00\x00\x00\x00\x00'
+
+
+def get_image_type(data):
+    """
+    Same detection as openbadges_bakery.check_image_type(), on the image contents
+    """
+    if data[:8] == PNG_SIGNATURE:
+        return 'PNG'
+    if b'<svg' in data[:256]:
+        return 'SVG'
+
+
+class BakingTemplate(object):
+    content_type = None
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+
+    def assertion_bytes(self, assertion_json_string):
+        raise NotImplementedError
+
+    def bake(self, assertion_json_string, output_file):
+        output_file.write(self.head)
+        output_file.write(self.assertion_bytes(assertion_json_string))
+        output_file.write(self.tail)
+        output_file.seek(0)
+        return output_file
+
+
+class PngBakingTemplate(BakingTemplate):
+    """
+    The signature and IHDR chunk go before the openbadges iTXt chunk, every other chunk except a previously baked
+    assertion goes after it.
+    """
+    content_type = 'image/png'
+
+    @classmethod
+    def from_bytes(cls, data):
+        chunks = []
+        offset = len(PNG_SIGNATURE)
+        while True:
+            if offset + 8 > len(data):
+                raise png.ChunkError('End of file whilst reading chunk length and type.')
+            length, chunk_type = struct.unpack(b'!I4s', data[offset:offset + 8])
+            data_start = offset + 8
+            data_end = data_start + length
+            if data_end + 4 > len(data):
+                raise png.ChunkError('Chunk {} too short for required {} octets.'.format(chunk_type, length))
+
+            checksum = zlib.crc32(data[data_start:data_end], zlib.crc32(chunk_type)) & 0xffffffff
+            if struct.pack(b'!I', checksum) != data[data_end:data_end + 4]:
+                raise png.ChunkError('Checksum error in {} chunk.'.format(chunk_type))
+
+            chunks.append((offset, data_end + 4, data[data_start:data_start + len(b'openbadges\x00')]))
+            offset = data_end + 4
+            if chunk_type == b'IEND':
+                break
+
+        first_start, first_end, first_prefix = chunks[0]
+        head = data[:first_end]
+        tail = b''.join(data[start:end] for start, end, prefix in chunks[1:] if prefix != b'openbadges\x00')
+        return cls(head, tail)
+
+    def assertion_bytes(self, assertion_json_string):
+        if isinstance(assertion_json_string, unicode):
+            assertion_json_string = assertion_json_string.encode('utf-8')
+        chunk_data = PNG_ASSERTION_CHUNK_HEADER + assertion_json_string
+        checksum = zlib.crc32(chunk_data, zlib.crc32(b'iTXt')) & 0xffffffff
+        return b''.join([struct.pack(b'!I', len(chunk_data)), b'iTXt', chunk_data, struct.pack(b'!I', checksum)])
+
+
+class SvgBakingTemplate(BakingTemplate):
+    """
+    The document is serialized once with the openbadges namespace declared and a placeholder where the
+    openbadges:assertion element goes.
+    """
+    content_type = 'image/svg+xml'
+
+    @classmethod
+    def from_bytes(cls, data):
+        svg_doc = parseString(data)
+        svg_body = svg_doc.getElementsByTagName('svg')[0]
+        svg_body.setAttribute('xmlns:openbadges', "http://openbadges.org")
+
+        placeholder = uuid.uuid4().hex
+        svg_body.insertBefore(svg_doc.createComment(placeholder), svg_body.firstChild)
+        head, tail = svg_doc.toxml('utf-8').split('<!--{}-->'.format(placeholder).encode('utf-8'))
+        return cls(head, tail)
+
+    def assertion_bytes(self, assertion_json_string):
+        doc = Document()
+        assertion_node = doc.createElement('openbadges:assertion')
+        try:
+            assertion = json_loads(assertion_json_string)
+        except ValueError:
+            assertion = None
+
+        if assertion:
+            verify_url = assertion.get('verify', {}).get('url')
+            if verify_url:
+                assertion_node.setAttribute('verify', verify_url)
+            assertion_node.appendChild(doc.createCDATASection(assertion_json_string))
+        else:
+            assertion_node.setAttribute('verify', assertion_json_string)
+
+        return assertion_node.toxml('utf-8')
+
+
+template_cache = LRUCache(max_size=getattr(settings, 'BADGR_BAKING_TEMPLATE_CACHE_SIZE', 128))
+baked_image_cache = LRUCache(max_size=getattr(settings, 'BADGR_VIRTUAL_BAKED_IMAGE_CACHE_BYTES', 64 * 1024 * 1024),
+                             size_of=lambda baked_image: len(baked_image.content))
+
+
+def get_baking_template(image_file, cache_key=None):
+    """
+    Return the BakingTemplate for image_file, or None if it is not a PNG or SVG.
+    image_file is only read if there is no template cached for cache_key.
+    """
+    if cache_key is not None:
+        template = template_cache.get(cache_key)
+        if template is not None:
+            return template
+
+    image_file.seek(0)
+    data = image_file.read()
+    image_type = get_image_type(data)
+    if image_type == 'PNG':
+        template = PngBakingTemplate.from_bytes(data)
+    elif image_type == 'SVG':
+        template = SvgBakingTemplate.from_bytes(data)
+    else:
+        return None
+
+    if cache_key is not None:
+        template_cache.set(cache_key, template)
+    return template
+
+
+def bake(image_file, assertion_json_string, output_file, cache_key=None):
+    """
+    Drop-in replacement for openbadges_bakery.bake() that reuses the parsed image for the same cache_key
+    """
+    template = get_baking_template(image_file, cache_key=cache_key)
+    if template is not None:
+        return template.bake(assertion_json_string, output_file)
+
+
+class BakedImage(object):
+    def __init__(self, content, content_type, etag):
+        self.content = content
+        self.content_type = content_type
+        self.etag = etag
+
+
+def get_virtual_baked_image(image_file, assertion_json_string, cache_key):
+    """
+    Return a BakedImage of assertion_json_string baked into image_file, without storing it anywhere but in memory.
+    The etag is a digest of the inputs, which determine the output, so it is computed without baking.
+    """
+    if isinstance(assertion_json_string, unicode):
+        assertion_json_string = assertion_json_string.encode('utf-8')
+    etag = hashlib.sha1(repr(cache_key).encode('utf-8') + b'\x00' + assertion_json_string).hexdigest()
+
+    baked_image = baked_image_cache.get(etag)
+    if baked_image is None:
+        template = get_baking_template(image_file, cache_key=cache_key)
+        if template is None:
+            return None
+        output = template.bake(assertion_json_string, StringIO.StringIO())
+        baked_image = BakedImage(output.getvalue(), template.content_type, etag)
+        baked_image_cache.set(etag, baked_image)
+    return baked_image
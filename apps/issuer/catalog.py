@@ -0,0 +1,252 @@
+# encoding: utf-8
+"""
+Precomputed, paginated catalog of the badgeclasses an issuer publishes, served by the public IssuerBadgesJson view.
+
+The catalog of an issuer is kept in the cache per obi_version as an index of badgeclass pks split into segments of
+up to BADGR_ISSUER_CATALOG_PAGE_SIZE, and one cache entry per segment holding the json of its badgeclasses.  Each
+segment is served as one page, so following a cursor costs a single get_many of the index and the segment.
+Saving or deleting a badgeclass rewrites only the segment it belongs to; the catalog is rebuilt from the database
+only when its index has been evicted.
+"""
+from __future__ import unicode_literals
+
+import time
+import uuid
+
+from cachemodel import CACHE_FOREVER_TIMEOUT
+from django.conf import settings
+from django.core.cache import cache
+
+from issuer import utils
+
+
+def get_page_size():
+    return getattr(settings, 'BADGR_ISSUER_CATALOG_PAGE_SIZE', 100)
+
+
+class CatalogPage(object):
+    """
+    One segment of an issuer catalog. generation is None when the page was served straight from the database.
+    """
+    def __init__(self, generation, index, count, badges, version, last_pk=None):
+        self.generation = generation
+        self.index = index
+        self.count = count
+        self.badges = badges
+        self.version = version
+        self.last_pk = last_pk
+
+    @property
+    def has_next(self):
+        return self.index + 1 < self.count
+
+    @property
+    def has_previous(self):
+        return self.index > 0
+
+
+class IssuerCatalog(object):
+    def __init__(self, issuer_pk, obi_version=utils.CURRENT_OBI_VERSION):
+        self.issuer_pk = issuer_pk
+        self.obi_version = obi_version
+
+    @classmethod
+    def for_all_versions(cls, issuer_pk):
+        return [cls(issuer_pk, obi_version) for obi_version in utils.OBI_VERSION_CONTEXT_IRIS.keys()]
+
+    @property
+    def index_key(self):
+        return 'issuer_catalog_{}_{}'.format(self.issuer_pk, self.obi_version)
+
+    @property
+    def lock_key(self):
+        return '_lock_issuer_catalog_{}_{}'.format(self.issuer_pk, self.obi_version)
+
+    def segment_key(self, generation, index):
+        return 'issuer_catalog_{}_{}_{}_{}'.format(self.issuer_pk, self.obi_version, generation, index)
+
+    def _acquire_lock(self):
+        lock_timeout = getattr(settings, 'BADGR_ISSUER_CATALOG_LOCK_TIMEOUT', 10)
+        give_up_at = time.time() + lock_timeout
+        while not cache.add(self.lock_key, True, lock_timeout):
+            if time.time() > give_up_at:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _release_lock(self):
+        cache.delete(self.lock_key)
+
+    def _get_badgeclasses(self, after_pk=None):
+        from issuer.models import Issuer
+
+        issuer = Issuer.cached.get(pk=self.issuer_pk)
+        badgeclasses = sorted(issuer.cached_badgeclasses(), key=lambda b: b.pk)
+        if after_pk is not None:
+            badgeclasses = [b for b in badgeclasses if b.pk > after_pk]
+        return badgeclasses
+
+    def _load_badgeclasses(self, pks):
+        from issuer.models import BadgeClass
+
+        badgeclasses = {b.pk: b for b in BadgeClass.objects.filter(pk__in=pks)}
+        return [badgeclasses[pk] for pk in pks if pk in badgeclasses]
+
+    def _render(self, badgeclasses):
+        return [b.get_json(obi_version=self.obi_version) for b in badgeclasses]
+
+    def _set_segment(self, generation, index, pks, badges):
+        segment = {
+            'version': uuid.uuid4().hex,
+            'last_pk': pks[-1] if pks else None,
+            'badges': badges,
+        }
+        cache.set(self.segment_key(generation, index), segment, CACHE_FOREVER_TIMEOUT)
+        return segment
+
+    def build(self):
+        """
+        Render every segment of the catalog from the database and store a new generation of the index
+        """
+        badgeclasses = self._get_badgeclasses()
+        page_size = get_page_size()
+        generation = uuid.uuid4().hex
+        segments = [badgeclasses[start:start + page_size] for start in range(0, len(badgeclasses), page_size)] or [[]]
+        for index, chunk in enumerate(segments):
+            self._set_segment(generation, index, [b.pk for b in chunk], self._render(chunk))
+        catalog_index = {
+            'generation': generation,
+            'segments': [[b.pk for b in chunk] for chunk in segments],
+        }
+        cache.set(self.index_key, catalog_index, CACHE_FOREVER_TIMEOUT)
+        return catalog_index
+
+    def get_index(self):
+        """
+        Return the cached index, building the catalog if needed.  Returns None if another process holds the lock.
+        """
+        catalog_index = cache.get(self.index_key)
+        if catalog_index is not None:
+            return catalog_index
+
+        if not self._acquire_lock():
+            return None
+        try:
+            catalog_index = cache.get(self.index_key)
+            if catalog_index is None:
+                catalog_index = self.build()
+            return catalog_index
+        finally:
+            self._release_lock()
+
+    def get_page(self, generation=None, index=0, after_pk=None):
+        """
+        Return the CatalogPage at index.  A cursor into the current generation is served by a single get_many of
+        the index and the segment, a cursor into an older generation resumes after after_pk.
+        """
+        keys = [self.index_key]
+        if generation is not None:
+            keys.append(self.segment_key(generation, index))
+        found = cache.get_many(keys)
+
+        catalog_index = found.get(self.index_key) or self.get_index()
+        if catalog_index is None:
+            # another process is holding the catalog, serve this page straight from the database
+            badgeclasses = self._get_badgeclasses(after_pk=after_pk)
+            page, rest = badgeclasses[:get_page_size()], badgeclasses[get_page_size():]
+            return CatalogPage(None, index, index + (2 if rest else 1), self._render(page), uuid.uuid4().hex,
+                               last_pk=page[-1].pk if page else after_pk)
+
+        current = catalog_index['generation']
+        segments = catalog_index['segments']
+        if after_pk is not None and generation != current:
+            # the catalog was rebuilt since the cursor was issued, resume at the first segment holding later pks
+            index = next((i for i, pks in enumerate(segments) if pks and pks[-1] > after_pk), len(segments))
+            if index < len(segments):
+                pks = [pk for pk in segments[index] if pk > after_pk]
+                badges = self._render(self._load_badgeclasses(pks))
+                return CatalogPage(current, index, len(segments), badges, uuid.uuid4().hex, last_pk=pks[-1])
+
+        if index >= len(segments):
+            return CatalogPage(current, index, len(segments), [], '', last_pk=after_pk)
+
+        segment = found.get(self.segment_key(current, index))
+        if segment is None:
+            segment = cache.get(self.segment_key(current, index))
+        if segment is None:
+            pks = segments[index]
+            segment = self._set_segment(current, index, pks, self._render(self._load_badgeclasses(pks)))
+        return CatalogPage(current, index, len(segments), segment['badges'], segment['version'],
+                           last_pk=segment['last_pk'])
+
+    def update_badgeclass(self, badgeclass_pk, badgeclass=None):
+        """
+        Rewrite the one segment holding badgeclass_pk, appending it to the last segment if it is new.
+        Passing no badgeclass removes badgeclass_pk from the catalog.
+        """
+        deleted = badgeclass is None
+        if not self._acquire_lock():
+            # drop the catalog rather than leave it stale, the next read rebuilds it
+            cache.delete(self.index_key)
+            return
+        try:
+            catalog_index = cache.get(self.index_key)
+            if catalog_index is None:
+                return
+            generation = catalog_index['generation']
+            segments = catalog_index['segments']
+
+            index = next((i for i, pks in enumerate(segments) if badgeclass_pk in pks), None)
+            if index is None:
+                if deleted:
+                    return
+                last = segments[-1]
+                if last and badgeclass_pk < last[-1]:
+                    # only a rebuild can place a badgeclass out of pk order
+                    cache.delete(self.index_key)
+                    return
+                if len(last) >= get_page_size():
+                    segments.append([])
+                index = len(segments) - 1
+            old_pks = list(segments[index])
+            if deleted:
+                segments[index].remove(badgeclass_pk)
+            elif badgeclass_pk not in segments[index]:
+                segments[index].append(badgeclass_pk)
+            pks = segments[index]
+
+            segment = cache.get(self.segment_key(generation, index))
+            if segment is None or len(segment['badges']) != len(old_pks):
+                badges = self._render(self._load_badgeclasses(pks))
+            else:
+                badges = list(segment['badges'])
+                if badgeclass_pk in old_pks:
+                    badges.pop(old_pks.index(badgeclass_pk))
+                if not deleted:
+                    badges.insert(pks.index(badgeclass_pk), badgeclass.get_json(obi_version=self.obi_version))
+            self._set_segment(generation, index, pks, badges)
+            cache.set(self.index_key, catalog_index, CACHE_FOREVER_TIMEOUT)
+        finally:
+            self._release_lock()
+
+
+def _cached_catalogs(issuer_pk):
+    catalogs = IssuerCatalog.for_all_versions(issuer_pk)
+    cached_indexes = cache.get_many([c.index_key for c in catalogs])
+    return [c for c in catalogs if c.index_key in cached_indexes]
+
+
+def update_badgeclass(badgeclass):
+    """
+    Apply a saved badgeclass to each cached catalog of its issuer
+    """
+    for catalog in _cached_catalogs(badgeclass.issuer_id):
+        catalog.update_badgeclass(badgeclass.pk, badgeclass)
+
+
+def remove_badgeclass(issuer_pk, badgeclass_pk):
+    """
+    Remove a deleted badgeclass from each cached catalog of its issuer
+    """
+    for catalog in _cached_catalogs(issuer_pk):
+        catalog.update_badgeclass(badgeclass_pk)
@@ -0,0 +1,141 @@
+# encoding: utf-8
+"""
+Resized PNG and WebP renditions of uploaded issuer, badgeclass and assertion images.
+
+Renditions are generated in the background once per stored image, when it is uploaded or the first time one is
+requested, and recorded in the ImageDerivative manifest so serving one is a cache lookup instead of a conversion.
+"""
+from __future__ import unicode_literals
+
+import StringIO
+import os
+import time
+
+import cairosvg
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+# the size of the png served before sizes could be requested
+DEFAULT_SIZE = 400
+
+# seconds a scheduled generation suppresses scheduling another for the same image
+PENDING_DERIVATIVES_TIMEOUT = 60
+
+
+def get_sizes():
+    return getattr(settings, 'BADGR_IMAGE_DERIVATIVE_SIZES', (64, 128, DEFAULT_SIZE))
+
+
+def format_supported(image_format):
+    Image.init()
+    return image_format.upper() in Image.SAVE
+
+
+def get_formats():
+    """
+    The configured formats this installation of PIL can write
+    """
+    return [f for f in getattr(settings, 'BADGR_IMAGE_DERIVATIVE_FORMATS', ('png', 'webp')) if format_supported(f)]
+
+
+def get_derivative_name(source_name, image_format, size):
+    dirname, filename = os.path.split(source_name)
+    basename, ext = os.path.splitext(filename)
+    return '{dirname}/converted{version}/{basename}-{size}.{ext}'.format(
+        dirname=dirname,
+        version=getattr(settings, 'CAIROSVG_VERSION_SUFFIX', '1'),
+        basename=basename,
+        size=size,
+        ext=image_format)
+
+
+def open_source_image(source_name):
+    with default_storage.open(source_name, 'rb') as source_file:
+        if os.path.splitext(source_name)[1].lower() == '.svg':
+            png_buf = StringIO.StringIO()
+            cairosvg.svg2png(file_obj=source_file, write_to=png_buf)
+            png_buf.seek(0)
+            return Image.open(png_buf)
+        image = Image.open(source_file)
+        image.load()
+        return image
+
+
+def render(image, image_format, size):
+    derivative = image.copy()
+    derivative.thumbnail((size, size))
+    if derivative.mode not in ('RGB', 'RGBA'):
+        derivative = derivative.convert('RGBA')
+    out_buf = StringIO.StringIO()
+    derivative.save(out_buf, format=image_format.upper())
+    out_buf.seek(0)
+    return out_buf
+
+
+def generate_derivatives(source_name):
+    """
+    Generate every configured rendition of source_name missing from the manifest.
+    A cache lock makes this single-flight, concurrent callers wait for the generating one to finish.
+    """
+    from issuer.models import ImageDerivative
+
+    lock_key = '_lock_image_derivatives_{}'.format(source_name)
+    lock_timeout = getattr(settings, 'BADGR_IMAGE_DERIVATIVE_LOCK_TIMEOUT', 60)
+    give_up_at = time.time() + lock_timeout
+    while not cache.add(lock_key, True, lock_timeout):
+        if time.time() > give_up_at:
+            return
+        time.sleep(0.1)
+
+    try:
+        existing = set(ImageDerivative.objects.filter(source_name=source_name).values_list('format', 'size'))
+        missing = [(f, s) for f in get_formats() for s in get_sizes() if (f, s) not in existing]
+        if not missing:
+            return
+
+        image = open_source_image(source_name)
+        for image_format, size in missing:
+            name = get_derivative_name(source_name, image_format, size)
+            default_storage.delete(name)
+            name = default_storage.save(name, render(image, image_format, size))
+            try:
+                with transaction.atomic():
+                    ImageDerivative.objects.create(source_name=source_name, format=image_format, size=size, name=name)
+            except IntegrityError:
+                pass
+    finally:
+        cache.delete(lock_key)
+
+
+def get_derivative(source_name, image_format, size):
+    """
+    Return the ImageDerivative of source_name from the manifest, or None after scheduling the renditions of
+    source_name to be generated in the background
+    """
+    from issuer.models import ImageDerivative
+
+    try:
+        return ImageDerivative.cached.get(source_name=source_name, format=image_format, size=size)
+    except ImageDerivative.DoesNotExist:
+        schedule_derivatives(source_name)
+        return None
+
+
+def get_pending_derivatives_key(source_name):
+    return '_pending_image_derivatives_{}'.format(source_name)
+
+
+def schedule_derivatives(source_name):
+    """
+    Generate the renditions of source_name in a celery task after the current transaction commits.  Requests for
+    renditions of the same image before the task runs are coalesced into one task.
+    """
+    from issuer.tasks import generate_image_derivatives
+
+    def enqueue():
+        if cache.add(get_pending_derivatives_key(source_name), True, PENDING_DERIVATIVES_TIMEOUT):
+            generate_image_derivatives.delay(source_name=source_name)
+    transaction.on_commit(enqueue)
@@ -0,0 +1,121 @@
+# encoding: utf-8
+"""
+Write the public json of Issuers, BadgeClasses and BadgeInstances to default_storage, one file per OBI version,
+so it can be served without the app, see settings.BADGR_STATIC_JSON_EXPORT.
+"""
+from __future__ import unicode_literals
+
+import json
+
+from cachemodel import CACHE_FOREVER_TIMEOUT
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from issuer.utils import OBI_VERSION_CONTEXT_IRIS
+
+EXPORT_DIRECTORIES = {
+    'Issuer': 'issuers',
+    'BadgeClass': 'badges',
+    'BadgeInstance': 'assertions',
+}
+
+
+# seconds a queued export suppresses queueing another export of the same object
+PENDING_EXPORT_TIMEOUT = 60
+
+
+def export_enabled():
+    return getattr(settings, 'BADGR_STATIC_JSON_EXPORT', False)
+
+
+def get_export_name(model_name, entity_id, obi_version):
+    return '{prefix}/{obi_version}/{directory}/{entity_id}.json'.format(
+        prefix=getattr(settings, 'BADGR_STATIC_JSON_EXPORT_PREFIX', 'public-json'),
+        obi_version=obi_version,
+        directory=EXPORT_DIRECTORIES[model_name],
+        entity_id=entity_id)
+
+
+def get_pending_export_key(model_name, pk):
+    return '_pending_json_export_{}_{}'.format(model_name, pk)
+
+
+def get_exported_version_key(model_name, entity_id):
+    return '_exported_json_version_{}_{}'.format(model_name, entity_id)
+
+
+def get_export_names(obj):
+    return [get_export_name(obj.__class__.__name__, obj.entity_id, v) for v in OBI_VERSION_CONTEXT_IRIS.keys()]
+
+
+def is_exportable(obj):
+    return obj.pk is not None and not getattr(obj, 'revoked', False)
+
+
+def _write(name, content):
+    if default_storage.exists(name):
+        # overwrite in place, save() would pick a new name and deleting first leaves the file missing meanwhile
+        with default_storage.open(name, 'wb') as exported:
+            exported.write(content)
+    else:
+        default_storage.save(name, ContentFile(content))
+
+
+def export_json(obj):
+    """
+    Write the public json of obj for each OBI version, or remove it if obj is revoked.  The json version that was
+    written is recorded last, so is_exported() only holds once every file is up to date.
+    """
+    model_name = obj.__class__.__name__
+    if not is_exportable(obj):
+        return remove_json(model_name, obj.entity_id)
+
+    json_version = obj.get_json_version()
+    for obi_version in OBI_VERSION_CONTEXT_IRIS.keys():
+        name = get_export_name(model_name, obj.entity_id, obi_version)
+        _write(name, json.dumps(obj.get_json(obi_version=obi_version)).encode('utf-8'))
+    cache.set(get_exported_version_key(model_name, obj.entity_id), json_version, CACHE_FOREVER_TIMEOUT)
+
+
+def is_exported(obj):
+    """
+    True if the exported json of obj is the current version of its json
+    """
+    exported_version = cache.get(get_exported_version_key(obj.__class__.__name__, obj.entity_id))
+    return exported_version is not None and exported_version == obj.get_json_version()
+
+
+def remove_json(model_name, entity_id):
+    cache.delete(get_exported_version_key(model_name, entity_id))
+    for obi_version in OBI_VERSION_CONTEXT_IRIS.keys():
+        default_storage.delete(get_export_name(model_name, entity_id, obi_version))
+
+
+def schedule_export(obj):
+    """
+    Export obj in a celery task after the current transaction commits. Repeated publishes of the same object
+    before the task runs are coalesced into one export.
+    """
+    from issuer.tasks import export_public_json
+
+    model_name, pk = obj.__class__.__name__, obj.pk
+
+    def enqueue():
+        if cache.add(get_pending_export_key(model_name, pk), True, PENDING_EXPORT_TIMEOUT):
+            export_public_json.delay(model_name=model_name, pk=pk)
+    transaction.on_commit(enqueue)
+
+
+def schedule_removal(obj):
+    from issuer.tasks import delete_stored_files
+
+    names = get_export_names(obj)
+    cache.delete(get_exported_version_key(obj.__class__.__name__, obj.entity_id))
+    transaction.on_commit(lambda: delete_stored_files.delay(names=names))
+
+
+def get_export_url(obj, obi_version):
+    return default_storage.url(get_export_name(obj.__class__.__name__, obj.entity_id, obi_version))
@@ -0,0 +1,50 @@
+# encoding: utf-8
+from __future__ import unicode_literals
+
+import dateutil.parser
+from django.core.management import BaseCommand, CommandError
+
+from issuer import assertion_export
+from issuer.models import Issuer, BadgeClass, BadgeInstance
+
+
+class Command(BaseCommand):
+    help = "Stream the assertions of an Issuer or BadgeClass to stdout as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--issuer', help="entity_id of the issuer to export")
+        group.add_argument('--badgeclass', help="entity_id of the badgeclass to export")
+        parser.add_argument('--output', choices=list(assertion_export.FORMATS.keys()),
+                            default=assertion_export.FORMAT_NDJSON)
+        parser.add_argument('--columns', help="comma separated columns, one of: {}".format(
+            ', '.join(assertion_export.COLUMNS.keys())))
+        parser.add_argument('--issued-after', type=dateutil.parser.parse)
+        parser.add_argument('--issued-before', type=dateutil.parser.parse)
+        parser.add_argument('--exclude-revoked', action='store_true', default=False)
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            columns = assertion_export.parse_columns(options['columns'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        try:
+            if options['issuer']:
+                issuer = Issuer.objects.get(entity_id=options['issuer'])
+                queryset = BadgeInstance.objects.filter(issuer=issuer)
+            else:
+                badgeclass = BadgeClass.objects.get(entity_id=options['badgeclass'])
+                issuer = badgeclass.cached_issuer
+                queryset = BadgeInstance.objects.filter(badgeclass=badgeclass)
+        except (Issuer.DoesNotExist, BadgeClass.DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        queryset = assertion_export.filter_assertions(queryset,
+                                                      issued_after=options['issued_after'],
+                                                      issued_before=options['issued_before'],
+                                                      include_revoked=not options['exclude_revoked'])
+        for chunk in assertion_export.iter_export(queryset, issuer, columns, options['output'],
+                                                  chunk_size=options['chunk_size']):
+            self.stdout.write(chunk, ending='')
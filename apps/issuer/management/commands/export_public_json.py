@@ -0,0 +1,47 @@
+# encoding: utf-8
+from __future__ import unicode_literals
+
+from django.core.management import BaseCommand
+
+from issuer import json_export
+from issuer.models import Issuer, BadgeClass, BadgeInstance
+
+
+class Command(BaseCommand):
+    help = "Write the public json of every Issuer, BadgeClass and unrevoked BadgeInstance to storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['Issuer', 'BadgeClass', 'BadgeInstance'], action='append',
+                            help="only export this model, may be repeated")
+        parser.add_argument('--after-pk', type=int, default=0, help="resume an export after this primary key")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        querysets = [
+            Issuer.objects.all(),
+            BadgeClass.objects.all(),
+            BadgeInstance.objects.filter(revoked=False),
+        ]
+        for queryset in querysets:
+            if options['model'] and queryset.model.__name__ not in options['model']:
+                continue
+            self.export(queryset, options['after_pk'], options['chunk_size'])
+
+    def export(self, queryset, after_pk, chunk_size):
+        model_name = queryset.model.__name__
+        exported = 0
+        failed = 0
+        last_pk = after_pk
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+            if not chunk:
+                break
+            for obj in chunk:
+                try:
+                    json_export.export_json(obj)
+                    exported += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write("Failed to export {}(pk={}): {}".format(model_name, obj.pk, e))
+            last_pk = chunk[-1].pk
+            self.stdout.write("Exported {} {} json, {} failed, last pk={}".format(exported, model_name, failed, last_pk))
@@ -0,0 +1,66 @@
+# encoding: utf-8
+from __future__ import unicode_literals
+
+import json
+
+import dateutil.parser
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from issuer.models import RebakeJob, Issuer, BadgeClass
+from issuer.tasks import dispatch_rebake_job
+from issuer.utils import CURRENT_OBI_VERSION
+
+
+class Command(BaseCommand):
+    help = "Rebake the images of hosted assertions in chunks processed by celery workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--obi-version', default=CURRENT_OBI_VERSION)
+        parser.add_argument('--issuer', help="entity_id of an issuer to limit the rebake to")
+        parser.add_argument('--badgeclass', help="entity_id of a badgeclass to limit the rebake to")
+        parser.add_argument('--issued-after', help="only rebake assertions issued on or after this date")
+        parser.add_argument('--issued-before', help="only rebake assertions issued before this date")
+        parser.add_argument('--max-count', type=int)
+        parser.add_argument('--chunk-size', type=int, default=getattr(settings, 'REBAKE_JOB_CHUNK_SIZE', 500))
+        parser.add_argument('--resume', type=int, metavar='JOB', help="continue an interrupted rebake job")
+        parser.add_argument('--status', type=int, metavar='JOB', help="report the progress of a rebake job")
+
+    def handle(self, *args, **options):
+        job_pk = options['status'] or options['resume']
+        if job_pk:
+            try:
+                job = RebakeJob.objects.get(pk=job_pk)
+            except RebakeJob.DoesNotExist:
+                raise CommandError("Unknown rebake job {}".format(job_pk))
+            if options['resume']:
+                dispatch_rebake_job.delay(job_pk=job.pk)
+                self.stdout.write("Resuming rebake job {} after pk={}".format(job.pk, job.last_dispatched_pk))
+        else:
+            job = RebakeJob(
+                obi_version=options['obi_version'],
+                max_count=options['max_count'],
+                chunk_size=options['chunk_size'],
+                issued_after=self._parse_date(options['issued_after']),
+                issued_before=self._parse_date(options['issued_before']),
+            )
+            try:
+                if options['issuer']:
+                    job.issuer = Issuer.objects.get(entity_id=options['issuer'])
+                if options['badgeclass']:
+                    job.badgeclass = BadgeClass.objects.get(entity_id=options['badgeclass'])
+            except (Issuer.DoesNotExist, BadgeClass.DoesNotExist) as e:
+                raise CommandError(e.message)
+            job.save()
+            dispatch_rebake_job.delay(job_pk=job.pk)
+            self.stdout.write("Started rebake job {}".format(job.pk))
+
+        job.refresh_from_db()
+        self.stdout.write(json.dumps(job.get_report(), indent=2))
+
+    def _parse_date(self, value):
+        if value:
+            try:
+                return dateutil.parser.parse(value)
+            except ValueError:
+                raise CommandError("Invalid date '{}'".format(value))
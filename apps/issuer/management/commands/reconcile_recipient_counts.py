@@ -0,0 +1,36 @@
+# encoding: utf-8
+from __future__ import unicode_literals
+
+from django.core.management import BaseCommand
+
+from issuer.models import Issuer, BadgeClass, BadgeClassRecipientCounts, IssuerRecipientCounts
+
+
+class Command(BaseCommand):
+    help = "Recompute the recipient counts of every BadgeClass and Issuer from their assertions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['Issuer', 'BadgeClass'], action='append',
+                            help="only reconcile this model, may be repeated")
+        parser.add_argument('--after-pk', type=int, default=0, help="resume after this primary key")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model, counts_model in ((BadgeClass, BadgeClassRecipientCounts), (Issuer, IssuerRecipientCounts)):
+            if options['model'] and model.__name__ not in options['model']:
+                continue
+            self.reconcile(model, counts_model, options['after_pk'], options['chunk_size'])
+
+    def reconcile(self, model, counts_model, after_pk, chunk_size):
+        reconciled = 0
+        last_pk = after_pk
+        while True:
+            chunk = list(model.objects.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+            if not chunk:
+                break
+            counts_model.objects.reconcile([obj.pk for obj in chunk])
+            for obj in chunk:
+                obj.publish_method('cached_recipient_counts')
+            reconciled += len(chunk)
+            last_pk = chunk[-1].pk
+            self.stdout.write("Reconciled {} {} recipient counts, last pk={}".format(reconciled, model.__name__, last_pk))
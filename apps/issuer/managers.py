@@ -1,17 +1,28 @@
 # encoding: utf-8
 from __future__ import unicode_literals
 
+import datetime
 import json
+import logging
+from collections import Counter, defaultdict
 
 from django.conf import settings
 import dateutil.parser
+import more_itertools
+from django.apps import apps
 from django.core.files.storage import DefaultStorage
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
 
+from issuer import json_export
 from mainsite.utils import fetch_remote_file_to_storage, list_of
 from pathway.tasks import award_badges_for_pathway_completion
 
 
+logger = logging.getLogger(__name__)
+
+
 class IssuerManager(models.Manager):
 
     @transaction.atomic
@@ -214,3 +225,503 @@ class BadgeInstanceManager(models.Manager):
 
         return new_instance
 
+    def bulk_issue(self, badgeclass, assertions, check_completions=True, badgr_app=None, batch_size=500):
+        """
+        Award a badgeclass to many recipients with a constant number of transactions and cache invalidations.
+
+        Unlike create(), new assertions are inserted with bulk_create() and never call save(), so the
+        per-assertion publish() cascade is replaced by publishing the badgeclass, its issuer and the affected
+        recipient profiles and users once for the whole batch.
+        Baked images are not written until the batch has committed, see BadgeInstance.schedule_image_baking().
+
+        :type badgeclass: BadgeClass
+        :param assertions: list of dicts of BadgeInstance field values, plus the optional keys
+            evidence (list of dicts(evidence_url=string, narrative=string)), extensions (dict), notify (bool)
+            and allow_uppercase (bool)
+        :return: list of the new BadgeInstances in the same order as assertions
+        """
+        from issuer.models import BadgeInstanceChange, BadgeInstanceEvidence, BadgeInstanceExtension
+
+        issuer = badgeclass.cached_issuer
+        first_assertion = badgeclass.recipient_count() == 0
+
+        rows = []
+        for assertion in assertions:
+            assertion = dict(assertion)
+            evidence = assertion.pop('evidence', None)
+            extensions = assertion.pop('extensions', None)
+            notify = assertion.pop('notify', False)
+            recipient_identifier = assertion.pop('recipient_identifier')
+            if not assertion.pop('allow_uppercase', False):
+                recipient_identifier = recipient_identifier.lower()
+
+            new_instance = self.model(
+                recipient_identifier=recipient_identifier,
+                badgeclass=badgeclass,
+                issuer=issuer,
+                **assertion
+            )
+            # images are baked after the transaction commits, so a rollback leaves no orphaned files in storage
+            new_instance.prepare_new_instance(defer_baking=True)
+            new_instance.entity_version += 1  # bulk_create() skips _AbstractVersionedEntity.save()
+            rows.append((new_instance, evidence, extensions, notify))
+
+        new_instances = [new_instance for new_instance, evidence, extensions, notify in rows]
+        recipient_identifiers = list(set(i.recipient_identifier for i in new_instances))
+        self._add_recipient_variants(recipient_identifiers)
+
+        with transaction.atomic():
+            self.add_recipient_counts([(badgeclass.pk, issuer.pk, None, i.get_recipient_counts()) for i in new_instances])
+            self.bulk_create(new_instances, batch_size=batch_size)
+
+            # bulk_create() does not populate primary keys on every backend, look them up by entity_id
+            pks = {}
+            for chunk in more_itertools.chunked([i.entity_id for i in new_instances], batch_size):
+                pks.update(self.filter(entity_id__in=chunk).values_list('entity_id', 'pk'))
+
+            new_evidence = []
+            new_extensions = []
+            for new_instance, evidence, extensions, notify in rows:
+                new_instance.pk = pks[new_instance.entity_id]
+                new_instance._state.adding = False
+                new_instance._state.db = self.db
+
+                for evidence_obj in evidence or []:
+                    new_evidence.append(BadgeInstanceEvidence(
+                        badgeinstance=new_instance,
+                        evidence_url=evidence_obj.get('evidence_url'),
+                        narrative=evidence_obj.get('narrative') or None
+                    ))
+                for name, ext in (extensions or {}).items():
+                    new_extensions.append(BadgeInstanceExtension(
+                        badgeinstance=new_instance,
+                        name=name,
+                        original_json=json.dumps(ext)
+                    ))
+
+            BadgeInstanceEvidence.objects.bulk_create(new_evidence, batch_size=batch_size)
+            BadgeInstanceExtension.objects.bulk_create(new_extensions, batch_size=batch_size)
+            BadgeInstanceChange.objects.log(new_instances, BadgeInstanceChange.ACTION_CREATED, batch_size=batch_size)
+
+        self._publish_recipients(recipient_identifiers, batch_size=batch_size)
+        badgeclass.publish()
+
+        if not getattr(settings, 'BADGR_VIRTUAL_BAKED_IMAGES', False):
+            # bake in background tasks, requests for an image before its task runs bake it on demand
+            for new_instance in new_instances:
+                if new_instance.image_pending:
+                    new_instance.schedule_image_baking()
+
+        # completions only need to be checked if the badgeclass is part of a pathway
+        if check_completions and len(badgeclass.cached_pathway_elements()) > 0:
+            for new_instance in new_instances:
+                award_badges_for_pathway_completion.delay(badgeinstance_pk=new_instance.pk)
+
+        for new_instance, evidence, extensions, notify in rows:
+            if notify:
+                new_instance.notify_earner(badgr_app=badgr_app)
+
+        if first_assertion and len(new_instances) > 0 and (
+                not getattr(settings, 'BADGERANK_NOTIFY_ON_BADGECLASS_CREATE', True) and
+                getattr(settings, 'BADGERANK_NOTIFY_ON_FIRST_ASSERTION', True)):
+            from issuer.tasks import notify_badgerank_of_badgeclass
+            notify_badgerank_of_badgeclass.delay(badgeclass_pk=badgeclass.pk)
+
+        return new_instances
+
+    def bulk_revoke_entity_ids(self, revocations, has_issuer_permission, batch_size=500):
+        """
+        Revoke the assertions of a batch revoke request, see bulk_revoke()
+
+        :param revocations: list of dicts(entityId=string, revocationReason=string)
+        :param has_issuer_permission: callable(issuer) returning whether its assertions may be revoked,
+            called once per distinct issuer
+        :return: a result dict for each revocation, in the same order
+        """
+        entity_ids = [r.get('entityId', None) for r in revocations if isinstance(r, dict)]
+        assertions = {}
+        for chunk in more_itertools.chunked([e for e in set(entity_ids) if e is not None], batch_size):
+            for assertion in self.filter(entity_id__in=chunk).select_related('badgeclass', 'issuer'):
+                assertions[assertion.entity_id] = assertion
+
+        issuer_permissions = {}
+        results = []
+        to_revoke = []
+        pending = {}
+        for revocation in revocations:
+            result = dict(revoked=False)
+            entity_id = revocation.get('entityId', None) if isinstance(revocation, dict) else None
+            revocation_reason = revocation.get('revocationReason', None) if isinstance(revocation, dict) else None
+            results.append(result)
+
+            if entity_id is None:
+                result['reason'] = "entityId is required"
+                continue
+            result['entityId'] = entity_id
+
+            if revocation_reason is None:
+                result['reason'] = "revocationReason is required"
+                continue
+            result['revocationReason'] = revocation_reason
+
+            assertion = assertions.get(entity_id)
+            if assertion is not None and assertion.issuer_id not in issuer_permissions:
+                issuer_permissions[assertion.issuer_id] = has_issuer_permission(assertion.cached_issuer)
+            if assertion is None or not issuer_permissions[assertion.issuer_id]:
+                result['reason'] = "permission denied or object not found"
+                continue
+
+            if assertion.revoked or entity_id in pending:
+                result['reason'] = "Assertion is already revoked"
+                continue
+            if not revocation_reason:
+                result['reason'] = "revocation_reason is required"
+                continue
+
+            pending[entity_id] = result
+            to_revoke.append((assertion, revocation_reason))
+
+        self.bulk_revoke(to_revoke, batch_size=batch_size)
+        for result in pending.values():
+            result['revoked'] = True
+        return results
+
+    def bulk_revoke(self, revocations, batch_size=500):
+        """
+        Revoke many assertions with a single UPDATE per batch and one cache invalidation per affected
+        badgeclass, recipient and collection. Stored images are deleted by a celery task after commit.
+
+        The caller is responsible for checking permissions and that the assertions are not already revoked.
+
+        :param revocations: list of (BadgeInstance, revocation_reason) tuples
+        :return: list of the revoked BadgeInstances
+        """
+        from issuer.models import BadgeInstanceChange
+        from issuer.tasks import delete_stored_files
+
+        revoked_instances = []
+        with transaction.atomic():
+            self.add_recipient_counts([
+                (instance.badgeclass_id, instance.issuer_id, instance.get_recipient_counts(),
+                 self.model.recipient_counts(True, instance.acceptance))
+                for instance, reason in revocations
+            ])
+            for chunk in more_itertools.chunked(revocations, batch_size):
+                reasons = [When(pk=instance.pk, then=Value(reason)) for instance, reason in chunk]
+                self.filter(pk__in=[instance.pk for instance, reason in chunk]).update(
+                    revoked=True,
+                    revocation_reason=Case(*reasons, output_field=models.TextField()),
+                    image='',
+                    entity_version=F('entity_version') + 1,
+                    updated_at=timezone.now()
+                )
+                revoked_instances.extend(instance for instance, reason in chunk)
+            BadgeInstanceChange.objects.log(revoked_instances, BadgeInstanceChange.ACTION_REVOKED, batch_size=batch_size)
+
+        image_names = [instance.image.name for instance in revoked_instances if instance.image]
+        if image_names:
+            transaction.on_commit(lambda: delete_stored_files.delay(names=image_names))
+
+        for instance, reason in revocations:
+            # the instance was cached by its old revoked value as well
+            instance.publish_delete('entity_id', 'revoked')
+            instance.revoked = True
+            instance.revocation_reason = reason
+            instance.image = None
+            instance.entity_version += 1
+        self.publish_instances(revoked_instances, batch_size=batch_size)
+
+        instance_pks = [instance.pk for instance in revoked_instances]
+
+        # remove BadgeObjectiveAwards from badgebook if needed
+        if apps.is_installed('badgebook'):
+            try:
+                from badgebook.models import BadgeObjectiveAward
+                for chunk in more_itertools.chunked(instance_pks, batch_size):
+                    for award in BadgeObjectiveAward.objects.filter(badge_instance_id__in=chunk):
+                        award.delete()
+            except ImportError:
+                pass
+
+        return revoked_instances
+
+    def add_recipient_counts(self, changes):
+        """
+        Apply changes to the RecipientCounts of the affected badgeclasses and issuers, before they are written
+
+        :param changes: list of (badgeclass_id, issuer_id, old_counts, new_counts) tuples, where old_counts and
+            new_counts are BadgeInstance.recipient_counts() dicts, or None for a created or deleted assertion
+        """
+        from issuer.models import BadgeClassRecipientCounts, IssuerRecipientCounts
+
+        badgeclass_deltas = defaultdict(Counter)
+        issuer_deltas = defaultdict(Counter)
+        for badgeclass_id, issuer_id, old_counts, new_counts in changes:
+            for counter in RecipientCountsManager.COUNTERS:
+                delta = (new_counts or {}).get(counter, 0) - (old_counts or {}).get(counter, 0)
+                badgeclass_deltas[badgeclass_id][counter] += delta
+                issuer_deltas[issuer_id][counter] += delta
+
+        # lock the rows in a consistent order
+        for badgeclass_id in sorted(badgeclass_deltas):
+            BadgeClassRecipientCounts.objects.add(badgeclass_id, **badgeclass_deltas[badgeclass_id])
+        for issuer_id in sorted(issuer_deltas):
+            IssuerRecipientCounts.objects.add(issuer_id, **issuer_deltas[issuer_id])
+
+    def prefetch_cached(self, instances):
+        """
+        Load the cached badgeclasses, issuers and creators of instances into the current unit of work with one
+        multi-get per model, so serializing a page of assertions costs a constant number of cache round trips.
+        Returns instances as a list.
+        """
+        from badgeuser.models import BadgeUser
+        from issuer.models import BadgeClass, Issuer
+        from mainsite.identity_map import get_identity_map
+
+        instances = list(instances.all() if isinstance(instances, models.Manager) else instances)
+        if get_identity_map() is None or not instances:
+            return instances
+
+        badgeclasses = BadgeClass.cached.get_many([i.badgeclass_id for i in instances])
+        Issuer.cached.get_many([i.issuer_id for i in instances] + [b.issuer_id for b in badgeclasses.values()])
+        BadgeUser.cached.get_many([i.created_by_id for i in instances] +
+                                  [b.created_by_id for b in badgeclasses.values()], field='id')
+        return instances
+
+    def publish_instances(self, instances, batch_size=500):
+        """
+        Batched equivalent of BadgeInstance.publish() for instances updated without save(), publishes each
+        affected badgeclass, recipient and collection once
+        """
+        from backpack.models import BackpackCollection
+
+        for instance in instances:
+            instance.publish_by('pk')
+            instance.publish_by('entity_id')
+            instance.publish_by('entity_id', 'revoked')
+            instance.invalidate_json_cache()
+            if json_export.export_enabled():
+                json_export.schedule_export(instance)
+
+        for badgeclass in set(instance.cached_badgeclass for instance in instances):
+            badgeclass.publish()
+        self._publish_recipients(list(set(i.recipient_identifier for i in instances)), batch_size=batch_size)
+        for chunk in more_itertools.chunked([instance.pk for instance in instances], batch_size):
+            for collection in BackpackCollection.objects.filter(assertions__in=chunk).distinct():
+                collection.publish()
+
+    def _add_recipient_variants(self, recipient_identifiers):
+        """
+        Batched equivalent of the email variant check in BadgeInstance.save()
+        """
+        from badgeuser.models import CachedEmailAddress
+
+        for existing_email in CachedEmailAddress.objects.filter(email__in=recipient_identifiers):
+            variants = [e.email for e in existing_email.cached_variants()]
+            for recipient_identifier in recipient_identifiers:
+                if recipient_identifier.lower() == existing_email.email.lower() and \
+                        recipient_identifier != existing_email.email and \
+                        recipient_identifier not in variants:
+                    existing_email.add_variant(recipient_identifier)
+                    variants.append(recipient_identifier)
+
+    def _publish_recipients(self, recipient_identifiers, batch_size=500):
+        """
+        Publish each recipient profile and recipient user of recipient_identifiers once
+        """
+        from badgeuser.models import CachedEmailAddress
+        from recipient.models import RecipientProfile
+
+        users = {}
+        for chunk in more_itertools.chunked(recipient_identifiers, batch_size):
+            for profile in RecipientProfile.objects.filter(recipient_identifier__in=chunk):
+                profile.publish()
+            for email_address in CachedEmailAddress.objects.filter(email__in=chunk, verified=True).select_related('user'):
+                users[email_address.user_id] = email_address.user
+        for user in users.values():
+            user.publish()
+
+
+class BatchJobManager(models.Manager):
+    def create_job(self, job_type, rows, created_by=None, badgeclass=None, chunk_size=None):
+        """
+        Create a BatchJob and split rows into BatchJobChunks of chunk_size rows.
+        The caller is responsible for queueing the job with issuer.tasks.process_batch_job
+        """
+        from issuer.models import BatchJobChunk
+
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'BATCH_JOB_CHUNK_SIZE', 100)
+
+        with transaction.atomic():
+            job = self.create(
+                job_type=job_type,
+                badgeclass=badgeclass,
+                created_by=created_by,
+                total_count=len(rows),
+                status=self.model.STATUS_PENDING if len(rows) > 0 else self.model.STATUS_COMPLETE
+            )
+            BatchJobChunk.objects.bulk_create([
+                BatchJobChunk(job=job, chunk_index=idx, row_offset=idx * chunk_size, request_json=json.dumps(chunk))
+                for idx, chunk in enumerate(more_itertools.chunked(rows, chunk_size))
+            ])
+        job.publish()
+        return job
+
+
+class BatchJobChunkManager(models.Manager):
+    def claimable(self):
+        """
+        Unprocessed chunks that are not claimed, or whose claim is older than BATCH_JOB_CHUNK_CLAIM_TIMEOUT because the
+        worker that took it died before recording its results
+        """
+        stale_before = timezone.now() - datetime.timedelta(
+            seconds=getattr(settings, 'BATCH_JOB_CHUNK_CLAIM_TIMEOUT', 600))
+        return self.filter(result_json__isnull=True).filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale_before))
+
+
+class RecipientCountsManager(models.Manager):
+    """
+    Counts of the assertions of each badgeclass or issuer.  They are kept current by BadgeInstance.save() and delete()
+    and the bulk methods of BadgeInstanceManager, and rebuilt by the reconcile_recipient_counts command.
+    """
+    COUNTERS = ('issued', 'revoked', 'accepted', 'rejected')
+
+    @property
+    def owner_field(self):
+        return self.model.owner_field + '_id'
+
+    def get_counts(self, owner_id):
+        """
+        Return the counts of owner_id, computed from its assertions without being stored if they have no row yet
+        """
+        try:
+            return self.get(pk=owner_id)
+        except self.model.DoesNotExist:
+            return self.model(pk=owner_id, **self.count_assertions([owner_id])[owner_id])
+
+    def add(self, owner_id, **deltas):
+        """
+        Atomically add deltas to the counters of owner_id. Must be called before the change is written, so that a
+        missing row can be initialized from the assertions as they were.
+        """
+        updates = {counter: F(counter) + delta for counter, delta in deltas.items() if delta}
+        if not updates:
+            return
+        if self.filter(pk=owner_id).update(**updates) == 0:
+            self.reconcile([owner_id])
+            self.filter(pk=owner_id).update(**updates)
+
+    def count_assertions(self, owner_ids):
+        """
+        Count the assertions of owner_ids with one aggregate query, returns a dict of counter values by owner_id
+        """
+        from issuer.models import BadgeInstance
+
+        def _count_where(**conditions):
+            return Sum(Case(When(then=Value(1), **conditions), default=Value(0), output_field=models.IntegerField()))
+
+        counts = {owner_id: dict.fromkeys(self.COUNTERS, 0) for owner_id in owner_ids}
+        rows = BadgeInstance.objects.filter(**{self.owner_field + '__in': owner_ids}).order_by()\
+            .values(self.owner_field)\
+            .annotate(issued=Count('pk'),
+                      revoked=_count_where(revoked=True),
+                      accepted=_count_where(acceptance=BadgeInstance.ACCEPTANCE_ACCEPTED),
+                      rejected=_count_where(acceptance=BadgeInstance.ACCEPTANCE_REJECTED))
+        for row in rows:
+            counts[row.pop(self.owner_field)] = row
+        return counts
+
+    def reconcile(self, owner_ids):
+        """
+        Recompute and store the counts of owner_ids.  Changes committed while this runs may be lost, run it again
+        or when issuing is quiet.
+        """
+        counts = self.count_assertions(owner_ids)
+        with transaction.atomic():
+            existing = set(self.filter(pk__in=owner_ids).values_list('pk', flat=True))
+            for owner_id in existing:
+                self.filter(pk=owner_id).update(**counts[owner_id])
+            try:
+                with transaction.atomic():
+                    self.bulk_create([self.model(pk=owner_id, **counts[owner_id])
+                                      for owner_id in owner_ids if owner_id not in existing])
+            except IntegrityError:
+                # created concurrently by add()
+                pass
+
+
+class BadgeInstanceChangeManager(models.Manager):
+    def log(self, instances, action, batch_size=500):
+        """
+        Append a change to the log for each of instances.  Call it inside the transaction that makes the change, and
+        for a deletion before the assertion's collections are removed.
+        """
+        from backpack.models import BackpackCollectionBadgeInstance
+        from issuer.models import BadgeInstanceChangeUser
+
+        instances = list(instances)
+
+        # new assertions are not in any collection yet
+        collected_by = defaultdict(set)
+        if action != self.model.ACTION_CREATED:
+            for chunk in more_itertools.chunked([i.pk for i in instances], batch_size):
+                collections = BackpackCollectionBadgeInstance.objects.filter(
+                    badgeinstance_id__in=chunk, badgeuser_id__isnull=False)
+                for badgeinstance_id, badgeuser_id in collections.values_list('badgeinstance_id', 'badgeuser_id'):
+                    collected_by[badgeinstance_id].add(badgeuser_id)
+
+        changes = [self.model(badgeinstance_id=i.pk, entity_id=i.entity_id, issuer_id=i.issuer_id, action=action)
+                   for i in instances]
+        self.bulk_create([c for c in changes if c.badgeinstance_id not in collected_by], batch_size=batch_size)
+
+        # bulk_create() does not populate primary keys on every backend, save changes that need one individually
+        change_users = []
+        for change in changes:
+            if change.badgeinstance_id in collected_by:
+                change.save()
+                change_users.extend(BadgeInstanceChangeUser(change=change, badgeuser_id=badgeuser_id)
+                                    for badgeuser_id in collected_by[change.badgeinstance_id])
+        BadgeInstanceChangeUser.objects.bulk_create(change_users, batch_size=batch_size)
+
+        if changes:
+            logged_at = timezone.now()
+            transaction.on_commit(lambda: self._check_settle_window(logged_at))
+
+    def _check_settle_window(self, logged_at):
+        elapsed = (timezone.now() - logged_at).total_seconds()
+        if elapsed > getattr(settings, 'BADGR_CHANGE_FEED_SETTLE_SECONDS', 300):
+            logger.warning("Assertion changes committed {:.0f}s after they were logged, longer than "
+                           "BADGR_CHANGE_FEED_SETTLE_SECONDS; change feed readers may have skipped them".format(elapsed))
+
+    def get_feed(self, issuer_ids, badgeuser_ids, after=0, limit=100):
+        """
+        Return (changes, has_more) for up to limit changes after the sequence number after, to assertions of
+        issuer_ids or in a collection of badgeuser_ids, in sequence order.
+
+        Sequence numbers are assigned at insert but become visible at commit, so a transaction that is still open can
+        commit a lower sequence than one a client already read past.  Changes younger than
+        BADGR_CHANGE_FEED_SETTLE_SECONDS are held back for that reason, which is only safe while every transaction that
+        writes to the log commits within that many seconds of writing to it.  A transaction that takes longer is
+        logged as a warning when it commits, its changes may be missed by clients that follow the cursor.
+        """
+        from issuer.models import BadgeInstanceChangeUser
+
+        settled_at = timezone.now() - datetime.timedelta(
+            seconds=getattr(settings, 'BADGR_CHANGE_FEED_SETTLE_SECONDS', 300))
+
+        # one index range scan per audience, merged
+        sequences = set()
+        if issuer_ids:
+            sequences.update(self.filter(issuer_id__in=issuer_ids, sequence__gt=after, created_at__lte=settled_at)
+                             .order_by('sequence').values_list('sequence', flat=True)[:limit + 1])
+        if badgeuser_ids:
+            sequences.update(BadgeInstanceChangeUser.objects.filter(
+                    badgeuser_id__in=badgeuser_ids, change_id__gt=after, change__created_at__lte=settled_at)
+                .order_by('change_id').values_list('change_id', flat=True)[:limit + 1])
+
+        sequences = sorted(sequences)
+        has_more = len(sequences) > limit
+        changes = list(self.filter(sequence__in=sequences[:limit]).order_by('sequence'))
+        return changes, has_more
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-17 04:47
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('issuer', '0043_auto_20180614_0949'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_version', models.PositiveIntegerField(default=1)),
+                ('entity_id', models.CharField(default=None, max_length=254, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('job_type', models.CharField(choices=[('issue', 'issue'), ('revoke', 'revoke')], max_length=254)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Running', 'Running'), ('Complete', 'Complete')], default='Pending', max_length=254)),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('processed_count', models.PositiveIntegerField(default=0)),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('badgeclass', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='issuer.BadgeClass')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='BatchJobChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_index', models.PositiveIntegerField()),
+                ('row_offset', models.PositiveIntegerField(default=0)),
+                ('request_json', models.TextField()),
+                ('result_json', models.TextField(blank=True, default=None, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='issuer.BatchJob')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='batchjobchunk',
+            unique_together=set([('job', 'chunk_index')]),
+        ),
+    ]
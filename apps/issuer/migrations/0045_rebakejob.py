@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-17 05:14
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('issuer', '0044_batchjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RebakeJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Running', 'Running'), ('Complete', 'Complete')], default='Pending', max_length=254)),
+                ('obi_version', models.CharField(default='2_0', max_length=254)),
+                ('issued_after', models.DateTimeField(blank=True, default=None, null=True)),
+                ('issued_before', models.DateTimeField(blank=True, default=None, null=True)),
+                ('max_count', models.PositiveIntegerField(blank=True, default=None, null=True)),
+                ('chunk_size', models.PositiveIntegerField(default=500)),
+                ('last_dispatched_pk', models.PositiveIntegerField(default=0)),
+                ('dispatched_count', models.PositiveIntegerField(default=0)),
+                ('is_dispatched', models.BooleanField(default=False)),
+                ('processed_count', models.PositiveIntegerField(default=0)),
+                ('rebaked_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('badgeclass', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='issuer.BadgeClass')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('issuer', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='issuer.Issuer')),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RebakeJobChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_pk', models.PositiveIntegerField()),
+                ('last_pk', models.PositiveIntegerField()),
+                ('assertion_count', models.PositiveIntegerField(default=0)),
+                ('rebaked_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('failures_json', models.TextField(default='[]')),
+                ('completed_at', models.DateTimeField(blank=True, default=None, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='issuer.RebakeJob')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
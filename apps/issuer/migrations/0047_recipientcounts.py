@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-17 05:44
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issuer', '0046_imagederivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BadgeClassRecipientCounts',
+            fields=[
+                ('issued', models.IntegerField(default=0)),
+                ('revoked', models.IntegerField(default=0)),
+                ('accepted', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('badgeclass', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipient_counts', serialize=False, to='issuer.BadgeClass')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='IssuerRecipientCounts',
+            fields=[
+                ('issued', models.IntegerField(default=0)),
+                ('revoked', models.IntegerField(default=0)),
+                ('accepted', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('issuer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipient_counts', serialize=False, to='issuer.Issuer')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-17 07:02
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issuer', '0048_badgeinstance_backpack_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='badgeinstance',
+            index_together=set([('recipient_identifier', 'revoked', 'issued_on'), ('recipient_identifier', 'badgeclass', 'revoked'), ('updated_at', 'id')]),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-17 07:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issuer', '0049_badgeinstance_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BadgeInstanceChange',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('badgeinstance_id', models.PositiveIntegerField()),
+                ('entity_id', models.CharField(max_length=254)),
+                ('issuer_id', models.PositiveIntegerField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('revoked', 'Revoked'), ('deleted', 'Deleted')], max_length=254)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BadgeInstanceChangeUser',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('badgeuser_id', models.PositiveIntegerField()),
+                ('change', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='users', to='issuer.BadgeInstanceChange')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='badgeinstancechangeuser',
+            index_together=set([('badgeuser_id', 'change')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='badgeinstancechange',
+            index_together=set([('issuer_id', 'sequence')]),
+        ),
+    ]
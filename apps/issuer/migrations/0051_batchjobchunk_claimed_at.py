@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-17 12:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issuer', '0050_badgeinstancechange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchjobchunk',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+    ]
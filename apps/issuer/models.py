@@ -1,41 +1,50 @@
 from __future__ import unicode_literals
 
 import StringIO
+import copy
 import datetime
 import re
+import time
 import uuid
 from collections import OrderedDict
 from itertools import chain
 
 import cachemodel
+from cachemodel import CACHE_FOREVER_TIMEOUT
 import os
 from allauth.account.adapter import get_adapter
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.core.urlresolvers import reverse
 from django.db import models, transaction
-from django.db.models import ProtectedError
+from django.db.models import ProtectedError, F
 from json import loads as json_loads
 from json import dumps as json_dumps
 from jsonfield import JSONField
-from openbadges_bakery import bake
 from django.utils import timezone
 
 from entity.models import BaseVersionedEntity
-from issuer.managers import BadgeInstanceManager, IssuerManager, BadgeClassManager, BadgeInstanceEvidenceManager
+from issuer import baking, catalog, derivatives, json_export
+from issuer.managers import BadgeInstanceManager, IssuerManager, BadgeClassManager, BadgeInstanceEvidenceManager, \
+    BatchJobManager, BatchJobChunkManager, RecipientCountsManager, BadgeInstanceChangeManager
 from mainsite.managers import SlugOrJsonIdCacheModelManager
 from mainsite.mixins import ResizeUploadedImage, ScrubUploadedSvgImage
 from mainsite.models import (BadgrApp, EmailBlacklist)
-from mainsite.utils import OriginSetting, generate_entity_uri
+from mainsite.publish import publish_coalesced
+from mainsite.utils import OriginSetting, generate_entity_uri, LRUCache
 from .utils import generate_sha256_hashstring, CURRENT_OBI_VERSION, get_obi_context, add_obi_version_ifneeded, \
     UNVERSIONED_BAKED_VERSION
 
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
 
+# in-process memo of get_json() results in front of the django cache, see BaseOpenBadgeObjectModel.get_memoized_json
+json_memo = LRUCache(max_size=getattr(settings, 'BADGR_JSON_MEMO_SIZE', 1024))
+
 
 class BaseAuditedModel(cachemodel.CacheModel):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -81,6 +90,59 @@ class BaseOpenBadgeObjectModel(OriginalJsonMixin, cachemodel.CacheModel):
     def get_extensions_manager(self):
         raise NotImplementedError()
 
+    def publish(self):
+        super(BaseOpenBadgeObjectModel, self).publish()
+        self.invalidate_json_cache()
+        if json_export.export_enabled():
+            json_export.schedule_export(self)
+
+    def delete(self, *args, **kwargs):
+        if json_export.export_enabled():
+            json_export.schedule_removal(self)
+        return super(BaseOpenBadgeObjectModel, self).delete(*args, **kwargs)
+
+    def _json_generation_key(self):
+        return '{}_json_generation_{}'.format(self.__class__.__name__, self.pk)
+
+    def invalidate_json_cache(self):
+        """
+        Start a new generation of memoized get_json() results, for changes that do not bump entity_version
+        such as extensions, evidence, alignments and tags
+        """
+        cache.set(self._json_generation_key(), uuid.uuid4().hex, CACHE_FOREVER_TIMEOUT)
+
+    def get_json_version(self):
+        """
+        A string that changes whenever the result of get_json() may have changed
+        """
+        generation_key = self._json_generation_key()
+        generation = cache.get(generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not cache.add(generation_key, generation, CACHE_FOREVER_TIMEOUT):
+                generation = cache.get(generation_key, generation)
+        return '{}.{}'.format(getattr(self, 'entity_version', None), generation)
+
+    def get_memoized_json(self, build_json, **kwargs):
+        """
+        Return a copy of build_json(**kwargs), memoized in process and in the django cache until the entity_version
+        changes or publish() is called. kwargs must be the obi_version and flags that determine the result.
+        """
+        if self.pk is None:
+            return build_json(**kwargs)
+
+        key = '{}_json_{}_{}_{}'.format(
+            self.__class__.__name__, self.pk, self.get_json_version(),
+            '_'.join('{}={}'.format(k, v) for k, v in sorted(kwargs.items())))
+        json = json_memo.get(key)
+        if json is None:
+            json = cache.get(key)
+            if json is None:
+                json = build_json(**kwargs)
+                cache.set(key, json, CACHE_FOREVER_TIMEOUT)
+            json_memo.set(key, json)
+        return copy.deepcopy(json)
+
     @cachemodel.cached_method(auto_publish=True)
     def cached_extensions(self):
         return self.get_extensions_manager().all()
@@ -127,7 +189,19 @@ class BaseOpenBadgeExtension(cachemodel.CacheModel):
         abstract = True
 
 
+class GenerateImageDerivatives(object):
+    """
+    Generate the derivatives of an uploaded or changed image, see issuer.derivatives
+    """
+    def save(self, *args, **kwargs):
+        ret = super(GenerateImageDerivatives, self).save(*args, **kwargs)
+        if self.image:
+            derivatives.schedule_derivatives(self.image.name)
+        return ret
+
+
 class Issuer(ResizeUploadedImage,
+             GenerateImageDerivatives,
              ScrubUploadedSvgImage,
              BaseAuditedModel,
              BaseVersionedEntity,
@@ -153,6 +227,7 @@ class Issuer(ResizeUploadedImage,
     objects = IssuerManager()
     cached = SlugOrJsonIdCacheModelManager(slug_kwarg_name='entity_id', slug_field_name='entity_id')
 
+    @publish_coalesced
     def publish(self, *args, **kwargs):
         super(Issuer, self).publish(*args, **kwargs)
         for member in self.cached_issuerstaff():
@@ -273,15 +348,23 @@ class Issuer(ResizeUploadedImage,
     def cached_recipient_groups(self):
         return self.recipientgroup_set.all()
 
+    @cachemodel.cached_method(auto_publish=True)
+    def cached_recipient_counts(self):
+        return IssuerRecipientCounts.objects.get_counts(self.pk)
+
     @property
     def recipient_count(self):
-        return sum(bc.recipient_count() for bc in self.cached_badgeclasses())
+        return self.cached_recipient_counts().recipient_count
 
     @property
     def image_preview(self):
         return self.image
 
     def get_json(self, obi_version=CURRENT_OBI_VERSION, include_extra=True, use_canonical_id=False):
+        return self.get_memoized_json(self._build_json, obi_version=obi_version, include_extra=include_extra,
+                                      use_canonical_id=use_canonical_id)
+
+    def _build_json(self, obi_version=CURRENT_OBI_VERSION, include_extra=True, use_canonical_id=False):
         obi_version, context_iri = get_obi_context(obi_version)
 
         json = OrderedDict({'@context': context_iri})
@@ -370,6 +453,7 @@ class IssuerStaff(cachemodel.CacheModel):
 
 
 class BadgeClass(ResizeUploadedImage,
+                 GenerateImageDerivatives,
                  ScrubUploadedSvgImage,
                  BaseAuditedModel,
                  BaseVersionedEntity,
@@ -397,10 +481,23 @@ class BadgeClass(ResizeUploadedImage,
     class Meta:
         verbose_name_plural = "Badge classes"
 
+    @publish_coalesced
     def publish(self):
         super(BadgeClass, self).publish()
         self.issuer.publish()
 
+    def save(self, *args, **kwargs):
+        ret = super(BadgeClass, self).save(*args, **kwargs)
+        self.update_catalog()
+        return ret
+
+    def update_catalog(self):
+        """
+        Rewrite this badgeclass in the cached catalogs of its issuer.  Called when its json changes rather than from
+        publish(), which every issuance triggers.
+        """
+        catalog.update_badgeclass(self)
+
     def delete(self, *args, **kwargs):
         if self.recipient_count() > 0:
             raise ProtectedError("BadgeClass may only be deleted if all BadgeInstances have been revoked.", self)
@@ -412,8 +509,19 @@ class BadgeClass(ResizeUploadedImage,
             raise ProtectedError("Badge could not be deleted. It is being used as a pathway completion badge.", self)
 
         issuer = self.issuer
-        super(BadgeClass, self).delete(*args, **kwargs)
+        badgeclass_pk = self.pk
+        with transaction.atomic():
+            # revoked assertions are deleted along with the badgeclass, take them out of the issuer counts
+            counts = BadgeClassRecipientCounts.objects.get_counts(self.pk)
+            IssuerRecipientCounts.objects.add(self.issuer_id, **{
+                counter: -getattr(counts, counter) for counter in RecipientCountsManager.COUNTERS
+            })
+            # and leave a tombstone for each in the assertion change log
+            BadgeInstanceChange.objects.log(BadgeInstance.objects.filter(badgeclass_id=self.pk),
+                                            BadgeInstanceChange.ACTION_DELETED)
+            super(BadgeClass, self).delete(*args, **kwargs)
         issuer.publish()
+        catalog.remove_badgeclass(issuer.pk, badgeclass_pk)
 
     def get_absolute_url(self):
         return reverse('badgeclass_json', kwargs={'entity_id': self.entity_id})
@@ -454,8 +562,11 @@ class BadgeClass(ResizeUploadedImage,
         return Issuer.cached.get(pk=self.issuer_id)
 
     @cachemodel.cached_method(auto_publish=True)
+    def cached_recipient_counts(self):
+        return BadgeClassRecipientCounts.objects.get_counts(self.pk)
+
     def recipient_count(self):
-        return self.badgeinstances.filter(revoked=False).count()
+        return self.cached_recipient_counts().recipient_count
 
     def pathway_element_count(self):
         return len(self.cached_pathway_elements())
@@ -549,6 +660,10 @@ class BadgeClass(ResizeUploadedImage,
         )
 
     def get_json(self, obi_version=CURRENT_OBI_VERSION, include_extra=True, use_canonical_id=False):
+        return self.get_memoized_json(self._build_json, obi_version=obi_version, include_extra=include_extra,
+                                      use_canonical_id=use_canonical_id)
+
+    def _build_json(self, obi_version=CURRENT_OBI_VERSION, include_extra=True, use_canonical_id=False):
         obi_version, context_iri = get_obi_context(obi_version)
         json = OrderedDict({'@context': context_iri})
         json.update(OrderedDict(
@@ -669,6 +784,8 @@ class BadgeInstance(BaseAuditedModel,
     class Meta:
         index_together = (
                 ('recipient_identifier', 'badgeclass', 'revoked'),
+                ('recipient_identifier', 'revoked', 'issued_on'),
+                ('updated_at', 'id'),
         )
 
     @property
@@ -723,24 +840,128 @@ class BadgeInstance(BaseAuditedModel,
     def owners(self):
         return self.issuer.owners
 
+    def prepare_new_instance(self, defer_baking=False):
+        """
+        Populate the salt, entity_id and baked image of an assertion that has not been saved yet.
+        Used by save() and by BadgeInstanceManager.bulk_issue() which bypasses save().
+
+        If defer_baking or settings.BADGR_DEFERRED_BAKING is enabled the image is left empty, see
+        schedule_image_baking().
+        If settings.BADGR_VIRTUAL_BAKED_IMAGES is enabled it is never stored, see get_virtual_baked_image().
+        """
+        self.salt = uuid.uuid4().hex
+        self.created_at = datetime.datetime.now()
+
+        # do this now instead of in AbstractVersionedEntity.save() so we can use it for image name
+        if self.entity_id is None:
+            self.entity_id = generate_entity_uri()
+
+        if not self.image and not defer_baking and not self.image_baking_deferred():
+            self.bake_image()
+
+    def bake_image(self):
+        """
+        Bake the unversioned assertion json into a copy of the badgeclass image and store it as .image without saving
+        """
+        badgeclass_name, ext = os.path.splitext(self.cached_badgeclass.image.name)
+        new_image = self.bake_badgeclass_image(self.get_json_to_bake(obi_version=UNVERSIONED_BAKED_VERSION))
+        self.image.save(name='assertion-{id}{ext}'.format(id=self.entity_id, ext=ext),
+                        content=ContentFile(new_image.read()),
+                        save=False)
+
+    def bake_badgeclass_image(self, json_to_bake):
+        """
+        Return a StringIO of the badgeclass image with json_to_bake baked into it
+        """
+        badgeclass = self.cached_badgeclass
+        new_image = StringIO.StringIO()
+        baking.bake(image_file=badgeclass.image,
+                    assertion_json_string=json_dumps(json_to_bake, indent=2),
+                    output_file=new_image,
+                    cache_key=(badgeclass.image.name, badgeclass.entity_version))
+        return new_image
+
+    def get_json_to_bake(self, obi_version=UNVERSIONED_BAKED_VERSION):
+        if obi_version == UNVERSIONED_BAKED_VERSION:
+            return self.get_json(obi_version=obi_version)
+        return self.get_json(
+            obi_version=obi_version,
+            expand_issuer=True,
+            expand_badgeclass=True,
+            include_extra=True
+        )
+
+    def get_virtual_baked_image(self, obi_version=UNVERSIONED_BAKED_VERSION):
+        """
+        Return an issuer.baking.BakedImage baked in memory with the same json as .image or BadgeInstanceBakedImage
+        would have for obi_version, used instead of them when settings.BADGR_VIRTUAL_BAKED_IMAGES is enabled.
+        """
+        badgeclass = self.cached_badgeclass
+        return baking.get_virtual_baked_image(
+            image_file=badgeclass.image,
+            assertion_json_string=json_dumps(self.get_json_to_bake(obi_version=obi_version), indent=2),
+            cache_key=(badgeclass.image.name, badgeclass.entity_version))
+
+    @staticmethod
+    def image_baking_deferred():
+        return getattr(settings, 'BADGR_DEFERRED_BAKING', False) or getattr(settings, 'BADGR_VIRTUAL_BAKED_IMAGES', False)
+
+    @property
+    def image_pending(self):
+        """
+        True if this is a local assertion whose baked image has been deferred or is virtual, and is not stored
+        """
+        return not self.image and not self.source_url and not self.revoked
+
+    def get_unstored_image_url(self):
+        """
+        The public url of an image that has not been stored yet, it is baked when requested
+        """
+        if self.image_pending:
+            return OriginSetting.HTTP + reverse('badgeinstance_image', kwargs={'entity_id': self.entity_id})
+
+    def schedule_image_baking(self):
+        """
+        Queue a task to bake the image of an assertion saved with BADGR_DEFERRED_BAKING once the transaction commits
+        """
+        from issuer.tasks import bake_assertion_image
+        entity_id = self.entity_id
+        transaction.on_commit(lambda: bake_assertion_image.delay(assertion_entity_id=entity_id))
+
+    def ensure_image_baked(self):
+        """
+        Bake and store the image now if it is still pending, used when an image is requested before the
+        deferred baking task has run. A cache lock keeps concurrent requests and tasks from baking the same
+        assertion twice, the losers wait for the winner's result.
+        """
+        if not self.image_pending or getattr(settings, 'BADGR_VIRTUAL_BAKED_IMAGES', False):
+            return
+
+        lock_key = "_lock_bake_badgeinstance_{}".format(self.pk)
+        lock_timeout = getattr(settings, 'BADGR_DEFERRED_BAKING_LOCK_TIMEOUT', 60)
+        give_up_at = time.time() + lock_timeout
+        while time.time() < give_up_at:
+            stored_name = BadgeInstance.objects.filter(pk=self.pk).values_list('image', flat=True).first()
+            if stored_name:
+                self.image.name = stored_name
+                return
+
+            if cache.add(lock_key, True, lock_timeout):
+                try:
+                    self.bake_image()
+                    # update only the image so fields changed since this instance was loaded are not overwritten
+                    BadgeInstance.objects.filter(pk=self.pk).update(image=self.image.name)
+                    self.publish()
+                finally:
+                    cache.delete(lock_key)
+                return
+
+            time.sleep(0.1)
+
     def save(self, *args, **kwargs):
-        if self.pk is None:
-            self.salt = uuid.uuid4().hex
-            self.created_at = datetime.datetime.now()
-
-            # do this now instead of in AbstractVersionedEntity.save() so we can use it for image name
-            if self.entity_id is None:
-                self.entity_id = generate_entity_uri()
-
-            if not self.image:
-                badgeclass_name, ext = os.path.splitext(self.badgeclass.image.file.name)
-                new_image = StringIO.StringIO()
-                bake(image_file=self.cached_badgeclass.image.file,
-                     assertion_json_string=json_dumps(self.get_json(obi_version=UNVERSIONED_BAKED_VERSION), indent=2),
-                     output_file=new_image)
-                self.image.save(name='assertion-{id}{ext}'.format(id=self.entity_id, ext=ext),
-                                content=ContentFile(new_image.read()),
-                                save=False)
+        is_new = self.pk is None
+        if is_new:
+            self.prepare_new_instance()
 
             try:
                 from badgeuser.models import CachedEmailAddress
@@ -754,24 +975,40 @@ class BadgeInstance(BaseAuditedModel,
         if self.revoked is False:
             self.revocation_reason = None
 
-        super(BadgeInstance, self).save(*args, **kwargs)
+        with transaction.atomic():
+            stored_counts = None if is_new else self.get_stored_recipient_counts()
+            BadgeInstance.objects.add_recipient_counts([
+                (self.badgeclass_id, self.issuer_id, stored_counts, self.get_recipient_counts())
+            ])
+            super(BadgeInstance, self).save(*args, **kwargs)
+
+            if is_new:
+                action = BadgeInstanceChange.ACTION_CREATED
+            elif self.revoked and stored_counts is not None and not stored_counts['revoked']:
+                action = BadgeInstanceChange.ACTION_REVOKED
+            else:
+                action = BadgeInstanceChange.ACTION_UPDATED
+            BadgeInstanceChange.objects.log([self], action)
+
+        if is_new and self.image_pending and not getattr(settings, 'BADGR_VIRTUAL_BAKED_IMAGES', False):
+            self.schedule_image_baking()
 
     def rebake(self, obi_version=CURRENT_OBI_VERSION, save=True):
         if self.source_url:
             # dont rebake imported assertions
             return
 
-        new_image = StringIO.StringIO()
-        bake(
-            image_file=self.cached_badgeclass.image.file,
-            assertion_json_string=json_dumps(self.get_json(obi_version=obi_version), indent=2),
-            output_file=new_image
-        )
+        if self.image_pending:
+            # deferred baking has not run yet, it will bake the current json
+            return self.ensure_image_baked()
+
+        new_image = self.bake_badgeclass_image(self.get_json(obi_version=obi_version))
         new_name = default_storage.save(self.image.name, ContentFile(new_image.read()))
         self.image.name = new_name
         if save:
             self.save()
 
+    @publish_coalesced
     def publish(self):
         super(BadgeInstance, self).publish()
         self.badgeclass.publish()
@@ -789,7 +1026,12 @@ class BadgeInstance(BaseAuditedModel,
     def delete(self, *args, **kwargs):
         badgeclass = self.badgeclass
         recipient_profile = self.cached_recipient_profile
-        super(BadgeInstance, self).delete(*args, **kwargs)
+        with transaction.atomic():
+            BadgeInstance.objects.add_recipient_counts([
+                (self.badgeclass_id, self.issuer_id, self.get_stored_recipient_counts(), None)
+            ])
+            BadgeInstanceChange.objects.log([self], BadgeInstanceChange.ACTION_DELETED)
+            super(BadgeInstance, self).delete(*args, **kwargs)
         badgeclass.publish()
         if recipient_profile:
             recipient_profile.publish()
@@ -797,6 +1039,29 @@ class BadgeInstance(BaseAuditedModel,
             self.recipient_user.publish()
         self.publish_delete('entity_id', 'revoked')
 
+    @classmethod
+    def recipient_counts(cls, revoked, acceptance):
+        """
+        The contribution of an assertion to the RecipientCounts of its badgeclass and issuer
+        """
+        return {
+            'issued': 1,
+            'revoked': int(revoked),
+            'accepted': int(acceptance == cls.ACCEPTANCE_ACCEPTED),
+            'rejected': int(acceptance == cls.ACCEPTANCE_REJECTED),
+        }
+
+    def get_recipient_counts(self):
+        return self.recipient_counts(self.revoked, self.acceptance)
+
+    def get_stored_recipient_counts(self):
+        """
+        The contribution of the stored row of this assertion, locked until the end of the transaction
+        """
+        stored = BadgeInstance.objects.select_for_update().filter(pk=self.pk).values('revoked', 'acceptance').first()
+        if stored is not None:
+            return self.recipient_counts(stored['revoked'], stored['acceptance'])
+
     def revoke(self, revocation_reason):
         if self.revoked:
             raise ValidationError("Assertion is already revoked")
@@ -806,7 +1071,7 @@ class BadgeInstance(BaseAuditedModel,
 
         self.revoked = True
         self.revocation_reason = revocation_reason
-        self.image.delete()
+        self.image.delete(save=False)
         self.save()
 
         # remove BadgeObjectiveAwards from badgebook if needed
@@ -891,7 +1156,16 @@ class BadgeInstance(BaseAuditedModel,
 
     @property
     def cached_recipient_profile(self):
+        from badgeuser.models import RecipientIdentifier
         from recipient.models import RecipientProfile
+        try:
+            indexed = RecipientIdentifier.cached.get(
+                identifier=RecipientIdentifier.normalize(self.recipient_identifier))
+        except RecipientIdentifier.DoesNotExist:
+            pass
+        else:
+            if indexed.cached_recipient_profile is not None:
+                return indexed.cached_recipient_profile
         try:
             return RecipientProfile.cached.get(recipient_identifier=self.recipient_identifier)
         except RecipientProfile.MultipleObjectsReturned:
@@ -901,16 +1175,28 @@ class BadgeInstance(BaseAuditedModel,
 
     @property
     def recipient_user(self):
-        from badgeuser.models import CachedEmailAddress
+        from badgeuser.models import RecipientIdentifier
         try:
-            email_address = CachedEmailAddress.cached.get(email=self.recipient_identifier)
-            if email_address.verified:
-                return email_address.user
-        except CachedEmailAddress.DoesNotExist:
+            return RecipientIdentifier.cached.get(
+                identifier=RecipientIdentifier.normalize(self.recipient_identifier)).cached_user
+        except RecipientIdentifier.DoesNotExist:
             pass
         return None
 
     def get_json(self, obi_version=CURRENT_OBI_VERSION, expand_badgeclass=False, expand_issuer=False, include_extra=True, use_canonical_id=False):
+        json = self.get_memoized_json(self._build_json, obi_version=obi_version, include_extra=include_extra,
+                                      use_canonical_id=use_canonical_id)
+
+        # the badgeclass and issuer are memoized separately, they change independently of the assertion
+        if expand_badgeclass and not self.revoked:
+            json['badge'] = self.cached_badgeclass.get_json(obi_version=obi_version, include_extra=include_extra)
+
+            if expand_issuer:
+                json['badge']['issuer'] = self.cached_issuer.get_json(obi_version=obi_version, include_extra=include_extra)
+
+        return json
+
+    def _build_json(self, obi_version=CURRENT_OBI_VERSION, include_extra=True, use_canonical_id=False):
         obi_version, context_iri = get_obi_context(obi_version)
 
         json = OrderedDict([
@@ -928,12 +1214,6 @@ class BadgeInstance(BaseAuditedModel,
                 json['image'] = image_info
                 json['image']['id'] = image_url
 
-        if expand_badgeclass:
-            json['badge'] = self.cached_badgeclass.get_json(obi_version=obi_version, include_extra=include_extra)
-
-            if expand_issuer:
-                json['badge']['issuer'] = self.cached_issuer.get_json(obi_version=obi_version, include_extra=include_extra)
-
         if self.revoked:
             return OrderedDict([
                 ('@context', context_iri),
@@ -1064,6 +1344,7 @@ class BadgeInstance(BaseAuditedModel,
     def get_baked_image_url(self, obi_version=CURRENT_OBI_VERSION):
         if obi_version == UNVERSIONED_BAKED_VERSION:
             # requested version is the one referenced in assertion.image
+            self.ensure_image_baked()
             return self.image.url
 
         try:
@@ -1072,17 +1353,8 @@ class BadgeInstance(BaseAuditedModel,
             # rebake
             baked_image = BadgeInstanceBakedImage(badgeinstance=self, obi_version=obi_version)
 
-            json_to_bake = self.get_json(
-                obi_version=obi_version,
-                expand_issuer=True,
-                expand_badgeclass=True,
-                include_extra=True
-            )
-            badgeclass_name, ext = os.path.splitext(self.badgeclass.image.file.name)
-            new_image = StringIO.StringIO()
-            bake(image_file=self.cached_badgeclass.image.file,
-                 assertion_json_string=json_dumps(json_to_bake, indent=2),
-                 output_file=new_image)
+            badgeclass_name, ext = os.path.splitext(self.cached_badgeclass.image.name)
+            new_image = self.bake_badgeclass_image(self.get_json_to_bake(obi_version=obi_version))
             baked_image.image.save(
                 name='assertion-{id}-{version}{ext}'.format(id=self.entity_id, ext=ext, version=obi_version),
                 content=ContentFile(new_image.read()),
@@ -1156,10 +1428,12 @@ class BadgeClassAlignment(OriginalJsonMixin, cachemodel.CacheModel):
     def publish(self):
         super(BadgeClassAlignment, self).publish()
         self.badgeclass.publish()
+        self.badgeclass.update_catalog()
 
     def delete(self, *args, **kwargs):
         super(BadgeClassAlignment, self).delete(*args, **kwargs)
         self.badgeclass.publish()
+        self.badgeclass.update_catalog()
 
     def get_json(self, obi_version=CURRENT_OBI_VERSION, include_context=False):
         json = OrderedDict()
@@ -1189,10 +1463,12 @@ class BadgeClassTag(cachemodel.CacheModel):
     def publish(self):
         super(BadgeClassTag, self).publish()
         self.badgeclass.publish()
+        self.badgeclass.update_catalog()
 
     def delete(self, *args, **kwargs):
         super(BadgeClassTag, self).delete(*args, **kwargs)
         self.badgeclass.publish()
+        self.badgeclass.update_catalog()
 
 
 class IssuerExtension(BaseOpenBadgeExtension):
@@ -1213,10 +1489,12 @@ class BadgeClassExtension(BaseOpenBadgeExtension):
     def publish(self):
         super(BadgeClassExtension, self).publish()
         self.badgeclass.publish()
+        self.badgeclass.update_catalog()
 
     def delete(self, *args, **kwargs):
         super(BadgeClassExtension, self).delete(*args, **kwargs)
         self.badgeclass.publish()
+        self.badgeclass.update_catalog()
 
 
 class BadgeInstanceExtension(BaseOpenBadgeExtension):
@@ -1229,3 +1507,375 @@ class BadgeInstanceExtension(BaseOpenBadgeExtension):
     def delete(self, *args, **kwargs):
         super(BadgeInstanceExtension, self).delete(*args, **kwargs)
         self.badgeinstance.publish()
+
+
+class BatchJob(BaseAuditedModel, BaseVersionedEntity):
+    """
+    A batch of assertions to issue or revoke, processed in chunks by issuer.tasks.process_batch_job_chunk
+    """
+    JOB_TYPE_ISSUE = 'issue'
+    JOB_TYPE_REVOKE = 'revoke'
+    JOB_TYPE_CHOICES = (
+        (JOB_TYPE_ISSUE, 'issue'),
+        (JOB_TYPE_REVOKE, 'revoke'),
+    )
+    job_type = models.CharField(max_length=254, choices=JOB_TYPE_CHOICES)
+
+    STATUS_PENDING = 'Pending'
+    STATUS_RUNNING = 'Running'
+    STATUS_COMPLETE = 'Complete'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETE, 'Complete'),
+    )
+    status = models.CharField(max_length=254, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    badgeclass = models.ForeignKey(BadgeClass, blank=True, null=True, default=None, on_delete=models.CASCADE)
+
+    total_count = models.PositiveIntegerField(default=0)
+    processed_count = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(blank=True, null=True, default=None)
+
+    objects = BatchJobManager()
+
+    @property
+    def cached_badgeclass(self):
+        if self.badgeclass_id:
+            return BadgeClass.cached.get(pk=self.badgeclass_id)
+
+    @cachemodel.cached_method(auto_publish=True)
+    def cached_chunks(self):
+        return list(self.batchjobchunk_set.all().order_by('chunk_index'))
+
+    @property
+    def results(self):
+        """
+        Per-row results of all processed chunks, in row order
+        """
+        return list(chain.from_iterable(chunk.results for chunk in self.cached_chunks() if chunk.is_processed))
+
+    def mark_running(self):
+        BatchJob.objects.filter(pk=self.pk, status=self.STATUS_PENDING).update(status=self.STATUS_RUNNING)
+
+    def record_chunk_results(self, chunk, results, success_count):
+        """
+        Store the results of a processed chunk and update the job progress counts.
+        Counts are updated in the database so chunks may be processed concurrently.
+        """
+        with transaction.atomic():
+            updated = BatchJobChunk.objects.filter(pk=chunk.pk, result_json__isnull=True).update(
+                result_json=json_dumps(results))
+            if not updated:
+                # another worker already processed this chunk
+                return False
+
+            BatchJob.objects.filter(pk=self.pk).update(
+                processed_count=F('processed_count') + len(results),
+                success_count=F('success_count') + success_count,
+                error_count=F('error_count') + (len(results) - success_count),
+            )
+            BatchJob.objects.filter(pk=self.pk, processed_count__gte=F('total_count')).exclude(
+                status=self.STATUS_COMPLETE).update(status=self.STATUS_COMPLETE, completed_at=timezone.now())
+
+        self.refresh_from_db()
+        self.publish()
+        return True
+
+
+class BatchJobChunk(cachemodel.CacheModel):
+    job = models.ForeignKey(BatchJob, on_delete=models.CASCADE)
+    chunk_index = models.PositiveIntegerField()
+    row_offset = models.PositiveIntegerField(default=0)
+    request_json = models.TextField()
+    result_json = models.TextField(blank=True, null=True, default=None)
+    claimed_at = models.DateTimeField(blank=True, null=True, default=None)
+
+    objects = BatchJobChunkManager()
+
+    class Meta:
+        unique_together = ('job', 'chunk_index')
+
+    def claim(self):
+        """
+        Atomically mark this chunk as taken by the calling worker.  Returns False if another task holds an unexpired
+        claim on it or already processed it, so a redelivered or duplicate task does not process the same rows twice.
+        A claim expires after BATCH_JOB_CHUNK_CLAIM_TIMEOUT seconds so the chunk of a worker that died can be retried.
+        """
+        claimed_at = timezone.now()
+        if not BatchJobChunk.objects.claimable().filter(pk=self.pk).update(claimed_at=claimed_at):
+            return False
+        self.claimed_at = claimed_at
+        return True
+
+    @property
+    def rows(self):
+        return json_loads(self.request_json)
+
+    @property
+    def is_processed(self):
+        return self.result_json is not None
+
+    @property
+    def results(self):
+        if self.result_json is not None:
+            return json_loads(self.result_json)
+        return []
+
+
+class RebakeJob(BaseAuditedModel):
+    """
+    A run of issuer.tasks.dispatch_rebake_job over the BadgeInstances matching its filters.
+
+    Assertions are walked in primary key order and split into RebakeJobChunks of at most chunk_size assertions,
+    last_dispatched_pk records how far the walk got so an interrupted job can be resumed.
+    """
+    STATUS_PENDING = 'Pending'
+    STATUS_RUNNING = 'Running'
+    STATUS_COMPLETE = 'Complete'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETE, 'Complete'),
+    )
+    status = models.CharField(max_length=254, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    obi_version = models.CharField(max_length=254, default=CURRENT_OBI_VERSION)
+    issuer = models.ForeignKey(Issuer, blank=True, null=True, default=None, on_delete=models.CASCADE)
+    badgeclass = models.ForeignKey(BadgeClass, blank=True, null=True, default=None, on_delete=models.CASCADE)
+    issued_after = models.DateTimeField(blank=True, null=True, default=None)
+    issued_before = models.DateTimeField(blank=True, null=True, default=None)
+    max_count = models.PositiveIntegerField(blank=True, null=True, default=None)
+    chunk_size = models.PositiveIntegerField(default=500)
+
+    last_dispatched_pk = models.PositiveIntegerField(default=0)
+    dispatched_count = models.PositiveIntegerField(default=0)
+    is_dispatched = models.BooleanField(default=False)
+
+    processed_count = models.PositiveIntegerField(default=0)
+    rebaked_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(blank=True, null=True, default=None)
+    completed_at = models.DateTimeField(blank=True, null=True, default=None)
+
+    def get_queryset(self):
+        """
+        The BadgeInstances to rebake, in primary key order
+        """
+        queryset = BadgeInstance.objects.filter(source_url__isnull=True, revoked=False)
+        if self.issuer_id:
+            queryset = queryset.filter(issuer_id=self.issuer_id)
+        if self.badgeclass_id:
+            queryset = queryset.filter(badgeclass_id=self.badgeclass_id)
+        if self.issued_after:
+            queryset = queryset.filter(issued_on__gte=self.issued_after)
+        if self.issued_before:
+            queryset = queryset.filter(issued_on__lt=self.issued_before)
+        return queryset.order_by('pk')
+
+    def mark_running(self):
+        RebakeJob.objects.filter(pk=self.pk, status=self.STATUS_PENDING).update(
+            status=self.STATUS_RUNNING, started_at=timezone.now())
+        self.refresh_from_db()
+
+    def dispatch_next_chunk(self):
+        """
+        Record the next chunk of the walk and advance the checkpoint, or mark the walk finished.
+        :return: the new RebakeJobChunk or None
+        """
+        limit = self.chunk_size
+        if self.max_count is not None:
+            limit = min(limit, self.max_count - self.dispatched_count)
+
+        pks = []
+        if limit > 0:
+            pks = list(self.get_queryset().filter(pk__gt=self.last_dispatched_pk).values_list('pk', flat=True)[:limit])
+
+        with transaction.atomic():
+            if not pks:
+                RebakeJob.objects.filter(pk=self.pk).update(is_dispatched=True)
+                self._complete_if_done()
+                self.refresh_from_db()
+                return None
+
+            chunk = RebakeJobChunk.objects.create(job=self, first_pk=pks[0], last_pk=pks[-1], assertion_count=len(pks))
+            self.last_dispatched_pk = pks[-1]
+            self.dispatched_count += len(pks)
+            RebakeJob.objects.filter(pk=self.pk).update(
+                last_dispatched_pk=self.last_dispatched_pk, dispatched_count=self.dispatched_count)
+        return chunk
+
+    def record_chunk_results(self, chunk, rebaked_count, failures):
+        """
+        Store the results of a processed chunk and update the job counts.
+        Counts are updated in the database so chunks may be processed concurrently.
+        """
+        with transaction.atomic():
+            updated = RebakeJobChunk.objects.filter(pk=chunk.pk, completed_at__isnull=True).update(
+                completed_at=timezone.now(),
+                rebaked_count=rebaked_count,
+                failed_count=len(failures),
+                failures_json=json_dumps(failures))
+            if not updated:
+                # another worker already processed this chunk
+                return False
+
+            RebakeJob.objects.filter(pk=self.pk).update(
+                processed_count=F('processed_count') + rebaked_count + len(failures),
+                rebaked_count=F('rebaked_count') + rebaked_count,
+                failed_count=F('failed_count') + len(failures),
+            )
+            self._complete_if_done()
+
+        self.refresh_from_db()
+        return True
+
+    def _complete_if_done(self):
+        if not self.rebakejobchunk_set.filter(completed_at__isnull=True).exists():
+            RebakeJob.objects.filter(pk=self.pk, is_dispatched=True).exclude(status=self.STATUS_COMPLETE).update(
+                status=self.STATUS_COMPLETE, completed_at=timezone.now())
+
+    @property
+    def failures(self):
+        return list(chain.from_iterable(
+            json_loads(c.failures_json) for c in self.rebakejobchunk_set.exclude(failures_json='[]').order_by('pk')))
+
+    @property
+    def assertions_per_second(self):
+        if not self.started_at:
+            return None
+        elapsed = ((self.completed_at or timezone.now()) - self.started_at).total_seconds()
+        if elapsed <= 0:
+            return None
+        return self.processed_count / elapsed
+
+    def get_report(self):
+        return OrderedDict([
+            ('job', self.pk),
+            ('status', self.status),
+            ('obi_version', self.obi_version),
+            ('dispatched', self.dispatched_count),
+            ('processed', self.processed_count),
+            ('rebaked', self.rebaked_count),
+            ('failed', self.failed_count),
+            ('checkpoint_pk', self.last_dispatched_pk),
+            ('assertions_per_second', self.assertions_per_second),
+            ('failures', self.failures),
+        ])
+
+
+class RebakeJobChunk(cachemodel.CacheModel):
+    job = models.ForeignKey(RebakeJob, on_delete=models.CASCADE)
+    first_pk = models.PositiveIntegerField()
+    last_pk = models.PositiveIntegerField()
+    assertion_count = models.PositiveIntegerField(default=0)
+    rebaked_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    failures_json = models.TextField(default='[]')
+    completed_at = models.DateTimeField(blank=True, null=True, default=None)
+
+    def get_queryset(self):
+        return self.job.get_queryset().filter(pk__gte=self.first_pk, pk__lte=self.last_pk)
+
+
+class ImageDerivative(cachemodel.CacheModel):
+    """
+    A resized rendition of a stored image, see issuer.derivatives
+    """
+    source_name = models.CharField(max_length=254, db_index=True)
+    format = models.CharField(max_length=32)
+    size = models.PositiveIntegerField()
+    name = models.CharField(max_length=254)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source_name', 'format', 'size')
+
+    def publish(self):
+        super(ImageDerivative, self).publish()
+        self.publish_by('source_name', 'format', 'size')
+
+    def delete(self, *args, **kwargs):
+        self.publish_delete('source_name', 'format', 'size')
+        return super(ImageDerivative, self).delete(*args, **kwargs)
+
+
+class BaseRecipientCounts(models.Model):
+    issued = models.IntegerField(default=0)
+    revoked = models.IntegerField(default=0)
+    accepted = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+
+    objects = RecipientCountsManager()
+
+    class Meta:
+        abstract = True
+
+    @property
+    def recipient_count(self):
+        return self.issued - self.revoked
+
+
+class BadgeClassRecipientCounts(BaseRecipientCounts):
+    owner_field = 'badgeclass'
+    badgeclass = models.OneToOneField('issuer.BadgeClass', primary_key=True, related_name='recipient_counts')
+
+
+class IssuerRecipientCounts(BaseRecipientCounts):
+    owner_field = 'issuer'
+    issuer = models.OneToOneField('issuer.Issuer', primary_key=True, related_name='recipient_counts')
+
+
+class BadgeInstanceChange(models.Model):
+    """
+    Append-only log of changes to assertions, written in the transaction that makes the change, see
+    BadgeInstanceChangeManager.  The sequence is the cursor of the assertion changes feed; deleted assertions leave a
+    tombstone.
+    """
+    ACTION_CREATED = 'created'
+    ACTION_UPDATED = 'updated'
+    ACTION_REVOKED = 'revoked'
+    ACTION_DELETED = 'deleted'
+    ACTION_CHOICES = (
+        (ACTION_CREATED, 'Created'),
+        (ACTION_UPDATED, 'Updated'),
+        (ACTION_REVOKED, 'Revoked'),
+        (ACTION_DELETED, 'Deleted'),
+    )
+
+    sequence = models.BigAutoField(primary_key=True)
+    # not foreign keys, so that changes outlive the assertion
+    badgeinstance_id = models.PositiveIntegerField()
+    entity_id = models.CharField(max_length=254)
+    issuer_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=254, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BadgeInstanceChangeManager()
+
+    class Meta:
+        index_together = (
+                ('issuer_id', 'sequence'),
+        )
+
+    @property
+    def cached_badgeinstance(self):
+        try:
+            return BadgeInstance.cached.get(pk=self.badgeinstance_id)
+        except BadgeInstance.DoesNotExist:
+            return None
+
+
+class BadgeInstanceChangeUser(models.Model):
+    """
+    A user with the changed assertion in one of their backpack collections
+    """
+    change = models.ForeignKey(BadgeInstanceChange, on_delete=models.CASCADE, related_name='users')
+    badgeuser_id = models.PositiveIntegerField()
+
+    class Meta:
+        index_together = (
+                ('badgeuser_id', 'change'),
+        )
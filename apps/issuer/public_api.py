@@ -1,26 +1,32 @@
-import StringIO
+import calendar
+import hashlib
 import os
 import re
 
-import cairosvg
-from PIL import Image
+from cryptography.fernet import InvalidToken
 from django.conf import settings
-from django.core.files.storage import DefaultStorage
+from django.core.files.storage import default_storage
 from django.core.urlresolvers import resolve, reverse, Resolver404, NoReverseMatch
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, HttpResponse, HttpResponseNotModified
 from django.shortcuts import redirect, render_to_response
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, quote_etag
 from django.views.generic import RedirectView
 from rest_framework import status, permissions
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
 import badgrlog
 import utils
 from backpack.models import BackpackCollection
 from entity.api import VersionedObjectMixin
+from issuer import derivatives, json_export
+from issuer.catalog import IssuerCatalog
 from mainsite.models import BadgrApp
+from mainsite.pagination import EncryptedCursorPagination
 from mainsite.utils import OriginSetting
 from .models import Issuer, BadgeClass, BadgeInstance
 
@@ -66,6 +72,7 @@ class JSONComponentView(VersionedObjectMixin, APIView, SlugToEntityIdRedirectMix
     authentication_classes = ()
     html_renderer_class = None
     template_name = 'public/bot_openbadge.html'
+    static_json_export = False
 
     def log(self, obj):
         pass
@@ -92,8 +99,61 @@ class JSONComponentView(VersionedObjectMixin, APIView, SlugToEntityIdRedirectMix
         if self.is_requesting_html():
             return HttpResponseRedirect(redirect_to=self.get_badgrapp_redirect())
 
-        json = self.get_json(request=request)
-        return Response(json)
+        static_json_url = self.get_static_json_url(request)
+        if static_json_url is not None:
+            return redirect(static_json_url)
+
+        etag = self.get_etag(request)
+        last_modified = self.get_last_modified(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            json = self.get_json(request=request)
+            response = Response(json)
+        return self.patch_cache_headers(response, etag, last_modified)
+
+    def get_static_json_url(self, request):
+        """
+        The url of the exported json to redirect to instead of building it, see settings.BADGR_STATIC_JSON_REDIRECT
+        """
+        if not (self.static_json_export and json_export.export_enabled() and
+                getattr(settings, 'BADGR_STATIC_JSON_REDIRECT', False)):
+            return None
+        obi_version = self._get_request_obi_version(request)
+        if request.GET.getlist('expand', []) or obi_version not in utils.OBI_VERSION_CONTEXT_IRIS:
+            return None
+        if not json_export.is_exportable(self.current_object) or not json_export.is_exported(self.current_object):
+            # not exported yet, or the export is older than the current json
+            return None
+        return json_export.get_export_url(self.current_object, obi_version)
+
+    def get_etag_objects(self, request):
+        """
+        The objects whose json is included in the response, override for views that expand related objects
+        """
+        return [self.current_object]
+
+    def get_etag(self, request):
+        """
+        A strong ETag for the json of current_object, computed without building the json
+        """
+        parts = [self.model.__name__, getattr(self.current_object, 'entity_id', ''),
+                 self._get_request_obi_version(request)]
+        parts.extend(sorted(request.GET.getlist('expand', [])))
+        parts.extend(o.get_json_version() for o in self.get_etag_objects(request))
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_last_modified(self, request):
+        updated = [o.updated_at for o in self.get_etag_objects(request) if getattr(o, 'updated_at', None)]
+        if updated:
+            return calendar.timegm(max(updated).utctimetuple())
+
+    def patch_cache_headers(self, response, etag, last_modified):
+        response['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, **getattr(settings, 'BADGR_PUBLIC_CACHE_CONTROL', {'public': True, 'max_age': 60}))
+        patch_vary_headers(response, ['Accept'])
+        return response
 
     def is_bot(self):
         bot_useragents = getattr(settings, 'BADGR_PUBLIC_BOT_USERAGENTS', ['LinkedInBot'])
@@ -153,6 +213,12 @@ class ImagePropertyDetailView(APIView, SlugToEntityIdRedirectMixin):
             self.log(current_object)
             return current_object
 
+    def get_unstored_image_response(self, request, current_object):
+        """
+        Override to respond for an object whose image is not in storage, return None to use the stored image
+        """
+        return None
+
     def get(self, request, **kwargs):
 
         entity_id = kwargs.get('entity_id')
@@ -162,50 +228,41 @@ class ImagePropertyDetailView(APIView, SlugToEntityIdRedirectMixin):
         elif current_object is None:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
+        unstored_response = self.get_unstored_image_response(request, current_object)
+        if unstored_response is not None:
+            return unstored_response
+
         image_prop = getattr(current_object, self.prop)
         if not bool(image_prop):
             return Response(status=status.HTTP_404_NOT_FOUND)
 
         image_type = request.query_params.get('type', 'original')
-        if image_type not in ['original', 'png']:
+        if image_type not in ['original', 'png', 'webp']:
             raise ValidationError(u"invalid image type: {}".format(image_type))
+        if image_type == 'original':
+            return redirect(image_prop.url)
 
-        image_url = image_prop.url
-        filename, ext = os.path.splitext(image_prop.name)
-        basename = os.path.basename(filename)
-        dirname = os.path.dirname(filename)
-        version_suffix = getattr(settings, 'CAIROSVG_VERSION_SUFFIX', '1')
-        new_name = '{dirname}/converted{version}/{basename}.png'.format(dirname=dirname, basename=basename, version=version_suffix)
-        storage = DefaultStorage()
+        size = request.query_params.get('size', None)
+        if size is None:
+            if image_type == 'png' and os.path.splitext(image_prop.name)[1].lower() == '.png':
+                return redirect(image_prop.url)
+            size = derivatives.DEFAULT_SIZE
+        elif not size.isdigit() or int(size) not in derivatives.get_sizes():
+            raise ValidationError(u"invalid image size: {}".format(size))
 
-        if image_type == 'original':
-            image_url = image_prop.url
-        elif image_type == 'png' and ext == '.svg':
-            if not storage.exists(new_name):
-                with storage.open(image_prop.name, 'rb') as input_svg:
-                    svg_buf = StringIO.StringIO()
-                    out_buf = StringIO.StringIO()
-                    cairosvg.svg2png(file_obj=input_svg, write_to=svg_buf)
-                    img = Image.open(svg_buf)
-                    img.thumbnail((400, 400))
-                    img.save(out_buf, format=image_type)
-                    storage.save(new_name, out_buf)
-            image_url = storage.url(new_name)
-        elif ext != '.png':
-            # attempt to use PIL to do desired image conversion
-            if not storage.exists(new_name):
-                with storage.open(image_prop.name, 'rb') as input_svg:
-                    out_buf = StringIO.StringIO()
-                    img = Image.open(input_svg)
-                    img.save(out_buf, format=image_type)
-                    storage.save(new_name, out_buf)
-            image_url = storage.url(new_name)
-
-        return redirect(image_url)
+        if image_type not in derivatives.get_formats():
+            image_type = 'png'
+
+        derivative = derivatives.get_derivative(image_prop.name, image_type, int(size))
+        if derivative is None:
+            # the rendition is being generated in the background, serve the original meanwhile
+            return redirect(image_prop.url)
+        return redirect(default_storage.url(derivative.name))
 
 
 class IssuerJson(JSONComponentView):
     permission_classes = (permissions.AllowAny,)
+    static_json_export = True
     model = Issuer
 
     def log(self, obj):
@@ -231,10 +288,67 @@ class IssuerBadgesJson(JSONComponentView):
     def log(self, obj):
         logger.event(badgrlog.IssuerBadgesRetrievedEvent(obj, self.request))
 
+    cursor_query_param = 'cursor'
+    catalog_page = None
+
+    def _encode_cursor(self, generation, index, after_pk):
+        cursor = '{}:{}:{}'.format(generation or '', index, '' if after_pk is None else after_pk)
+        return EncryptedCursorPagination().encode_cursor(bytes(cursor))
+
+    def _decode_cursor(self, cursor):
+        """
+        Return (generation, index, after_pk) of a cursor made by _encode_cursor
+        """
+        try:
+            cursor = EncryptedCursorPagination().decode_cursor(cursor)
+            generation, index, after_pk = cursor.split(':')
+            return generation or None, int(index), int(after_pk) if after_pk else None
+        except (InvalidToken, TypeError, ValueError):
+            raise ValidationError("Invalid cursor")
+
+    def get_catalog_page(self, request):
+        if self.catalog_page is None:
+            cursor = request.query_params.get(self.cursor_query_param, None)
+            generation, index, after_pk = self._decode_cursor(cursor) if cursor else (None, 0, None)
+            issuer_catalog = IssuerCatalog(self.current_object.pk, self._get_request_obi_version(request))
+            self.catalog_page = issuer_catalog.get_page(generation=generation, index=index, after_pk=after_pk)
+            self.catalog_after_pk = after_pk
+        return self.catalog_page
+
+    def get_link_header(self, request):
+        page = self.get_catalog_page(request)
+        url = request.build_absolute_uri()
+        links = []
+        if page.has_next:
+            after_pk = page.last_pk if page.last_pk is not None else self.catalog_after_pk
+            cursor = self._encode_cursor(page.generation, page.index + 1, after_pk)
+            links.append('<{}>; rel="next"'.format(replace_query_param(url, self.cursor_query_param, cursor)))
+        if page.has_previous:
+            cursor = self._encode_cursor(page.generation, page.index - 1, None)
+            links.append('<{}>; rel="prev"'.format(replace_query_param(url, self.cursor_query_param, cursor)))
+        if links:
+            return ', '.join(links)
+
+    def get(self, request, **kwargs):
+        response = super(IssuerBadgesJson, self).get(request, **kwargs)
+        if self.catalog_page is not None:
+            link_header = self.get_link_header(request)
+            if link_header:
+                response['Link'] = link_header
+        return response
+
     def get_json(self, request):
-        obi_version=self._get_request_obi_version(request)
+        return self.get_catalog_page(request).badges
 
-        return [b.get_json(obi_version=obi_version) for b in self.current_object.cached_badgeclasses()]
+    def get_etag(self, request):
+        page = self.get_catalog_page(request)
+        parts = [self.model.__name__, self.current_object.entity_id, self._get_request_obi_version(request),
+                 page.generation or '', str(page.index), page.version]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_last_modified(self, request):
+        # a catalog page changes whenever one of its badgeclasses publishes, the ETag alone validates it
+        return None
 
 
 class IssuerImage(ImagePropertyDetailView):
@@ -247,6 +361,7 @@ class IssuerImage(ImagePropertyDetailView):
 
 class BadgeClassJson(JSONComponentView):
     permission_classes = (permissions.AllowAny,)
+    static_json_export = True
     model = BadgeClass
 
     def log(self, obj):
@@ -262,6 +377,11 @@ class BadgeClassJson(JSONComponentView):
 
         return json
 
+    def get_etag_objects(self, request):
+        if 'issuer' in request.GET.getlist('expand', []):
+            return [self.current_object, self.current_object.cached_issuer]
+        return [self.current_object]
+
     def get_context_data(self, **kwargs):
         image_url = "{}{}?type=png".format(
             OriginSetting.HTTP,
@@ -300,6 +420,7 @@ class BadgeClassCriteria(RedirectView, SlugToEntityIdRedirectMixin):
 
 class BadgeInstanceJson(JSONComponentView):
     permission_classes = (permissions.AllowAny,)
+    static_json_export = True
     model = BadgeInstance
 
     def get_json(self, request):
@@ -312,6 +433,15 @@ class BadgeInstanceJson(JSONComponentView):
 
         return json
 
+    def get_etag_objects(self, request):
+        expands = request.GET.getlist('expand', [])
+        objects = [self.current_object]
+        if 'badge' in expands:
+            objects.append(self.current_object.cached_badgeclass)
+            if 'badge.issuer' in expands:
+                objects.append(self.current_object.cached_issuer)
+        return objects
+
     def get_context_data(self, **kwargs):
         image_url = "{}{}?type=png".format(
             OriginSetting.HTTP,
@@ -325,10 +455,43 @@ class BadgeInstanceJson(JSONComponentView):
         )
 
 
-class BadgeInstanceImage(ImagePropertyDetailView):
+class VirtualBakedImageMixin(object):
+    """
+    Serve an assertion image baked in memory when settings.BADGR_VIRTUAL_BAKED_IMAGES is enabled
+    """
+
+    @staticmethod
+    def use_virtual_baked_image(assertion):
+        return getattr(settings, 'BADGR_VIRTUAL_BAKED_IMAGES', False) and assertion.image_pending
+
+    def get_virtual_baked_image_response(self, request, assertion, obi_version):
+        baked_image = assertion.get_virtual_baked_image(obi_version=obi_version)
+        if baked_image is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if baked_image.etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(baked_image.content, content_type=baked_image.content_type)
+        response['ETag'] = quote_etag(baked_image.etag)
+        return response
+
+
+class BadgeInstanceImage(VirtualBakedImageMixin, ImagePropertyDetailView):
     model = BadgeInstance
     prop = 'image'
 
+    def get_unstored_image_response(self, request, assertion):
+        if not self.use_virtual_baked_image(assertion):
+            return None
+
+        if request.query_params.get('type', 'original') == 'png':
+            # a png conversion can not carry the baked assertion, use the badgeclass image
+            return redirect('{}?type=png'.format(
+                reverse('badgeclass_image', kwargs={'entity_id': assertion.cached_badgeclass.entity_id})))
+        return self.get_virtual_baked_image_response(request, assertion, utils.UNVERSIONED_BAKED_VERSION)
+
     def log(self, badge_instance):
         logger.event(badgrlog.BadgeInstanceDownloadedEvent(badge_instance, self.request))
 
@@ -336,6 +499,8 @@ class BadgeInstanceImage(ImagePropertyDetailView):
         obj = super(BadgeInstanceImage, self).get_object(slug)
         if obj and obj.revoked:
             return None
+        if obj:
+            obj.ensure_image_baked()
         return obj
 
 
@@ -356,8 +521,22 @@ class BackpackCollectionJson(JSONComponentView):
         )
         return json
 
+    def get_etag_objects(self, request):
+        if not self.current_object.published:
+            raise Http404
 
-class BakedBadgeInstanceImage(VersionedObjectMixin, APIView, SlugToEntityIdRedirectMixin):
+        expands = request.GET.getlist('expand', [])
+        objects = [self.current_object]
+        for assertion in self.current_object.cached_badgeinstances():
+            objects.append(assertion)
+            if 'badges.badge' in expands:
+                objects.append(assertion.cached_badgeclass)
+                if 'badges.badge.issuer' in expands:
+                    objects.append(assertion.cached_issuer)
+        return objects
+
+
+class BakedBadgeInstanceImage(VirtualBakedImageMixin, VersionedObjectMixin, APIView, SlugToEntityIdRedirectMixin):
     permission_classes = (permissions.AllowAny,)
     model = BadgeInstance
 
@@ -376,6 +555,9 @@ class BakedBadgeInstanceImage(VersionedObjectMixin, APIView, SlugToEntityIdRedir
 
         # self.log(assertion)
 
+        if self.use_virtual_baked_image(assertion):
+            return self.get_virtual_baked_image_response(request, assertion, requested_version)
+
         redirect_url = assertion.get_baked_image_url(obi_version=requested_version)
 
         return redirect(redirect_url, permanent=True)
@@ -9,7 +9,7 @@ from rest_framework import serializers
 
 import utils
 from badgeuser.serializers_v1 import BadgeUserProfileSerializerV1, BadgeUserIdentifierFieldV1
-from mainsite.drf_fields import ValidImageField
+from mainsite.drf_fields import ValidImageField, FileOrFallbackUrlField
 from mainsite.models import BadgrApp
 from mainsite.serializers import HumanReadableBooleanField, StripTagsCharField, MarkdownCharField, \
     OriginalJsonSerializerMixin
@@ -249,11 +249,32 @@ class EvidenceItemSerializer(serializers.Serializer):
         return attrs
 
 
+class BadgeInstanceListSerializerV1(serializers.ListSerializer):
+    def to_representation(self, data):
+        data = BadgeInstance.objects.prefetch_cached(data)
+        return super(BadgeInstanceListSerializerV1, self).to_representation(data)
+
+    def create(self, validated_data):
+        """
+        Issue all of the validated assertions with BadgeInstanceManager.bulk_issue(), one call per badgeclass.
+        Requires self.context to include request and badgeclass, like BadgeInstanceSerializerV1.create()
+        """
+        badgeclass = self.context.get('badgeclass')
+        assertions = []
+        for attrs in validated_data:
+            issue_kwargs = self.child.get_issue_kwargs(attrs)
+            issue_kwargs['recipient_identifier'] = issue_kwargs.pop('recipient_id')
+            assertions.append(issue_kwargs)
+
+        return BadgeInstance.objects.bulk_issue(
+            badgeclass, assertions, badgr_app=BadgrApp.objects.get_current(self.context.get('request')))
+
+
 class BadgeInstanceSerializerV1(OriginalJsonSerializerMixin, serializers.Serializer):
     created_at = serializers.DateTimeField(read_only=True)
     created_by = BadgeUserIdentifierFieldV1(read_only=True)
     slug = serializers.CharField(max_length=255, read_only=True, source='entity_id')
-    image = serializers.FileField(read_only=True)  # use_url=True, might be necessary
+    image = FileOrFallbackUrlField(file_attribute='image', fallback_url_method='get_unstored_image_url')  # use_url=True, might be necessary
     email = serializers.EmailField(max_length=1024, required=False, write_only=True)
     recipient_identifier = serializers.CharField(max_length=1024, required=False)
     recipient_type = serializers.CharField(default=BadgeInstance.RECIPIENT_TYPE_EMAIL)
@@ -275,6 +296,7 @@ class BadgeInstanceSerializerV1(OriginalJsonSerializerMixin, serializers.Seriali
 
     class Meta:
         apispec_definition = ('Assertion', {})
+        list_serializer_class = BadgeInstanceListSerializerV1
 
     def validate(self, data):
         if data.get('email') and not data.get('recipient_identifier'):
@@ -328,10 +350,9 @@ class BadgeInstanceSerializerV1(OriginalJsonSerializerMixin, serializers.Seriali
 
         return representation
 
-    def create(self, validated_data):
+    def get_issue_kwargs(self, validated_data):
         """
-        Requires self.context to include request (with authenticated request.user)
-        and badgeclass: issuer.models.BadgeClass.
+        Arguments to BadgeClass.issue() for validated_data, excluding badgr_app
         """
         evidence_items = []
 
@@ -345,7 +366,7 @@ class BadgeInstanceSerializerV1(OriginalJsonSerializerMixin, serializers.Seriali
         if submitted_items:
             evidence_items.extend(submitted_items)
 
-        return self.context.get('badgeclass').issue(
+        return dict(
             recipient_id=validated_data.get('recipient_identifier'),
             narrative=validated_data.get('narrative'),
             evidence=evidence_items,
@@ -353,11 +374,20 @@ class BadgeInstanceSerializerV1(OriginalJsonSerializerMixin, serializers.Seriali
             created_by=self.context.get('request').user,
             allow_uppercase=validated_data.get('allow_uppercase'),
             recipient_type=validated_data.get('recipient_type', BadgeInstance.RECIPIENT_TYPE_EMAIL),
-            badgr_app=BadgrApp.objects.get_current(self.context.get('request')),
             expires_at=validated_data.get('expires_at', None),
             extensions=validated_data.get('extension_items', None)
         )
 
+    def create(self, validated_data):
+        """
+        Requires self.context to include request (with authenticated request.user)
+        and badgeclass: issuer.models.BadgeClass.
+        """
+        return self.context.get('badgeclass').issue(
+            badgr_app=BadgrApp.objects.get_current(self.context.get('request')),
+            **self.get_issue_kwargs(validated_data)
+        )
+
     def update(self, instance, validated_data):
         updateable_fields = [
             'evidence_items',
@@ -8,10 +8,10 @@ from django.core.validators import URLValidator, EmailValidator, RegexValidator
 from rest_framework import serializers
 
 from badgeuser.models import BadgeUser
-from entity.serializers import DetailSerializerV2, EntityRelatedFieldV2, BaseSerializerV2
-from issuer.models import Issuer, IssuerStaff, BadgeClass, BadgeInstance
+from entity.serializers import DetailSerializerV2, EntityRelatedFieldV2, BaseSerializerV2, ListSerializerV2
+from issuer.models import Issuer, IssuerStaff, BadgeClass, BadgeInstance, BatchJob, BadgeInstanceChange
 from issuer.utils import generate_sha256_hashstring
-from mainsite.drf_fields import ValidImageField
+from mainsite.drf_fields import ValidImageField, FileOrFallbackUrlField
 from mainsite.models import BadgrApp
 from mainsite.serializers import (CachedUrlHyperlinkedRelatedField, StripTagsCharField, MarkdownCharField,
                                   HumanReadableBooleanField, OriginalJsonSerializerMixin)
@@ -341,6 +341,33 @@ class EvidenceItemSerializerV2(BaseSerializerV2, OriginalJsonSerializerMixin):
         return attrs
 
 
+class BadgeInstanceListSerializerV2(ListSerializerV2):
+    def to_representation(self, instance):
+        instance = BadgeInstance.objects.prefetch_cached(instance)
+        return super(BadgeInstanceListSerializerV2, self).to_representation(instance)
+
+    def create(self, validated_data):
+        """
+        Issue all of the validated assertions with BadgeInstanceManager.bulk_issue(), one call per badgeclass,
+        and return the new instances in the order they were submitted.
+        """
+        rows_by_badgeclass = OrderedDict()
+        for idx, attrs in enumerate(validated_data):
+            attrs = dict(attrs)
+            badgeclass = attrs.pop('badgeclass')
+            attrs.pop('issuer', None)
+            attrs['evidence'] = attrs.pop('evidence_items', None)
+            attrs['extensions'] = attrs.pop('extension_items', None)
+            rows_by_badgeclass.setdefault(badgeclass, []).append((idx, attrs))
+
+        new_instances = [None] * len(validated_data)
+        for badgeclass, rows in rows_by_badgeclass.items():
+            issued = BadgeInstance.objects.bulk_issue(badgeclass, [attrs for idx, attrs in rows])
+            for (idx, attrs), new_instance in zip(rows, issued):
+                new_instances[idx] = new_instance
+        return new_instances
+
+
 class BadgeInstanceSerializerV2(DetailSerializerV2, OriginalJsonSerializerMixin):
     openBadgeId = serializers.URLField(source='jsonld_id', read_only=True)
     createdAt = serializers.DateTimeField(source='created_at', read_only=True)
@@ -353,7 +380,7 @@ class BadgeInstanceSerializerV2(DetailSerializerV2, OriginalJsonSerializerMixin)
     issuer = EntityRelatedFieldV2(source='cached_issuer', required=False, queryset=Issuer.cached)
     issuerOpenBadgeId = serializers.URLField(source='issuer_jsonld_id', read_only=True)
 
-    image = serializers.FileField(read_only=True)
+    image = FileOrFallbackUrlField(file_attribute='image', fallback_url_method='get_unstored_image_url')
     recipient = BadgeRecipientSerializerV2(source='*', required=False)
 
     issuedOn = serializers.DateTimeField(source='issued_on', required=False)
@@ -371,6 +398,7 @@ class BadgeInstanceSerializerV2(DetailSerializerV2, OriginalJsonSerializerMixin)
 
     class Meta(DetailSerializerV2.Meta):
         model = BadgeInstance
+        list_serializer_class = BadgeInstanceListSerializerV2
         apispec_definition = ('Assertion', {
             'properties': OrderedDict([
                 ('entityId', {
@@ -493,9 +521,7 @@ class BadgeInstanceSerializerV2(DetailSerializerV2, OriginalJsonSerializerMixin)
         return instance
 
     def validate(self, data):
-        request = self.context.get('request', None)
-
-        if request and request.method != 'PUT':
+        if self.instance is None:
             # recipient and badgeclass are only required on create, ignored on update
             if 'recipient_identifier' not in data:
                 raise serializers.ValidationError({'recipient_identifier': ["This field is required"]})
@@ -519,3 +545,76 @@ class BadgeInstanceSerializerV2(DetailSerializerV2, OriginalJsonSerializerMixin)
             data['issuer'] = data['badgeclass'].issuer
 
         return data
+
+
+class BadgeInstanceChangeSerializerV2(BaseSerializerV2):
+    sequence = serializers.IntegerField(read_only=True)
+    action = serializers.ChoiceField(choices=BadgeInstanceChange.ACTION_CHOICES, read_only=True)
+    entityId = serializers.CharField(source='entity_id', read_only=True)
+    changedAt = serializers.DateTimeField(source='created_at', read_only=True)
+    # the current state of the assertion, null once it has been deleted
+    assertion = BadgeInstanceSerializerV2(source='cached_badgeinstance', read_only=True)
+
+
+class BatchJobSerializerV2(DetailSerializerV2):
+    createdAt = serializers.DateTimeField(source='created_at', read_only=True)
+    createdBy = EntityRelatedFieldV2(source='cached_creator', read_only=True)
+    jobType = serializers.CharField(source='job_type', read_only=True)
+    status = serializers.CharField(read_only=True)
+    badgeclass = EntityRelatedFieldV2(source='cached_badgeclass', read_only=True)
+
+    total = serializers.IntegerField(source='total_count', read_only=True)
+    processed = serializers.IntegerField(source='processed_count', read_only=True)
+    succeeded = serializers.IntegerField(source='success_count', read_only=True)
+    failed = serializers.IntegerField(source='error_count', read_only=True)
+    completedAt = serializers.DateTimeField(source='completed_at', read_only=True)
+
+    results = serializers.ListField(read_only=True)
+
+    class Meta(DetailSerializerV2.Meta):
+        model = BatchJob
+        apispec_definition = ('BatchJob', {
+            'properties': OrderedDict([
+                ('entityId', {
+                    'type': "string",
+                    'format': "string",
+                    'description': "Unique identifier for this BatchJob",
+                }),
+                ('entityType', {
+                    'type': "string",
+                    'format': "string",
+                    'description': "\"BatchJob\"",
+                }),
+                ('jobType', {
+                    'type': "string",
+                    'enum': [c[0] for c in BatchJob.JOB_TYPE_CHOICES],
+                    'description': "Whether the job issues or revokes Assertions",
+                }),
+                ('status', {
+                    'type': "string",
+                    'enum': [c[0] for c in BatchJob.STATUS_CHOICES],
+                    'description': "Processing status of the job",
+                }),
+                ('total', {
+                    'type': "integer",
+                    'description': "Number of rows submitted",
+                }),
+                ('processed', {
+                    'type': "integer",
+                    'description': "Number of rows processed so far",
+                }),
+                ('succeeded', {
+                    'type': "integer",
+                    'description': "Number of rows that were issued or revoked",
+                }),
+                ('failed', {
+                    'type': "integer",
+                    'description': "Number of rows that could not be issued or revoked",
+                }),
+                ('results', {
+                    'type': "array",
+                    'items': {'type': 'object'},
+                    'description': "Result of each processed row, identified by its zero-based row index",
+                }),
+            ])
+        })
@@ -6,13 +6,19 @@ import json
 import requests
 from celery.utils.log import get_task_logger
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
+from django.db import transaction
 from requests import ConnectionError
 import openbadges_bakery
 
 import badgrlog
-from issuer.models import BadgeClass, BadgeInstance
+from issuer import derivatives, json_export
+from issuer.models import Issuer, BadgeClass, BadgeInstance, BatchJob, BatchJobChunk, RebakeJob, RebakeJobChunk
 from issuer.utils import CURRENT_OBI_VERSION
 from mainsite.celery import app
+from mainsite.publish import coalesced_publish
 
 logger = get_task_logger(__name__)
 badgrLogger = badgrlog.BadgrLogger()
@@ -49,18 +55,94 @@ def notify_badgerank_of_badgeclass(self, badgeclass_pk):
 
 @app.task(bind=True)
 def rebake_all_assertions(self, obi_version=CURRENT_OBI_VERSION, max_count=None):
-    count = 0
-    assertions = BadgeInstance.objects.filter(source_url__is_null=True)
-    while max_count is None or count < max_count:
-        assertion = assertions[count]
-        rebake_assertion_image.delay(assertion_entity_id=assertion.entity_id, obi_version=obi_version)
-        count += 1
+    job = RebakeJob.objects.create(obi_version=obi_version, max_count=max_count,
+                                   chunk_size=getattr(settings, 'REBAKE_JOB_CHUNK_SIZE', 500))
+    dispatch_rebake_job.delay(job_pk=job.pk)
 
     return {
         'success': True,
-        'message': "Enqueued {} assertions for rebaking".format(count)
+        'message': "Started rebake job {}".format(job.pk)
     }
 
+
+@app.task(bind=True)
+def dispatch_rebake_job(self, job_pk):
+    """
+    Walk the assertions of a RebakeJob by primary key and enqueue a rebake_job_chunk for each chunk.
+    Running it again for an interrupted job re-enqueues its unfinished chunks and continues from the checkpoint.
+    """
+    try:
+        job = RebakeJob.objects.get(pk=job_pk)
+    except RebakeJob.DoesNotExist:
+        return {
+            'success': False,
+            'error': "Unknown rebake job pk={}".format(job_pk)
+        }
+
+    job.mark_running()
+
+    chunk_pks = list(job.rebakejobchunk_set.filter(completed_at__isnull=True).values_list('pk', flat=True))
+    for chunk_pk in chunk_pks:
+        rebake_job_chunk.delay(chunk_pk=chunk_pk)
+
+    dispatched = 0
+    while not job.is_dispatched:
+        chunk = job.dispatch_next_chunk()
+        if chunk is not None:
+            rebake_job_chunk.delay(chunk_pk=chunk.pk)
+            dispatched += 1
+
+    return {
+        'success': True,
+        'message': "Enqueued {} chunks of rebake job {}".format(len(chunk_pks) + dispatched, job.pk)
+    }
+
+
+@app.task(bind=True)
+def rebake_job_chunk(self, chunk_pk):
+    try:
+        chunk = RebakeJobChunk.objects.select_related('job').get(pk=chunk_pk)
+    except RebakeJobChunk.DoesNotExist:
+        return {
+            'success': False,
+            'error': "Unknown rebake job chunk pk={}".format(chunk_pk)
+        }
+
+    if chunk.completed_at is not None:
+        return {
+            'success': True,
+            'message': "Skipping already processed chunk pk={}".format(chunk_pk)
+        }
+
+    job = chunk.job
+    rebaked_count = 0
+    updated = []
+    failures = []
+    # publish once per chunk instead of the cascade of a save() per assertion
+    with coalesced_publish():
+        for assertion in chunk.get_queryset().select_related('badgeclass'):
+            try:
+                if assertion.image_pending:
+                    assertion.ensure_image_baked()
+                else:
+                    assertion.rebake(obi_version=job.obi_version, save=False)
+                    BadgeInstance.objects.filter(pk=assertion.pk).update(image=assertion.image.name)
+                    updated.append(assertion)
+                rebaked_count += 1
+            except Exception as e:
+                logger.exception("Failed to rebake assertion pk={}".format(assertion.pk))
+                failures.append({'entityId': assertion.entity_id, 'error': unicode(e)})
+
+        BadgeInstance.objects.publish_instances(updated)
+    job.record_chunk_results(chunk, rebaked_count, failures)
+
+    return {
+        'success': True,
+        'rebaked': rebaked_count,
+        'failed': len(failures)
+    }
+
+
 @app.task(bind=True)
 def rebake_assertion_image(self, assertion_entity_id=None, obi_version=CURRENT_OBI_VERSION):
 
@@ -83,3 +165,170 @@ def rebake_assertion_image(self, assertion_entity_id=None, obi_version=CURRENT_O
     return {
         'success': True
     }
+
+
+@app.task(bind=True)
+def bake_assertion_image(self, assertion_entity_id=None):
+    try:
+        assertion = BadgeInstance.objects.get(entity_id=assertion_entity_id)
+    except BadgeInstance.DoesNotExist:
+        return {
+            'success': False,
+            'error': "Unknown assertion entity_id={}".format(assertion_entity_id)
+        }
+
+    assertion.ensure_image_baked()
+
+    return {
+        'success': True
+    }
+
+
+@app.task(bind=True)
+def delete_stored_files(self, names=None):
+    for name in names or []:
+        default_storage.delete(name)
+
+    return {
+        'success': True
+    }
+
+
+@app.task(bind=True)
+def export_public_json(self, model_name=None, pk=None):
+    cache.delete(json_export.get_pending_export_key(model_name, pk))
+
+    model_cls = {'Issuer': Issuer, 'BadgeClass': BadgeClass, 'BadgeInstance': BadgeInstance}.get(model_name)
+    try:
+        if model_cls is None:
+            raise ObjectDoesNotExist
+        obj = model_cls.objects.get(pk=pk)
+    except ObjectDoesNotExist:
+        return {
+            'success': False,
+            'error': "Unknown {} pk={}".format(model_name, pk)
+        }
+
+    json_export.export_json(obj)
+
+    return {
+        'success': True
+    }
+
+
+@app.task(bind=True)
+def generate_image_derivatives(self, source_name=None):
+    cache.delete(derivatives.get_pending_derivatives_key(source_name))
+    derivatives.generate_derivatives(source_name)
+
+    return {
+        'success': True
+    }
+
+
+@app.task(bind=True)
+def process_batch_job(self, job_pk):
+    try:
+        job = BatchJob.objects.get(pk=job_pk)
+    except BatchJob.DoesNotExist:
+        return {
+            'success': False,
+            'error': "Unknown batch job pk={}".format(job_pk)
+        }
+
+    # chunks being processed are skipped until their claim expires
+    chunk_pks = list(BatchJobChunk.objects.claimable().filter(job=job).values_list('pk', flat=True))
+    for chunk_pk in chunk_pks:
+        process_batch_job_chunk.delay(chunk_pk=chunk_pk)
+
+    return {
+        'success': True,
+        'message': "Enqueued {} chunks of batch job {}".format(len(chunk_pks), job.entity_id)
+    }
+
+
+@app.task(bind=True)
+def process_batch_job_chunk(self, chunk_pk):
+    try:
+        chunk = BatchJobChunk.objects.select_related('job').get(pk=chunk_pk)
+    except BatchJobChunk.DoesNotExist:
+        return {
+            'success': False,
+            'error': "Unknown batch job chunk pk={}".format(chunk_pk)
+        }
+
+    if chunk.is_processed or not chunk.claim():
+        return {
+            'success': True,
+            'message': "Skipping already claimed chunk pk={}".format(chunk_pk)
+        }
+
+    job = chunk.job
+    job.mark_running()
+
+    rows = chunk.rows
+    success_key = 'issued' if job.job_type == BatchJob.JOB_TYPE_ISSUE else 'revoked'
+    # the rows and their results commit together, so a chunk abandoned by a dead worker has issued nothing when it is
+    # claimed again.  Publishes are flushed after the commit, outside of the error handling for the rows.
+    with coalesced_publish(), transaction.atomic():
+        try:
+            with transaction.atomic():
+                if job.job_type == BatchJob.JOB_TYPE_ISSUE:
+                    results = _issue_batch_job_rows(job, rows)
+                else:
+                    results = _revoke_batch_job_rows(job, rows)
+        except Exception:
+            logger.exception("Failed to process batch job chunk pk={}".format(chunk_pk))
+            results = [{success_key: False, 'reason': "server error"} for row in rows]
+        success_count = sum(1 for r in results if r[success_key])
+
+        for idx, result in enumerate(results):
+            result['row'] = chunk.row_offset + idx
+
+        if not job.record_chunk_results(chunk, results, success_count):
+            # another worker took over this chunk after our claim expired and recorded it first
+            transaction.set_rollback(True)
+            return {
+                'success': True,
+                'message': "Discarded results of chunk pk={} recorded by another worker".format(chunk_pk)
+            }
+
+    return {
+        'success': True,
+        'processed': len(results),
+        'succeeded': success_count
+    }
+
+
+def _issue_batch_job_rows(job, rows):
+    """
+    Validate each row with BadgeInstanceSerializerV2 and issue the valid ones in bulk
+    """
+    from issuer.serializers_v2 import BadgeInstanceSerializerV2
+
+    user = job.created_by
+    context = {'badgeclass': job.cached_badgeclass}
+    results = [None] * len(rows)
+    valid_rows = []
+    for idx, row in enumerate(rows):
+        serializer = BadgeInstanceSerializerV2(data=row, context=context)
+        if not serializer.is_valid():
+            results[idx] = dict(issued=False, reason="invalid assertion", fieldErrors=serializer.errors)
+        elif not user.has_perm('issuer.can_issue_badge', serializer.validated_data['badgeclass']):
+            results[idx] = dict(issued=False, reason="permission denied or object not found")
+        else:
+            valid_rows.append((idx, dict(serializer.validated_data, created_by=user)))
+
+    if valid_rows:
+        list_serializer = BadgeInstanceSerializerV2(many=True, context=context)
+        new_instances = list_serializer.create([attrs for idx, attrs in valid_rows])
+        for (idx, attrs), new_instance in zip(valid_rows, new_instances):
+            results[idx] = dict(issued=True, entityId=new_instance.entity_id, openBadgeId=new_instance.jsonld_id)
+
+    return results
+
+
+def _revoke_batch_job_rows(job, rows):
+    user = job.created_by
+    return BadgeInstance.objects.bulk_revoke_entity_ids(
+        rows, has_issuer_permission=lambda issuer: user.has_perm('issuer.is_staff', issuer))
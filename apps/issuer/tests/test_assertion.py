@@ -1,6 +1,7 @@
 # encoding: utf-8
 from __future__ import unicode_literals
 
+import io
 import json
 from unittest import skip
 
@@ -8,13 +9,17 @@ import dateutil.parser
 import png
 from django.apps import apps
 from django.core import mail
+from django.core.management import call_command
+from django.core.files.storage import default_storage
 from django.core.urlresolvers import reverse
+from django.test import override_settings
 from django.utils import timezone
 
 from mainsite.tests import BadgrTestCase, SetupIssuerHelper
 from openbadges_bakery import unbake
 
-from issuer.models import BadgeInstance, IssuerStaff
+from issuer.models import BadgeClass, BadgeClassRecipientCounts, BadgeInstance, BadgeInstanceChange, \
+    BadgeInstanceExtension, IssuerRecipientCounts, IssuerStaff
 from mainsite.utils import OriginSetting
 
 
@@ -49,6 +54,95 @@ class AssertionTests(SetupIssuerHelper, BadgrTestCase):
             '@context': u'https://w3id.org/openbadges/v2'
         }, v2_data)
 
+    @override_settings(BADGR_DEFERRED_BAKING=True)
+    def test_deferred_baking(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        # celery is eager, so the baking task runs as soon as the assertion is committed
+        test_assertion = test_badgeclass.issue(recipient_id='test1@email.test')
+        self.assertTrue(BadgeInstance.objects.get(pk=test_assertion.pk).image)
+
+        # an image requested before the task has run is baked on demand
+        BadgeInstance.objects.filter(pk=test_assertion.pk).update(image='')
+        test_assertion = BadgeInstance.objects.get(pk=test_assertion.pk)
+        test_assertion.publish()
+        self.assertTrue(test_assertion.image_pending)
+
+        response = self.client.get('/public/assertions/{}/image'.format(test_assertion.entity_id))
+        self.assertEqual(response.status_code, 302)
+
+        test_assertion = BadgeInstance.cached.get(entity_id=test_assertion.entity_id)
+        self.assertFalse(test_assertion.image_pending)
+        baked_data = json.loads(str(unbake(test_assertion.image)))
+        self.assertIn(test_assertion.entity_id, baked_data.get('id', baked_data.get('uid')))
+
+    @override_settings(BADGR_VIRTUAL_BAKED_IMAGES=True)
+    def test_virtual_baked_image(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        test_assertion = test_badgeclass.issue(recipient_id='test1@email.test')
+        test_assertion = BadgeInstance.objects.get(pk=test_assertion.pk)
+        self.assertFalse(test_assertion.image)
+
+        response = self.client.get('/v2/assertions/{}'.format(test_assertion.entity_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['result'][0]['image'], test_assertion.get_unstored_image_url())
+
+        # v1 backpack listings fall back to the same url
+        earned = test_badgeclass.issue(recipient_id=test_user.email)
+        for url in ('/v1/earner/badges', '/v1/earner/badges?summary=true'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([b['image'] for b in response.data], [earned.get_unstored_image_url()])
+
+        image_url = '/public/assertions/{}/image'.format(test_assertion.entity_id)
+        response = self.client.get(image_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        baked_data = json.loads(str(unbake(io.BytesIO(response.content))))
+        self.assertIn(test_assertion.entity_id, baked_data.get('id', baked_data.get('uid')))
+
+        response = self.client.get(image_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/public/assertions/{}/baked?v=2_0'.format(test_assertion.entity_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(BadgeInstance.objects.get(pk=test_assertion.pk).image)
+
+    def test_get_json_is_memoized_until_published(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        test_assertion = test_badgeclass.issue(recipient_id='test1@email.test')
+        test_assertion = BadgeInstance.cached.get(entity_id=test_assertion.entity_id)
+
+        test_assertion.get_json(obi_version='2_0', expand_badgeclass=True, expand_issuer=True)
+        with self.assertNumQueries(0):
+            json_2_0 = test_assertion.get_json(obi_version='2_0', expand_badgeclass=True, expand_issuer=True)
+        self.assertEqual(json_2_0['badge']['issuer']['name'], test_issuer.name)
+
+        # callers may modify the result without affecting the memoized json
+        json_2_0['recipient']['identity'] = 'modified'
+        self.assertNotEqual(test_assertion.get_json(obi_version='2_0')['recipient']['identity'], 'modified')
+        self.assertNotIn('narrative', test_assertion.get_json(obi_version='2_0'))
+
+        BadgeInstanceExtension.objects.create(badgeinstance=test_assertion, name='extensions:TestExtension',
+                                              original_json=json.dumps({'test': 'value'}))
+        self.assertEqual(test_assertion.get_json(obi_version='2_0')['extensions:TestExtension'], {'test': 'value'})
+
+        test_issuer.name = 'Renamed Issuer'
+        test_issuer.save()
+        json_2_0 = test_assertion.get_json(obi_version='2_0', expand_badgeclass=True, expand_issuer=True)
+        self.assertEqual(json_2_0['badge']['issuer']['name'], 'Renamed Issuer')
+
+        test_assertion.narrative = 'A new narrative'
+        test_assertion.save()
+        self.assertEqual(test_assertion.get_json(obi_version='2_0')['narrative'], 'A new narrative')
+
     def test_can_update_assertion(self):
         test_user = self.setup_user(authenticate=True)
         test_issuer = self.setup_issuer(owner=test_user)
@@ -518,6 +612,45 @@ class AssertionTests(SetupIssuerHelper, BadgrTestCase):
         ))
         self.assertEqual(response.status_code, 400)
 
+    def test_batch_revoke_assertions(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        first_assertion = test_badgeclass.issue(recipient_id='first@example.com')
+        second_assertion = test_badgeclass.issue(recipient_id='second@example.com')
+        image_name = BadgeInstance.objects.get(pk=first_assertion.pk).image.name
+        self.assertTrue(default_storage.exists(image_name))
+        self.assertFalse(BadgeInstance.cached.get(entity_id=first_assertion.entity_id).revoked)
+
+        other_user = self.setup_user(authenticate=False)
+        other_issuer = self.setup_issuer(owner=other_user)
+        other_assertion = self.setup_badgeclass(issuer=other_issuer).issue(recipient_id='third@example.com')
+
+        response = self.client.post('/v2/assertions/revoke', [
+            {'entityId': first_assertion.entity_id, 'revocationReason': 'First'},
+            {'entityId': second_assertion.entity_id, 'revocationReason': 'Second'},
+            {'entityId': first_assertion.entity_id, 'revocationReason': 'Again'},
+            {'entityId': other_assertion.entity_id, 'revocationReason': 'Other'},
+            {'entityId': 'doesnotexist', 'revocationReason': 'Missing'},
+            {'entityId': second_assertion.entity_id},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['result']
+        self.assertEqual([r['revoked'] for r in results], [True, True, False, False, False, False])
+        self.assertEqual(results[2]['reason'], "Assertion is already revoked")
+        self.assertEqual(results[3]['reason'], "permission denied or object not found")
+        self.assertEqual(results[4]['reason'], "permission denied or object not found")
+        self.assertEqual(results[5]['reason'], "revocationReason is required")
+
+        self.assertEqual(BadgeInstance.objects.get(pk=first_assertion.pk).revocation_reason, 'First')
+        self.assertEqual(BadgeInstance.objects.get(pk=second_assertion.pk).revocation_reason, 'Second')
+        self.assertFalse(BadgeInstance.objects.get(pk=other_assertion.pk).revoked)
+        self.assertTrue(BadgeInstance.cached.get(entity_id=first_assertion.entity_id).revoked)
+        self.assertFalse(default_storage.exists(image_name))
+
+        response = self.client.get('/public/assertions/{}.json'.format(second_assertion.entity_id))
+        self.assertDictContainsSubset(dict(revocationReason='Second', revoked=True), json.loads(response.content))
+
     def test_issue_svg_badge(self):
         test_user = self.setup_user(authenticate=True)
         test_issuer = self.setup_issuer(owner=test_user)
@@ -669,6 +802,103 @@ class AssertionTests(SetupIssuerHelper, BadgrTestCase):
             self.assertEqual(evidence[i].get('id'), expected[i].get('url'))
             self.assertEqual(evidence[i].get('narrative', None), expected[i].get('narrative', None))
 
+    def test_batch_assertions_issues_to_all_recipients(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        self.assertEqual(test_badgeclass.recipient_count(), 0)
+
+        recipients = ['first@example.com', 'Second@Example.com', 'third@example.com']
+        batch_assertion_props = {
+            'assertions': [{
+                "recipient": {
+                    "identity": recipient,
+                    "type": "email",
+                },
+                "narrative": "narrative for {}".format(recipient),
+            } for recipient in recipients]
+        }
+        response = self.client.post('/v2/badgeclasses/{badge}/issue'.format(
+            badge=test_badgeclass.entity_id
+        ), batch_assertion_props, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        returned_assertions = response.data.get('result')
+        self.assertEqual([a['recipient']['plaintextIdentity'] for a in returned_assertions],
+                         [r.lower() for r in recipients])
+        self.assertEqual(test_badgeclass.recipient_count(), len(recipients))
+
+        for returned in returned_assertions:
+            assertion = BadgeInstance.objects.get(entity_id=returned['entityId'])
+            self.assertEqual(assertion.entity_version, 2)
+            self.assertEqual(assertion.narrative.lower(), "narrative for {}".format(assertion.recipient_identifier))
+            self.assertIsNotNone(unbake(assertion.image))
+
+    def test_bulk_issue_creates_extensions(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        new_instances = BadgeInstance.objects.bulk_issue(test_badgeclass, [{
+            'recipient_identifier': 'recipient{}@example.com'.format(i),
+            'extensions': {'extensions:ExampleExtension': {'exampleProperty': i}},
+        } for i in range(3)], batch_size=2)
+        self.assertEqual(len(new_instances), 3)
+        self.assertEqual(test_badgeclass.recipient_count(), 3)
+
+        for i, new_instance in enumerate(new_instances):
+            assertion = BadgeInstance.cached.get(entity_id=new_instance.entity_id)
+            self.assertEqual(assertion.pk, new_instance.pk)
+            self.assertEqual(assertion.extension_items, {'extensions:ExampleExtension': {'exampleProperty': i}})
+
+    def test_bulk_issue_stores_evidence_like_create(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        evidence = [
+            {'evidence_url': 'http://example.com/evidence', 'narrative': ''},
+            {'evidence_url': 'http://example.com/evidence', 'narrative': ''},
+            {'evidence_url': None, 'narrative': 'Did the thing'},
+        ]
+
+        created = test_badgeclass.issue(recipient_id='created@example.com', evidence=evidence)
+        bulk = BadgeInstance.objects.bulk_issue(test_badgeclass, [
+            {'recipient_identifier': 'bulk@example.com', 'evidence': evidence}])[0]
+
+        def stored_evidence(assertion):
+            return list(assertion.badgeinstanceevidence_set.order_by('pk').values_list('evidence_url', 'narrative'))
+        self.assertEqual(stored_evidence(bulk), stored_evidence(created))
+        self.assertEqual(len(stored_evidence(bulk)), 3)
+
+        # the image was baked after the batch committed
+        self.assertTrue(BadgeInstance.objects.get(pk=bulk.pk).image)
+
+    def test_v1_batch_assertions_with_evidence(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        batch_assertion_props = {
+            'assertions': [
+                {'email': 'first@example.com', 'evidence': 'http://example.com/evidence/first'},
+                {'email': 'second@example.com', 'evidence_items': [
+                    {'evidence_url': 'http://example.com/evidence/second', 'narrative': 'second narrative'},
+                ]},
+            ],
+            'create_notification': False
+        }
+        response = self.client.post('/v1/issuer/issuers/{issuer}/badges/{badge}/batchAssertions'.format(
+            issuer=test_issuer.entity_id,
+            badge=test_badgeclass.entity_id
+        ), batch_assertion_props, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(test_badgeclass.recipient_count(), 2)
+
+        first, second = [BadgeInstance.objects.get(entity_id=a['slug']) for a in response.data]
+        self.assertEqual([e.evidence_url for e in first.evidence_items], ['http://example.com/evidence/first'])
+        self.assertEqual([e.narrative for e in second.evidence_items], ['second narrative'])
+
     def assertListOfDictsContainsSubset(self, expected, actual):
         for i in range(0, len(expected)):
             a = expected[i]
@@ -733,3 +963,274 @@ class V2ApiAssertionTests(SetupIssuerHelper, BadgrTestCase):
         response = self.client.post('/v2/badgeclasses/{badgeclass}/assertions'.format(
             badgeclass=other_badgeclass.entity_id), new_assertion_props, format='json')
         self.assertEqual(response.status_code, 404)
+
+
+class BatchJobTests(SetupIssuerHelper, BadgrTestCase):
+    @override_settings(BATCH_JOB_CHUNK_SIZE=2)
+    def test_issue_job_reports_progress_and_results(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        batch_assertion_props = {
+            'assertions': [
+                {'recipient': {'identity': 'first@example.com'}},
+                {'recipient': {'identity': 'second@example.com'}, 'issuedOn': 1512151153620},
+                {'recipient': {'identity': 'third@example.com'}},
+            ]
+        }
+        response = self.client.post('/v2/badgeclasses/{badge}/issue/jobs'.format(
+            badge=test_badgeclass.entity_id
+        ), batch_assertion_props, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_entity_id = response.data['result'][0]['entityId']
+        self.assertEqual(response['Location'], '/v2/batchjobs/{}'.format(job_entity_id))
+
+        response = self.client.get('/v2/batchjobs/{}'.format(job_entity_id))
+        self.assertEqual(response.status_code, 200)
+        job = response.data['result'][0]
+        self.assertEqual(job['status'], 'Complete')
+        self.assertEqual(job['total'], 3)
+        self.assertEqual(job['processed'], 3)
+        self.assertEqual(job['succeeded'], 2)
+        self.assertEqual(job['failed'], 1)
+        self.assertEqual([r['row'] for r in job['results']], [0, 1, 2])
+        self.assertEqual([r['issued'] for r in job['results']], [True, False, True])
+        self.assertIn('issuedOn', job['results'][1]['fieldErrors'])
+        self.assertEqual(test_badgeclass.recipient_count(), 2)
+
+        other_user = self.setup_user(authenticate=True)
+        response = self.client.get('/v2/batchjobs/{}'.format(job_entity_id))
+        self.assertEqual(response.status_code, 404)
+
+    def test_redelivered_chunk_is_not_issued_twice(self):
+        from issuer.models import BatchJobChunk
+        from issuer.tasks import process_batch_job_chunk
+
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        response = self.client.post('/v2/badgeclasses/{badge}/issue/jobs'.format(
+            badge=test_badgeclass.entity_id
+        ), {'assertions': [{'recipient': {'identity': 'first@example.com'}}]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(BadgeInstance.objects.filter(badgeclass=test_badgeclass).count(), 1)
+
+        # a duplicate delivery before the first one recorded its results finds the chunk claimed
+        chunk = BatchJobChunk.objects.get(job__entity_id=response.data['result'][0]['entityId'])
+        BatchJobChunk.objects.filter(pk=chunk.pk).update(result_json=None)
+        process_batch_job_chunk.delay(chunk_pk=chunk.pk)
+        self.assertEqual(BadgeInstance.objects.filter(badgeclass=test_badgeclass).count(), 1)
+
+    def test_abandoned_chunk_is_reclaimed(self):
+        import datetime
+        from issuer.models import BatchJob, BatchJobChunk
+        from issuer.tasks import process_batch_job
+
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        job = BatchJob.objects.create_job(BatchJob.JOB_TYPE_ISSUE, [{'recipient': {'identity': 'first@example.com'}}],
+                                          created_by=test_user, badgeclass=test_badgeclass)
+
+        # a worker claimed the chunk and died before recording its results
+        chunk = job.batchjobchunk_set.get()
+        BatchJobChunk.objects.filter(pk=chunk.pk).update(claimed_at=timezone.now())
+        process_batch_job.delay(job_pk=job.pk)
+        self.assertFalse(BadgeInstance.objects.filter(badgeclass=test_badgeclass).exists())
+
+        with override_settings(BATCH_JOB_CHUNK_CLAIM_TIMEOUT=60):
+            BatchJobChunk.objects.filter(pk=chunk.pk).update(claimed_at=timezone.now() - datetime.timedelta(minutes=5))
+            process_batch_job.delay(job_pk=job.pk)
+        self.assertEqual(BadgeInstance.objects.filter(badgeclass=test_badgeclass).count(), 1)
+        self.assertEqual(BatchJob.objects.get(pk=job.pk).status, BatchJob.STATUS_COMPLETE)
+
+    def test_revoke_job(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        assertion = test_badgeclass.issue(recipient_id='first@example.com')
+
+        other_user = self.setup_user(authenticate=False)
+        other_issuer = self.setup_issuer(owner=other_user)
+        other_assertion = self.setup_badgeclass(issuer=other_issuer).issue(recipient_id='second@example.com')
+
+        response = self.client.post('/v2/assertions/revoke/jobs', [
+            {'entityId': assertion.entity_id, 'revocationReason': 'Test'},
+            {'entityId': other_assertion.entity_id, 'revocationReason': 'Test'},
+        ], format='json')
+        self.assertEqual(response.status_code, 202)
+
+        response = self.client.get(response['Location'])
+        job = response.data['result'][0]
+        self.assertEqual(job['status'], 'Complete')
+        self.assertEqual([r['revoked'] for r in job['results']], [True, False])
+        self.assertTrue(BadgeInstance.objects.get(pk=assertion.pk).revoked)
+        self.assertFalse(BadgeInstance.objects.get(pk=other_assertion.pk).revoked)
+
+    def test_empty_job_is_rejected(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        response = self.client.post('/v2/badgeclasses/{badge}/issue/jobs'.format(
+            badge=test_badgeclass.entity_id
+        ), {'assertions': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipientCountsTests(SetupIssuerHelper, BadgrTestCase):
+    def assertCounts(self, counts, issued, revoked, accepted, rejected):
+        self.assertEqual((counts.issued, counts.revoked, counts.accepted, counts.rejected),
+                         (issued, revoked, accepted, rejected))
+
+    def test_counts_follow_issue_revoke_accept_and_delete(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        other_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        first = test_badgeclass.issue(recipient_id='first@example.test')
+        bulk = BadgeInstance.objects.bulk_issue(test_badgeclass, [
+            {'recipient_identifier': 'second@example.test'},
+            {'recipient_identifier': 'third@example.test', 'acceptance': BadgeInstance.ACCEPTANCE_ACCEPTED},
+        ])
+        other_badgeclass.issue(recipient_id='first@example.test')
+
+        first.acceptance = BadgeInstance.ACCEPTANCE_REJECTED
+        first.save()
+        bulk[1].revoke('Revoked')
+        BadgeInstance.objects.bulk_revoke([(bulk[0], 'Revoked')])
+        self.assertCounts(BadgeClassRecipientCounts.objects.get(pk=test_badgeclass.pk), 3, 2, 1, 1)
+        self.assertCounts(IssuerRecipientCounts.objects.get(pk=test_issuer.pk), 4, 2, 1, 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(test_badgeclass.recipient_count(), 1)
+            self.assertEqual(test_issuer.recipient_count, 2)
+
+        BadgeInstance.objects.get(pk=first.pk).delete()
+        self.assertEqual(test_badgeclass.recipient_count(), 0)
+        self.assertCounts(IssuerRecipientCounts.objects.get(pk=test_issuer.pk), 3, 2, 1, 0)
+
+        # deleting the badgeclass also deletes its revoked assertions
+        BadgeClass.objects.get(pk=test_badgeclass.pk).delete()
+        self.assertCounts(IssuerRecipientCounts.objects.get(pk=test_issuer.pk), 1, 0, 0, 0)
+
+    def test_reconcile_recipient_counts(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        assertions = [test_badgeclass.issue(recipient_id='{}@example.test'.format(i)) for i in range(3)]
+        assertions[0].revoke('Revoked')
+
+        BadgeClassRecipientCounts.objects.filter(pk=test_badgeclass.pk).update(issued=0, revoked=0)
+        IssuerRecipientCounts.objects.all().delete()
+        call_command('reconcile_recipient_counts', stdout=io.BytesIO())
+
+        self.assertCounts(BadgeClassRecipientCounts.objects.get(pk=test_badgeclass.pk), 3, 1, 0, 0)
+        self.assertCounts(IssuerRecipientCounts.objects.get(pk=test_issuer.pk), 3, 1, 0, 0)
+        self.assertEqual(BadgeClass.cached.get(pk=test_badgeclass.pk).recipient_count(), 2)
+
+
+@override_settings(BADGR_CHANGE_FEED_SETTLE_SECONDS=0)
+class BadgeInstanceChangeTests(SetupIssuerHelper, BadgrTestCase):
+    def test_changes_are_logged_in_sequence(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        first = test_badgeclass.issue(recipient_id='first@example.test')
+        bulk = BadgeInstance.objects.bulk_issue(test_badgeclass, [
+            {'recipient_identifier': 'second@example.test'},
+            {'recipient_identifier': 'third@example.test'},
+        ])
+        first.acceptance = BadgeInstance.ACCEPTANCE_ACCEPTED
+        first.save()
+        bulk[0].revoke('Revoked')
+        BadgeInstance.objects.bulk_revoke([(bulk[1], 'Revoked')])
+        first_entity_id = first.entity_id
+        BadgeInstance.objects.get(pk=first.pk).delete()
+
+        changes, has_more = BadgeInstanceChange.objects.get_feed([test_issuer.pk], [])
+        self.assertFalse(has_more)
+        self.assertEqual([(c.entity_id, c.action) for c in changes], [
+            (first_entity_id, BadgeInstanceChange.ACTION_CREATED),
+            (bulk[0].entity_id, BadgeInstanceChange.ACTION_CREATED),
+            (bulk[1].entity_id, BadgeInstanceChange.ACTION_CREATED),
+            (first_entity_id, BadgeInstanceChange.ACTION_UPDATED),
+            (bulk[0].entity_id, BadgeInstanceChange.ACTION_REVOKED),
+            (bulk[1].entity_id, BadgeInstanceChange.ACTION_REVOKED),
+            (first_entity_id, BadgeInstanceChange.ACTION_DELETED),
+        ])
+        self.assertIsNone(changes[-1].cached_badgeinstance)
+
+        page, has_more = BadgeInstanceChange.objects.get_feed([test_issuer.pk], [], after=changes[1].sequence, limit=2)
+        self.assertTrue(has_more)
+        self.assertEqual([c.sequence for c in page], [c.sequence for c in changes[2:4]])
+
+    def test_changes_to_collected_assertions_are_visible_to_collectors(self):
+        from backpack.models import BackpackCollection, BackpackCollectionBadgeInstance
+
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        earner = self.setup_user(email='earner@example.test', authenticate=False)
+
+        collected = test_badgeclass.issue(recipient_id='earner@example.test')
+        uncollected = test_badgeclass.issue(recipient_id='earner@example.test')
+        collection = BackpackCollection.objects.create(name='Collection', created_by=earner)
+        BackpackCollectionBadgeInstance.objects.create(collection=collection, badgeuser=earner, badgeinstance=collected)
+
+        collected.revoke('Revoked')
+        uncollected.revoke('Revoked')
+
+        changes, has_more = BadgeInstanceChange.objects.get_feed([], [earner.pk])
+        self.assertEqual([(c.entity_id, c.action) for c in changes],
+                         [(collected.entity_id, BadgeInstanceChange.ACTION_REVOKED)])
+
+        # an issuer that is also a collector sees each change once
+        changes, has_more = BadgeInstanceChange.objects.get_feed([test_issuer.pk], [earner.pk])
+        self.assertEqual(len(changes), len(set(c.sequence for c in changes)))
+        self.assertEqual(len(changes), 4)
+
+
+class AssertionExportTests(SetupIssuerHelper, BadgrTestCase):
+    def test_export_ndjson_and_csv(self):
+        test_user = self.setup_user(authenticate=True)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        assertions = [test_badgeclass.issue(recipient_id='{}@example.test'.format(i)) for i in range(3)]
+        assertions[0].revoke('Revoked')
+
+        with override_settings(BADGR_ASSERTION_EXPORT_CHUNK_SIZE=2):
+            response = self.client.get('/v2/issuers/{}/assertions/export'.format(test_issuer.entity_id))
+            self.assertEqual(response.status_code, 200)
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([r['entityId'] for r in rows], [a.entity_id for a in assertions])
+        self.assertEqual(rows[0]['badgeclass'], test_badgeclass.entity_id)
+        self.assertTrue(rows[0]['revoked'])
+
+        response = self.client.get('/v2/badgeclasses/{}/assertions/export'.format(test_badgeclass.entity_id), {
+            'output': 'csv', 'columns': 'entityId,recipientIdentifier', 'includeRevoked': 'false'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines, ['entityId,recipientIdentifier'] + [
+            '{},{}'.format(a.entity_id, a.recipient_identifier) for a in assertions[1:]])
+
+        response = self.client.get('/v2/issuers/{}/assertions/export'.format(test_issuer.entity_id), {
+            'columns': 'entityId,nope', 'issuedAfter': 'never'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['fieldErrors'].keys()), {'columns', 'issuedAfter'})
+
+    def test_export_assertions_command(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        test_badgeclass.issue(recipient_id='old@example.test', issued_on=dateutil.parser.parse('2017-01-01T00:00:00Z'))
+        new = test_badgeclass.issue(recipient_id='new@example.test')
+
+        out = io.StringIO()
+        call_command('export_assertions', issuer=test_issuer.entity_id, columns='entityId',
+                     issued_after=dateutil.parser.parse('2018-01-01T00:00:00Z'), stdout=out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], [{'entityId': new.entity_id}])
@@ -0,0 +1,117 @@
+# encoding: utf-8
+from __future__ import unicode_literals
+
+import StringIO
+import json
+
+import openbadges_bakery
+
+from issuer import baking
+from issuer.models import BadgeInstance, RebakeJob
+from issuer.tasks import dispatch_rebake_job
+from mainsite.tests import BadgrTestCase, SetupIssuerHelper
+
+
+class BakingTests(SetupIssuerHelper, BadgrTestCase):
+    assertion_json = json.dumps({
+        'uid': 'abc123',
+        'verify': {'type': 'hosted', 'url': 'http://example.com/public/assertions/abc123?a=1&b="2"'},
+        'recipient': {'identity': 'test@example.com'}
+    }, indent=2)
+
+    def _bake_both(self, image_data, assertion_json, cache_key=None):
+        expected = StringIO.StringIO()
+        openbadges_bakery.bake(StringIO.StringIO(image_data), assertion_json, expected)
+        actual = StringIO.StringIO()
+        baking.bake(StringIO.StringIO(image_data), assertion_json, actual, cache_key=cache_key)
+        return expected.getvalue(), actual.getvalue()
+
+    def test_png_matches_openbadges_bakery(self):
+        with open(self.get_test_image_path(), 'rb') as f:
+            image_data = f.read()
+
+        expected, actual = self._bake_both(image_data, self.assertion_json, cache_key='test_png')
+        self.assertEqual(expected, actual)
+
+        # the previously baked assertion is replaced
+        expected, actual = self._bake_both(actual, json.dumps({'uid': 'rebaked'}))
+        self.assertEqual(expected, actual)
+        self.assertEqual(json.loads(openbadges_bakery.unbake(StringIO.StringIO(actual)))['uid'], 'rebaked')
+
+    def test_svg_matches_openbadges_bakery(self):
+        with open(self.get_test_svg_image_path(), 'rb') as f:
+            image_data = f.read()
+
+        for assertion_json in (self.assertion_json, 'http://example.com/public/assertions/abc123'):
+            expected, actual = self._bake_both(image_data, assertion_json, cache_key='test_svg')
+            self.assertEqual(expected, actual)
+
+    def test_cached_template_is_reused(self):
+        with open(self.get_test_image_path(), 'rb') as f:
+            image_data = f.read()
+
+        baking.template_cache.clear()
+        template = baking.get_baking_template(StringIO.StringIO(image_data), cache_key='cached_png')
+        self.assertIs(baking.get_baking_template(StringIO.StringIO(b''), cache_key='cached_png'), template)
+
+    def test_lru_cache_evicts_by_size(self):
+        cache = baking.LRUCache(max_size=10, size_of=len)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.get('a')
+        cache.set('c', 'xxxx')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'xxxx')
+        self.assertEqual(cache.current_size, 8)
+
+        cache.set('d', 'x' * 11)
+        self.assertIsNone(cache.get('d'))
+
+
+class RebakeJobTests(SetupIssuerHelper, BadgrTestCase):
+    def test_rebake_job_walks_filtered_assertions_in_chunks(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        other_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        assertions = [test_badgeclass.issue(recipient_id='test{}@example.com'.format(i)) for i in range(5)]
+        other_badgeclass.issue(recipient_id='other@example.com')
+        assertions[1].revoke('Revoked')
+
+        job = RebakeJob.objects.create(badgeclass=test_badgeclass, chunk_size=2)
+        dispatch_rebake_job.delay(job_pk=job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, RebakeJob.STATUS_COMPLETE)
+        self.assertEqual(job.rebakejobchunk_set.count(), 2)
+        self.assertEqual(job.processed_count, 4)
+        self.assertEqual(job.rebaked_count, 4)
+        self.assertEqual(job.failures, [])
+        self.assertEqual(job.last_dispatched_pk, assertions[-1].pk)
+
+        for assertion in BadgeInstance.objects.filter(badgeclass=test_badgeclass, revoked=False):
+            baked_json = json.loads(openbadges_bakery.unbake(assertion.image))
+            self.assertIn(assertion.entity_id, baked_json['id'])
+
+    def test_interrupted_rebake_job_resumes(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        for i in range(5):
+            test_badgeclass.issue(recipient_id='test{}@example.com'.format(i))
+
+        # the walk was interrupted after recording a chunk but before it was processed
+        job = RebakeJob.objects.create(issuer=test_issuer, chunk_size=2, max_count=4)
+        job.mark_running()
+        first_chunk = job.dispatch_next_chunk()
+        self.assertEqual(job.dispatched_count, 2)
+
+        dispatch_rebake_job.delay(job_pk=job.pk)
+
+        job.refresh_from_db()
+        first_chunk.refresh_from_db()
+        self.assertIsNotNone(first_chunk.completed_at)
+        self.assertEqual(job.status, RebakeJob.STATUS_COMPLETE)
+        self.assertEqual(job.dispatched_count, 4)
+        self.assertEqual(job.processed_count, 4)
+        self.assertEqual(job.rebakejobchunk_set.count(), 2)
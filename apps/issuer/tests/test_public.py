@@ -3,15 +3,21 @@ from __future__ import unicode_literals
 
 import io
 import json
+import re
 
 import responses
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.test import override_settings
 from django.urls import reverse
 from openbadges.verifier.openbadges_context import OPENBADGES_CONTEXT_V1_URI, OPENBADGES_CONTEXT_V2_URI, \
     OPENBADGES_CONTEXT_V2_DICT
 from openbadges_bakery import unbake
 
 from backpack.tests import setup_resources, setup_basic_1_0
-from issuer.models import Issuer, BadgeInstance
+from issuer import derivatives, json_export
+from issuer.models import Issuer, BadgeInstance, ImageDerivative
 from issuer.utils import CURRENT_OBI_VERSION, OBI_VERSION_CONTEXT_IRIS, UNVERSIONED_BAKED_VERSION
 from mainsite.models import BadgrApp
 from mainsite.tests import BadgrTestCase, SetupIssuerHelper
@@ -212,6 +218,14 @@ class PublicAPITests(SetupIssuerHelper, BadgrTestCase):
         test_badgeclass = self.setup_badgeclass(issuer=test_issuer, name=original_badgeclass_name)
         assertion = test_badgeclass.issue(recipient_id='new.recipient@email.test')
 
+        # an export older than the current json is not redirected to
+        version_key = json_export.get_exported_version_key('BadgeInstance', assertion.entity_id)
+        exported_version = cache.get(version_key)
+        cache.set(version_key, 'stale')
+        response = self.client.get('/public/assertions/{}'.format(assertion.entity_id), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        cache.set(version_key, exported_version)
+
         response = self.client.get('/public/assertions/{}?expand=badge'.format(assertion.entity_id), Accept='application/json')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data.get('badge', {}).get('name', None), original_badgeclass_name)
@@ -222,3 +236,141 @@ class PublicAPITests(SetupIssuerHelper, BadgrTestCase):
         response = self.client.get('/public/assertions/{}?expand=badge'.format(assertion.entity_id), Accept='application/json')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data.get('badge', {}).get('name', None), new_badgeclass_name)
+
+    def test_conditional_get_of_assertion_json(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        assertion = test_badgeclass.issue(recipient_id='new.recipient@email.test')
+        url = '/public/assertions/{}?expand=badge'.format(assertion.entity_id)
+
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertIn('max-age', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(url + '&v=1_1', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # changes to the expanded badgeclass are a new version of the assertion json
+        test_badgeclass.name = 'new badgeclass name'
+        test_badgeclass.save()
+        response = self.client.get(url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['badge']['name'], 'new badgeclass name')
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(BADGR_STATIC_JSON_EXPORT=True, BADGR_STATIC_JSON_REDIRECT=True)
+    def test_static_json_export(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        assertion = test_badgeclass.issue(recipient_id='new.recipient@email.test')
+
+        name = json_export.get_export_name('BadgeInstance', assertion.entity_id, '2_0')
+        with default_storage.open(name) as exported:
+            self.assertEqual(json.loads(exported.read()), json.loads(json.dumps(assertion.get_json(obi_version='2_0'))))
+        self.assertTrue(default_storage.exists(json_export.get_export_name('Issuer', test_issuer.entity_id, '1_1')))
+
+        response = self.client.get('/public/assertions/{}'.format(assertion.entity_id), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(name))
+
+        response = self.client.get('/public/assertions/{}?expand=badge'.format(assertion.entity_id),
+                                   HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        assertion.revoke('Revoked')
+        self.assertFalse(default_storage.exists(name))
+        response = self.client.get('/public/assertions/{}'.format(assertion.entity_id), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['revoked'])
+
+    def test_get_badgeclass_image_derivative(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        self.assertEqual(
+            ImageDerivative.objects.filter(source_name=test_badgeclass.image.name, format='png').count(),
+            len(derivatives.get_sizes()))
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/public/badges/{}/image?type=png&size=64'.format(test_badgeclass.entity_id))
+            self.assertEqual(response.status_code, 302)
+        derivative = ImageDerivative.objects.get(source_name=test_badgeclass.image.name, format='png', size=64)
+        self.assertTrue(response['Location'].endswith(derivative.name))
+        with default_storage.open(derivative.name) as derivative_file:
+            self.assertEqual(max(Image.open(derivative_file).size), 64)
+
+        response = self.client.get('/public/badges/{}/image?type=webp&size=64'.format(test_badgeclass.entity_id))
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.get('/public/badges/{}/image?type=png&size=65'.format(test_badgeclass.entity_id))
+        self.assertEqual(response.status_code, 400)
+
+        # a rendition missing from the manifest redirects to the original and is generated in the background
+        for derivative in ImageDerivative.objects.filter(source_name=test_badgeclass.image.name):
+            derivative.delete()
+        response = self.client.get('/public/badges/{}/image?type=png&size=128'.format(test_badgeclass.entity_id))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(test_badgeclass.image.name))
+        self.assertTrue(ImageDerivative.objects.filter(source_name=test_badgeclass.image.name, size=128).exists())
+
+    @override_settings(BADGR_ISSUER_CATALOG_PAGE_SIZE=2)
+    def test_paginated_issuer_badges_json(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        badgeclasses = [self.setup_badgeclass(issuer=test_issuer, name='Badge {}'.format(i)) for i in range(3)]
+        url = '/public/issuers/{}/badges'.format(test_issuer.entity_id)
+
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([b['name'] for b in response.data], ['Badge 0', 'Badge 1'])
+        next_url = re.search(r'<([^>]+)>; rel="next"', response['Link']).group(1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(next_url, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual([b['name'] for b in response.data], ['Badge 2'])
+        self.assertNotIn('rel="next"', response['Link'])
+        self.assertIn('rel="prev"', response['Link'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(next_url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        # issuing does not touch the catalog
+        badgeclasses[2].issue(recipient_id='new.recipient@email.test')
+        response = self.client.get(next_url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # saving a badgeclass updates its page of the catalog in place
+        badgeclasses[2].name = 'Renamed badge'
+        badgeclasses[2].save()
+        response = self.client.get(next_url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([b['name'] for b in response.data], ['Renamed badge'])
+
+        self.setup_badgeclass(issuer=test_issuer, name='Badge 3')
+        response = self.client.get(next_url, HTTP_ACCEPT='application/json')
+        self.assertEqual([b['name'] for b in response.data], ['Renamed badge', 'Badge 3'])
+
+        badgeclasses[0].delete()
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual([b['name'] for b in response.data], ['Badge 1'])
+
+        # a cursor outliving its catalog resumes after the last badgeclass it served
+        cache.clear()
+        response = self.client.get(next_url, HTTP_ACCEPT='application/json')
+        self.assertEqual([b['name'] for b in response.data], ['Renamed badge'])
+        self.assertIn('rel="next"', response['Link'])
+
+        response = self.client.get(url + '?cursor=bogus', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -2,23 +2,32 @@ from django.conf.urls import url
 
 from issuer.api import (IssuerList, IssuerDetail, IssuerBadgeClassList, BadgeClassDetail, BadgeInstanceList,
                         BadgeInstanceDetail, IssuerBadgeInstanceList, AllBadgeClassesList, BatchAssertionsIssue,
-                        BatchAssertionsRevoke, IssuerTokensList, AssertionsChangedSince)
+                        BatchAssertionsRevoke, IssuerTokensList, AssertionsChangedSince, BatchAssertionsIssueJob,
+                        BatchAssertionsRevokeJob, BatchJobDetail, AssertionChangesFeed,
+                        IssuerAssertionsExport, BadgeClassAssertionsExport)
 
 urlpatterns = [
 
     url(r'^issuers$', IssuerList.as_view(), name='v2_api_issuer_list'),
     url(r'^issuers/(?P<entity_id>[^/]+)$', IssuerDetail.as_view(), name='v2_api_issuer_detail'),
     url(r'^issuers/(?P<entity_id>[^/]+)/assertions$', IssuerBadgeInstanceList.as_view(), name='v2_api_issuer_assertion_list'),
+    url(r'^issuers/(?P<entity_id>[^/]+)/assertions/export$', IssuerAssertionsExport.as_view(), name='v2_api_issuer_assertion_export'),
     url(r'^issuers/(?P<entity_id>[^/]+)/badgeclasses$', IssuerBadgeClassList.as_view(), name='v2_api_issuer_badgeclass_list'),
 
     url(r'^badgeclasses$', AllBadgeClassesList.as_view(), name='v2_api_badgeclass_list'),
     url(r'^badgeclasses/(?P<entity_id>[^/]+)$', BadgeClassDetail.as_view(), name='v2_api_badgeclass_detail'),
     url(r'^badgeclasses/(?P<entity_id>[^/]+)/issue$', BatchAssertionsIssue.as_view(), name='v2_api_badgeclass_issue'),
+    url(r'^badgeclasses/(?P<entity_id>[^/]+)/issue/jobs$', BatchAssertionsIssueJob.as_view(), name='v2_api_badgeclass_issue_job'),
     url(r'^badgeclasses/(?P<entity_id>[^/]+)/assertions$', BadgeInstanceList.as_view(), name='v2_api_badgeclass_assertion_list'),
+    url(r'^badgeclasses/(?P<entity_id>[^/]+)/assertions/export$', BadgeClassAssertionsExport.as_view(), name='v2_api_badgeclass_assertion_export'),
 
     url(r'^assertions/revoke$', BatchAssertionsRevoke.as_view(), name='v2_api_assertion_revoke'),
+    url(r'^assertions/revoke/jobs$', BatchAssertionsRevokeJob.as_view(), name='v2_api_assertion_revoke_job'),
     url(r'^assertions/changed$', AssertionsChangedSince.as_view(), name='v2_api_assertions_changed_list'),
+    url(r'^assertions/changes$', AssertionChangesFeed.as_view(), name='v2_api_assertion_changes_feed'),
     url(r'^assertions/(?P<entity_id>[^/]+)$', BadgeInstanceDetail.as_view(), name='v2_api_assertion_detail'),
 
+    url(r'^batchjobs/(?P<entity_id>[^/]+)$', BatchJobDetail.as_view(), name='v2_api_batchjob_detail'),
+
     url(r'^tokens/issuers$', IssuerTokensList.as_view(), name='v2_api_tokens_list'),
 ]
@@ -4,6 +4,7 @@ from __future__ import absolute_import
 
 from django.conf import settings
 from celery import Celery
+from celery.signals import task_prerun, task_postrun
 import os
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mainsite.settings_local')
@@ -12,3 +13,14 @@ app = Celery('mainsite')
 app.config_from_object('django.conf:settings')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
+
+@task_prerun.connect
+def begin_identity_map(**kwargs):
+    from mainsite import identity_map
+    identity_map.begin()
+
+
+@task_postrun.connect
+def end_identity_map(**kwargs):
+    from mainsite import identity_map
+    identity_map.end()
@@ -55,3 +55,22 @@ class ValidImageField(Base64FileField):
 
 
 
+
+
+class FileOrFallbackUrlField(FileField):
+    """
+    A read-only FileField of the object's file_attribute that represents an empty file with the url returned by
+    the object's fallback_url_method, e.g. an image that is generated on request instead of stored.
+    """
+    def __init__(self, file_attribute, fallback_url_method, **kwargs):
+        self.file_attribute = file_attribute
+        self.fallback_url_method = fallback_url_method
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super(FileOrFallbackUrlField, self).__init__(**kwargs)
+
+    def to_representation(self, obj):
+        value = getattr(obj, self.file_attribute)
+        if value:
+            return super(FileOrFallbackUrlField, self).to_representation(value)
+        return getattr(obj, self.fallback_url_method)()
@@ -0,0 +1,74 @@
+# encoding: utf-8
+"""
+A per-request and per-task identity map in front of the cachemodel managers.
+
+Inside a unit of work, repeated IdentityMapCacheModelManager.get() calls for the same (model, key) return the same
+in-memory object instead of fetching and unpickling it from the cache again.  Publishing or deleting an object evicts
+it, so the next lookup sees the published state.  Units of work are opened by IdentityMapMiddleware for requests and
+by the celery task signals in mainsite.celery for tasks, and nest: only the outermost one clears the map.
+"""
+from __future__ import unicode_literals
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+_state = threading.local()
+
+
+class IdentityMap(object):
+    def __init__(self):
+        self.objects = {}
+        self.keys_by_instance = defaultdict(set)
+
+    @staticmethod
+    def get_instance_key(instance):
+        return instance._meta.concrete_model, instance.pk
+
+    def get(self, key):
+        return self.objects.get(key)
+
+    def add(self, key, instance):
+        self.objects[key] = instance
+        self.keys_by_instance[self.get_instance_key(instance)].add(key)
+
+    def evict(self, instance):
+        for key in self.keys_by_instance.pop(self.get_instance_key(instance), ()):
+            self.objects.pop(key, None)
+
+
+def get_identity_map():
+    return getattr(_state, 'identity_map', None)
+
+
+def begin():
+    if get_identity_map() is None:
+        _state.identity_map = IdentityMap()
+        _state.depth = 0
+    _state.depth += 1
+
+
+def end():
+    if get_identity_map() is None:
+        return
+    _state.depth -= 1
+    if _state.depth <= 0:
+        _state.identity_map = None
+
+
+@contextmanager
+def unit_of_work():
+    begin()
+    try:
+        yield get_identity_map()
+    finally:
+        end()
+
+
+def evict(instance):
+    """
+    Forget instance in the current unit of work, call when it is published or deleted
+    """
+    identity_map = get_identity_map()
+    if identity_map is not None and instance.pk is not None:
+        identity_map.evict(instance)
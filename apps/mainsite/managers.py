@@ -1,12 +1,87 @@
 # Created by wiggins@concentricsky.com on 4/18/16.
 import cachemodel
+from cachemodel import CACHE_FOREVER_TIMEOUT
+from cachemodel.utils import generate_cache_key
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import resolve, Resolver404
 
+from mainsite.identity_map import get_identity_map
 from mainsite.utils import OriginSetting
 
 
-class SlugOrJsonIdCacheModelManager(cachemodel.CacheModelManager):
+class IdentityMapCacheModelManager(cachemodel.CacheModelManager):
+    """
+    A CacheModelManager whose get() returns the object already loaded in the current unit of work,
+    see mainsite.identity_map
+    """
+    def get(self, **kwargs):
+        identity_map = get_identity_map()
+        if identity_map is None:
+            return super(IdentityMapCacheModelManager, self).get(**kwargs)
+
+        key = generate_cache_key([self.model.__name__, "get"], **kwargs)
+        obj = identity_map.get(key)
+        if obj is None:
+            obj = super(IdentityMapCacheModelManager, self).get(**kwargs)
+            identity_map.add(key, obj)
+        return obj
+
+    def _get_many_key_fields(self, field):
+        # get(pk=) and get(id=) are cached under different keys for the same object
+        pk_fields = ('pk', self.model._meta.pk.attname)
+        return pk_fields if field in pk_fields else (field,)
+
+    def get_many(self, values, field='pk'):
+        """
+        Return a dict of the objects whose field is one of values, keyed by value.
+
+        Objects are looked up in the current unit of work, then with one cache multi-get, then with a single IN query
+        whose results are cached with set_many.  Found objects are added to the identity map, so the get() calls of a
+        serializer that follow are served from memory.
+        """
+        key_fields = self._get_many_key_fields(field)
+        values = set(v for v in values if v is not None)
+        keys_by_value = {
+            v: [generate_cache_key([self.model.__name__, "get"], **{f: v}) for f in key_fields] for v in values
+        }
+        found = {}
+
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            for value, keys in keys_by_value.items():
+                for key in keys:
+                    obj = identity_map.get(key)
+                    if obj is not None:
+                        found[value] = obj
+                        break
+
+        missing = [v for v in values if v not in found]
+        if missing:
+            cached = cache.get_many([key for v in missing for key in keys_by_value[v]])
+            for value in missing:
+                obj = next((cached[key] for key in keys_by_value[value] if key in cached), None)
+                if obj is not None:
+                    found[value] = obj
+
+        missing = [v for v in values if v not in found]
+        if missing:
+            fetched = {}
+            for obj in self.get_queryset().filter(**{field + '__in': missing}):
+                value = getattr(obj, field)
+                found[value] = obj
+                for key in keys_by_value.get(value, []):
+                    fetched[key] = obj
+            cache.set_many(fetched, CACHE_FOREVER_TIMEOUT)
+
+        if identity_map is not None:
+            for value, obj in found.items():
+                for key in keys_by_value[value]:
+                    identity_map.add(key, obj)
+        return found
+
+
+class SlugOrJsonIdCacheModelManager(IdentityMapCacheModelManager):
     def __init__(self, slug_kwarg_name='slug', slug_field_name='slug'):
         super(SlugOrJsonIdCacheModelManager, self).__init__()
         self.slug_kwarg_name = slug_kwarg_name
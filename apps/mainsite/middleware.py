@@ -1,5 +1,5 @@
 from django import http
-from mainsite import settings
+from mainsite import identity_map, settings
 
 
 class MaintenanceMiddleware(object):
@@ -22,3 +22,16 @@ class TrailingSlashMiddleware(object):
             if request.path != '/' and request.path[-1] == '/':
                 return http.HttpResponsePermanentRedirect(request.path[:-1])
         return None
+
+
+class IdentityMapMiddleware(object):
+    """Open a unit of work of the cachemodel identity map for each request, see mainsite.identity_map"""
+    def process_request(self, request):
+        identity_map.begin()
+        request._identity_map_started = True
+
+    def process_response(self, request, response):
+        if getattr(request, '_identity_map_started', False):
+            request._identity_map_started = False
+            identity_map.end()
+        return response
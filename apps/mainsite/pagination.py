@@ -1,3 +1,7 @@
+import base64
+import hashlib
+import hmac
+import json
 from collections import OrderedDict
 
 import more_itertools
@@ -5,7 +9,9 @@ import more_itertools
 from cryptography.fernet import Fernet
 
 from django.conf import settings
-from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections, transaction
+from django.db.models import Q
 
 from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
@@ -23,9 +29,16 @@ class EncryptedCursorPagination(BasePagination):
 
     Usage:
       * Ordering field (default: 'pk') of model to be paginated must be unique, not null, and monotonically increasing
+      * Or, ordering may be a tuple of fields such as ('-updated_at', '-pk') that together are unique and not null.  Pages
+        are then selected with a keyset comparison on those fields, a row-value comparison where the database supports
+        it, and should be backed by a compound index on the same fields.
       * Add PAGINATION_SECRET_KEY to settings.py.  Must be base64-encoded 32 byte random string [1].  For example:
         python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key())"
 
+      * Set PAGINATION_SIGNED_CURSORS = True to issue compact HMAC-signed cursors instead of encrypted ones.  Signed
+        cursors are tamper-proof but readable, and are bound to the ordering and to the bind_query_params of the
+        request.  Encrypted cursors are still accepted unless PAGINATION_ACCEPT_ENCRYPTED_CURSORS = False.
+
     [1] https://cryptography.io/en/latest/fernet/
     [2] http://www.django-rest-framework.org/api-guide/pagination/
 
@@ -128,11 +141,15 @@ class EncryptedCursorPagination(BasePagination):
 
     # Model field to use for ordering.  Must be unique, not null, and monotonically increasing.
     #
-    # TODO: Add support for non-unique keys.  This should be possible by adding support for ordering by multiple fields.
-    # For example, ordering = ('non_unique_field', 'pk') would fully disambiguate records. Would require  compound index
-    # on those fields for efficient queries.
+    # A tuple of model fields, each optionally prefixed with '-' for descending order, may be used for keys that are not
+    # unique on their own.  For example, ordering = ('non_unique_field', 'pk') fully disambiguates records.  Fields must
+    # be local to the model being paginated.
     ordering = 'pk'
 
+    # Run a query for the element before (or after, when paging backwards) the page to compute hasPrevious (hasNext).
+    # When False, a page reached from a cursor is assumed to have a previous (next) page, saving a query per page.
+    probe_adjacent = True
+
     pagination_secret_key = getattr(settings, 'PAGINATION_SECRET_KEY', None)
 
     if pagination_secret_key is not None:
@@ -142,6 +159,16 @@ class EncryptedCursorPagination(BasePagination):
         crypto = None
         encrypt = False
 
+    sign_cursors = getattr(settings, 'PAGINATION_SIGNED_CURSORS', False)
+    accept_encrypted_cursors = getattr(settings, 'PAGINATION_ACCEPT_ENCRYPTED_CURSORS', True)
+
+    # Query parameters that select the paginated queryset.  Signed cursors are only valid with the same values.
+    bind_query_params = ()
+
+    signature_length = 16
+
+    request = None
+
     def _get_cursor_limits(self, cursor):
         """
         Parse decrypted cursor and return (lower_limit, upper_limit).
@@ -157,12 +184,97 @@ class EncryptedCursorPagination(BasePagination):
 
         raise ValueError('Malformed cursor')
 
+    def _is_compound(self):
+        return not isinstance(self.ordering, basestring)
+
+    def _get_ordering(self):
+        """
+        Return compound ordering as a list of (field_name, descending) pairs.
+        """
+        return [(f[1:], True) if f.startswith('-') else (f, False) for f in self.ordering]
+
+    @staticmethod
+    def _get_field(model, field_name):
+        return model._meta.pk if field_name == 'pk' else model._meta.get_field(field_name)
+
     def _get_elem_key(self, elem):
         """
         Get ordering key for given element.
         """
+        if self._is_compound():
+            return json.dumps([self._get_field(elem, name).value_to_string(elem) for name, _ in self._get_ordering()])
         return str(getattr(elem, self.ordering))
 
+    def _parse_key(self, model, key):
+        """
+        Parse a compound ordering key into a list of (field, value) pairs.
+        """
+        try:
+            values = json.loads(key)
+        except ValueError:
+            raise ValueError('Malformed cursor')
+        ordering = self._get_ordering()
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError('Malformed cursor')
+
+        fields = [self._get_field(model, name) for name, _ in ordering]
+        try:
+            return [(field, field.to_python(value)) for field, value in zip(fields, values)]
+        except DjangoValidationError:
+            raise ValueError('Malformed cursor')
+
+    def _order_queryset(self, queryset, reverse=False):
+        """
+        Order queryset by the ordering key, or in reverse.
+        """
+        if self._is_compound():
+            return queryset.order_by(*[('-' if descending != reverse else '') + name
+                                       for name, descending in self._get_ordering()])
+        return queryset.order_by(('-' if reverse else '') + self.ordering)
+
+    def _filter_queryset(self, queryset, lookup, key):
+        """
+        Filter queryset to the elements whose ordering key compares to key by lookup, one of gt, gte, lt or lte.
+        """
+        if self._is_compound():
+            return self._filter_queryset_compound(queryset, lookup, key)
+        return queryset.filter(**{self.ordering + '__' + lookup: key})
+
+    def _filter_queryset_compound(self, queryset, lookup, key):
+        """
+        Compare the ordering fields to key as a row value, (a, b) > (x, y), when every field is ordered in the same
+        direction and the database supports row values, so that the comparison can seek a compound index.  Otherwise
+        expand it to a >= x AND ((a > x) OR (a = x AND b > y)), where the redundant first term lets the database range
+        scan an index on the leading field.
+        """
+        key = self._parse_key(queryset.model, key)
+        directions = [descending for _, descending in self._get_ordering()]
+        connection = connections[queryset.db]
+
+        if len(set(directions)) == 1 and _supports_row_values(connection):
+            if directions[0]:
+                lookup = _REVERSED_LOOKUPS[lookup]
+            qn = connection.ops.quote_name
+            columns = ['{}.{}'.format(qn(queryset.model._meta.db_table), qn(field.column)) for field, _ in key]
+            where = '({}) {} ({})'.format(', '.join(columns), _LOOKUP_OPERATORS[lookup], ', '.join(['%s'] * len(key)))
+            params = [field.get_db_prep_value(value, connection=connection) for field, value in key]
+            return queryset.extra(where=[where], params=params)
+
+        expr = None
+        for idx, ((field, value), descending) in enumerate(zip(key, directions)):
+            field_lookup = _REVERSED_LOOKUPS[lookup] if descending else lookup
+            if idx < len(key) - 1:
+                # only the last field may compare equal
+                field_lookup = field_lookup[:2]
+            term = Q(**{field.attname + '__' + field_lookup: value})
+            for prev_field, prev_value in key[:idx]:
+                term &= Q(**{prev_field.attname: prev_value})
+            expr = term if expr is None else expr | term
+
+        field, value = key[0]
+        leading_lookup = (_REVERSED_LOOKUPS[lookup] if directions[0] else lookup)[:2] + 'e'
+        return queryset.filter(Q(**{field.attname + '__' + leading_lookup: value}), expr)
+
     def _get_page_cursors(self, page):
         """
         Return (prev_cursor, next_cursor) for given page.
@@ -175,16 +287,62 @@ class EncryptedCursorPagination(BasePagination):
             return None, None
 
     def _decrypt_cursor(self, encrypted):
-        if encrypted is not None:
-            return self.crypto.decrypt(bytes(encrypted))
-        else:
+        if encrypted is None:
             return encrypted
+        if '.' in encrypted:
+            # Fernet tokens never contain a '.'
+            return self._verify_cursor(encrypted)
+        if self.sign_cursors and not self.accept_encrypted_cursors:
+            raise ValueError('Malformed cursor')
+        return self.crypto.decrypt(bytes(encrypted))
 
     def _encrypt_cursor(self, decrypted):
-        if decrypted is not None:
-            return self.crypto.encrypt(decrypted)
-        else:
+        if decrypted is None:
             return decrypted
+        if self.sign_cursors:
+            return self._sign_cursor(decrypted)
+        return self.crypto.encrypt(decrypted)
+
+    def encode_cursor(self, cursor):
+        """
+        Encrypt or sign cursor, if enabled, for a client
+        """
+        return self._encrypt_cursor(cursor) if self.encrypt else cursor
+
+    def decode_cursor(self, cursor):
+        """
+        Return the cursor a client sent, decrypted or verified if enabled
+        """
+        return self._decrypt_cursor(cursor) if self.encrypt else cursor
+
+    def _get_signing_key(self):
+        return hashlib.sha256(b'badgr.pagination.signed_cursor:' + bytes(self.pagination_secret_key)).digest()
+
+    def _get_signature(self, payload):
+        """
+        Return the truncated HMAC of payload in the context of the ordering and the bound query parameters.
+        """
+        ordering = self.ordering if not self._is_compound() else ','.join(self.ordering)
+        bound_params = []
+        if self.request is not None:
+            bound_params = [(name, self.request.query_params.getlist(name)) for name in sorted(self.bind_query_params)]
+        message = json.dumps([ordering, bound_params]) + b'\n' + payload
+        return hmac.new(self._get_signing_key(), message, hashlib.sha256).digest()[:self.signature_length]
+
+    def _sign_cursor(self, cursor):
+        payload = cursor.encode('utf-8') if isinstance(cursor, unicode) else cursor
+        return '{}.{}'.format(_urlsafe_b64encode(payload), _urlsafe_b64encode(self._get_signature(payload)))
+
+    def _verify_cursor(self, signed):
+        try:
+            encoded_payload, encoded_signature = bytes(signed).split(b'.')
+            payload = _urlsafe_b64decode(encoded_payload)
+            signature = _urlsafe_b64decode(encoded_signature)
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise ValueError('Malformed cursor')
+        if not hmac.compare_digest(signature, self._get_signature(payload)):
+            raise ValueError('Malformed cursor')
+        return payload
 
     def _build_url(self, request, cursor):
         if cursor is None:
@@ -215,6 +373,7 @@ class EncryptedCursorPagination(BasePagination):
         """
         Given a queryset and request, return a page as a list.
         """
+        self.request = request
         cursor = request.query_params.get(self.cursor_query_param, None)
 
         if self.encrypt:
@@ -227,32 +386,38 @@ class EncryptedCursorPagination(BasePagination):
         if lower_limit is not None:
             with transaction.atomic():
                 # Select up page_size + 1 elements in forward order to populate page and hasNext
-                padded_page = queryset.filter(**{self.ordering + '__gt': lower_limit}) \
-                                      .order_by(self.ordering)[:self.page_size + 1]
-                # Select element for hasPrevious
-                prev_elem = queryset.filter(**{self.ordering + '__lte': lower_limit}) \
-                                    .order_by('-' + self.ordering) \
-                                    .first()
+                padded_page = self._order_queryset(self._filter_queryset(queryset, 'gt', lower_limit))[:self.page_size + 1]
+                if self.probe_adjacent:
+                    # Select element for hasPrevious
+                    has_prev = self._order_queryset(self._filter_queryset(queryset, 'lte', lower_limit), reverse=True) \
+                                   .first() is not None
+                else:
+                    has_prev = True
 
             page, next_elem = self._partition_padded_page(padded_page)
+            has_next = next_elem is not None
         elif upper_limit is not None:
             with transaction.atomic():
                 # Select up page_size + 1 elements in reverse order to populate page and hasPrevious
-                padded_page = queryset.filter(**{self.ordering + '__lt': upper_limit}) \
-                                      .order_by('-' + self.ordering)[:self.page_size + 1]
-                # Select element for hasNext
-                next_elem = queryset.filter(**{self.ordering + '__gte': upper_limit}) \
-                                    .order_by(self.ordering) \
-                                    .first()
+                padded_page = self._order_queryset(self._filter_queryset(queryset, 'lt', upper_limit), reverse=True) \
+                                  [:self.page_size + 1]
+                if self.probe_adjacent:
+                    # Select element for hasNext
+                    has_next = self._order_queryset(self._filter_queryset(queryset, 'gte', upper_limit)).first() \
+                                   is not None
+                else:
+                    has_next = True
 
             page, prev_elem = self._partition_padded_page(padded_page)
             page = list(reversed(page))
+            has_prev = prev_elem is not None
         else:
             # Select up page_size + 1 elements in forward order to populate page and hasNext
-            padded_page = queryset.order_by(self.ordering)[:self.page_size + 1]
-            prev_elem = None  # Special case--hasPrevious is always False
+            padded_page = self._order_queryset(queryset)[:self.page_size + 1]
+            has_prev = False  # Special case--hasPrevious is always False
 
             page, next_elem = self._partition_padded_page(padded_page)
+            has_next = next_elem is not None
 
         prev_cursor, next_cursor = self._get_page_cursors(page)
 
@@ -263,8 +428,8 @@ class EncryptedCursorPagination(BasePagination):
         self.prev_link = self._build_url(request, prev_cursor)
         self.next_link = self._build_url(request, next_cursor)
 
-        self.has_prev = prev_cursor is not None and prev_elem is not None
-        self.has_next = next_cursor is not None and next_elem is not None
+        self.has_prev = prev_cursor is not None and has_prev
+        self.has_next = next_cursor is not None and has_next
 
         self.prev_cursor = prev_cursor
         self.next_cursor = next_cursor
@@ -298,3 +463,44 @@ class EncryptedCursorPagination(BasePagination):
         if len(links):
             return ', '.join(links)
 
+
+class DateOrderedCursorPagination(EncryptedCursorPagination):
+    """
+    Cursor pagination ordered by a non-unique date field, disambiguated by pk, either ascending or descending.
+    """
+    date_field = 'created_at'
+    descending = False
+
+    def __init__(self, date_field=None, descending=None):
+        if date_field is not None:
+            self.date_field = date_field
+        if descending is not None:
+            self.descending = descending
+        prefix = '-' if self.descending else ''
+        self.ordering = (prefix + self.date_field, prefix + 'pk')
+
+
+def _urlsafe_b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _urlsafe_b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+_LOOKUP_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+_REVERSED_LOOKUPS = {'gt': 'lt', 'gte': 'lte', 'lt': 'gt', 'lte': 'gte'}
+
+
+def _supports_row_values(connection):
+    """
+    Whether the database accepts row value comparisons and can range scan an index with them.  MySQL before 5.7
+    accepts them but scans the whole table.
+    """
+    if connection.vendor == 'sqlite':
+        from django.db.backends.sqlite3.base import Database
+        return Database.sqlite_version_info >= (3, 15, 0)
+    if connection.vendor == 'mysql':
+        return connection.mysql_version >= (5, 7)
+    return connection.vendor == 'postgresql'
@@ -0,0 +1,111 @@
+# encoding: utf-8
+"""
+Deduplicated CacheModel.publish() cascades.
+
+Inside a coalesced_publish() block, calls to a publish() method decorated with @publish_coalesced are recorded instead
+of run, deduplicated by (model, pk), and run once each when the outermost block exits, or when the surrounding
+transaction commits.  Publishes cascading from the flushed objects are deduplicated against the same set, so an
+issuer reached through a thousand assertions is published once.
+
+Each flushed publish() still writes its own cache keys through cachemodel, one round trip per key; the saving is in
+the number of publishes, not in batching their cache writes.
+
+Cached reads inside the block see the state from before the block; use it around batch work that does not read back
+what it publishes.
+"""
+from __future__ import unicode_literals
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import transaction
+
+_state = threading.local()
+
+
+class PublishCollector(object):
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.published = set()
+        self.publishing = []
+        self.flushing = False
+
+    @staticmethod
+    def get_key(instance):
+        return instance._meta.concrete_model, instance.pk
+
+    def add(self, instance):
+        key = self.get_key(instance)
+        if key in self.published:
+            return
+        # keep the most recent copy of the instance
+        self.pending.pop(key, None)
+        self.pending[key] = instance
+
+    def is_publishing(self, instance):
+        return bool(self.publishing) and self.publishing[-1] == self.get_key(instance)
+
+    def flush(self):
+        self.flushing = True
+        try:
+            while self.pending:
+                key, instance = self.pending.popitem(last=False)
+                self.published.add(key)
+                if instance.pk is None:
+                    # deleted since it was recorded
+                    continue
+                self.publishing.append(key)
+                try:
+                    instance.publish()
+                finally:
+                    self.publishing.pop()
+        finally:
+            self.flushing = False
+
+
+def get_collector():
+    return getattr(_state, 'collector', None)
+
+
+@contextmanager
+def coalesced_publish():
+    """
+    Defer and deduplicate publish() calls until the outermost block exits, or until commit if it exits inside a
+    transaction.  Deferred publishes are dropped if that transaction rolls back.
+    """
+    if get_collector() is not None:
+        yield get_collector()
+        return
+
+    collector = _state.collector = PublishCollector()
+    try:
+        yield collector
+    finally:
+        _state.collector = None
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: _flush(collector))
+        else:
+            _flush(collector)
+
+
+def _flush(collector):
+    _state.collector = collector
+    try:
+        collector.flush()
+    finally:
+        _state.collector = None
+
+
+def publish_coalesced(publish):
+    """
+    Decorator for CacheModel.publish() overrides that defers the publish to the active coalesced_publish() block
+    """
+    @wraps(publish)
+    def wrapper(self, *args, **kwargs):
+        collector = get_collector()
+        if collector is None or collector.is_publishing(self) or self.pk is None:
+            return publish(self, *args, **kwargs)
+        collector.add(self)
+    return wrapper
@@ -1,6 +1,7 @@
 from backports import csv
 import StringIO
 
+from django.http import StreamingHttpResponse
 from rest_framework import renderers
 
 
@@ -40,3 +41,56 @@ class CSVDictRenderer(renderers.BaseRenderer):
         writer.writerows(rows)
 
         return buff.getvalue().encode(self.charset)
+
+
+class _ChunkBuffer(object):
+    """
+    A file-like object that collects what is written to it until it is popped
+    """
+    def __init__(self):
+        self.values = []
+        self.size = 0
+
+    def write(self, value):
+        self.values.append(value)
+        self.size += len(value)
+
+    def pop(self):
+        value = u''.join(self.values)
+        self.values = []
+        self.size = 0
+        return value
+
+
+class StreamingCSVDictRenderer(CSVDictRenderer):
+    """
+    Renders an iterator of row dicts as CSV in chunks of about buffer_size characters, so that only one chunk is held
+    in memory at a time.  DRF Responses are rendered in full, so views return streaming_response() instead.
+    """
+    buffer_size = 64 * 1024
+
+    def __init__(self, buffer_size=None):
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
+
+    def iter_text(self, fieldnames, rowdicts):
+        buff = _ChunkBuffer()
+        writer = csv.DictWriter(buff, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in rowdicts:
+            writer.writerow(row)
+            if buff.size >= self.buffer_size:
+                yield buff.pop()
+        if buff.size:
+            yield buff.pop()
+
+    def iter_render(self, fieldnames, rowdicts):
+        for chunk in self.iter_text(fieldnames, rowdicts):
+            yield chunk.encode(self.charset)
+
+    def streaming_response(self, fieldnames, rowdicts, filename=None):
+        response = StreamingHttpResponse(self.iter_render(fieldnames, rowdicts),
+                                         content_type='{}; charset={}'.format(self.media_type, self.charset))
+        if filename is not None:
+            response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+        return response
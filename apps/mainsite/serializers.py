@@ -185,10 +185,13 @@ class OriginalJsonSerializerMixin(serializers.Serializer):
 class CursorPaginatedListSerializer(serializers.ListSerializer):
 
     def __init__(self, queryset, request, *args, **kwargs):
-        self.paginator = EncryptedCursorPagination()
+        self.paginator = self.get_paginator()
         self.page = self.paginator.paginate_queryset(queryset, request)
         super(CursorPaginatedListSerializer, self).__init__(data=self.page, *args, **kwargs)
 
+    def get_paginator(self):
+        return EncryptedCursorPagination()
+
     def to_representation(self, data):
         representation = super(CursorPaginatedListSerializer, self).to_representation(data)
         envelope = BaseSerializerV2.response_envelope(result=representation,
@@ -67,6 +67,7 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'mainsite.middleware.MaintenanceMiddleware',
+    'mainsite.middleware.IdentityMapMiddleware',
     'badgeuser.middleware.InactiveUserMiddleware',
     # 'mainsite.middleware.TrailingSlashMiddleware',
 ]
@@ -434,3 +435,51 @@ CELERY_ALWAYS_EAGER = True
 BADGERANK_NOTIFY_ON_BADGECLASS_CREATE = True
 BADGERANK_NOTIFY_ON_FIRST_ASSERTION = True
 BADGERANK_NOTIFY_URL = 'https://api.badgerank.org/v1/badgeclass/submit'
+
+# Number of rows processed by each celery task of an asynchronous batch issue/revoke job
+BATCH_JOB_CHUNK_SIZE = 100
+
+# Seconds a worker may hold a batch job chunk before the chunk is considered abandoned and may be processed again,
+# keep this longer than the slowest chunk takes to process
+BATCH_JOB_CHUNK_CLAIM_TIMEOUT = 600
+
+# Seconds the assertion changes feed holds back new changes, so that a change committed late by a slow transaction
+# still appears after the changes read before it.  Keep this longer than the slowest transaction that writes to the
+# change log: bulk issue and revoke requests, batch job chunks and deleting a badgeclass with many assertions.
+BADGR_CHANGE_FEED_SETTLE_SECONDS = 300
+
+# Save new assertions without a baked image and bake it in a celery task (or on first request) instead
+BADGR_DEFERRED_BAKING = False
+
+# Number of parsed badgeclass images kept in memory by issuer.baking
+BADGR_BAKING_TEMPLATE_CACHE_SIZE = 128
+
+# Never store baked assertion images, bake them in memory when requested
+BADGR_VIRTUAL_BAKED_IMAGES = False
+
+# Bytes of virtual baked images kept in memory by issuer.baking
+BADGR_VIRTUAL_BAKED_IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Number of assertions rebaked by each celery task of a rebake job, see the rebake_assertions command
+REBAKE_JOB_CHUNK_SIZE = 500
+
+# Number of Issuer, BadgeClass and BadgeInstance get_json() results memoized in each process
+BADGR_JSON_MEMO_SIZE = 1024
+
+# Cache-Control of the public Issuer, BadgeClass, Assertion and Collection json, as patch_cache_control() kwargs
+BADGR_PUBLIC_CACHE_CONTROL = {'public': True, 'max_age': 60}
+
+# Write the public json of issuers, badgeclasses and assertions to storage when they are published,
+# see the export_public_json command for a backfill
+BADGR_STATIC_JSON_EXPORT = False
+BADGR_STATIC_JSON_EXPORT_PREFIX = 'public-json'
+
+# Redirect public json requests without expand parameters to the exported files
+BADGR_STATIC_JSON_REDIRECT = False
+
+# Renditions generated for issuer, badgeclass and assertion images, see issuer.derivatives
+BADGR_IMAGE_DERIVATIVE_SIZES = (64, 128, 400)
+BADGR_IMAGE_DERIVATIVE_FORMATS = ('png', 'webp')
+
+# Badgeclasses per page of the public issuer badges json, see issuer.catalog
+BADGR_ISSUER_CATALOG_PAGE_SIZE = 100
@@ -4,6 +4,8 @@ from __future__ import unicode_literals
 from datetime import timedelta
 import os
 import random
+import shutil
+import tempfile
 import time
 
 from django.core.cache import cache
@@ -178,6 +180,20 @@ class CachingTestCase(TransactionTestCase):
     BADGR_APP_ID=1,
 )
 class BadgrTestCase(SetupUserHelper, APITransactionTestCase, CachingTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # files written to default_storage (baked images, derivatives, exported json) go to a throwaway MEDIA_ROOT
+        cls.media_root = tempfile.mkdtemp(prefix='badgr-test-media-')
+        cls.media_root_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_root_override.enable()
+        super(BadgrTestCase, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(BadgrTestCase, cls).tearDownClass()
+        cls.media_root_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
     def setUp(self):
         super(BadgrTestCase, self).setUp()
 
@@ -8,12 +8,16 @@ from allauth.account.models import EmailConfirmation
 from django.core import mail
 from django.core.cache import cache, CacheKeyWarning
 from django.core.management import call_command
-from django.test import override_settings, TransactionTestCase
+from django.db import transaction
+from django.test import override_settings, SimpleTestCase, TransactionTestCase
 
 from badgeuser.models import BadgeUser, CachedEmailAddress
+from issuer.models import BadgeClass, Issuer
 from mainsite.models import BadgrApp
-from mainsite import TOP_DIR
-from mainsite.tests.base import BadgrTestCase
+from mainsite import TOP_DIR, identity_map
+from mainsite.publish import coalesced_publish
+from mainsite.renderers import StreamingCSVDictRenderer
+from mainsite.tests.base import BadgrTestCase, SetupIssuerHelper
 
 
 class TestCacheSettings(TransactionTestCase):
@@ -140,3 +144,113 @@ class TestEmailCleanupCommand(BadgrTestCase):
         self.assertTrue(email_record.primary)
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(BadgeUser.objects.count(), 1)
+
+
+class TestCoalescedPublish(SetupIssuerHelper, BadgrTestCase):
+
+    def test_cascades_are_published_once(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+
+        published_issuers = []
+        publish_by = Issuer.publish_by
+
+        def counting_publish_by(issuer, *args):
+            if args == ('pk',):
+                published_issuers.append(issuer.pk)
+            return publish_by(issuer, *args)
+
+        Issuer.publish_by = counting_publish_by
+        try:
+            with coalesced_publish():
+                for i in range(5):
+                    test_badgeclass.issue(recipient_id='recipient{}@example.test'.format(i))
+                self.assertEqual(published_issuers, [])
+                # cached reads see the state from before the block until it exits
+                self.assertEqual(BadgeClass.cached.get(pk=test_badgeclass.pk).recipient_count(), 0)
+        finally:
+            Issuer.publish_by = publish_by
+
+        self.assertEqual(published_issuers, [test_issuer.pk])
+        self.assertEqual(BadgeClass.cached.get(pk=test_badgeclass.pk).recipient_count(), 5)
+
+    def test_rolled_back_publishes_are_dropped(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        original_name = test_issuer.name
+
+        try:
+            with transaction.atomic():
+                with coalesced_publish():
+                    test_issuer.name = 'Rolled back'
+                    test_issuer.save()
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertEqual(Issuer.cached.get(pk=test_issuer.pk).name, original_name)
+
+
+class TestIdentityMap(SetupIssuerHelper, BadgrTestCase):
+
+    def test_lookups_share_one_object_per_unit_of_work(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        test_badgeclass = self.setup_badgeclass(issuer=test_issuer)
+        assertions = [test_badgeclass.issue(recipient_id='recipient{}@example.test'.format(i)) for i in range(2)]
+
+        self.assertIsNot(assertions[0].cached_issuer, assertions[1].cached_issuer)
+
+        with identity_map.unit_of_work():
+            issuer = assertions[0].cached_issuer
+            self.assertIs(assertions[1].cached_issuer, issuer)
+            self.assertIs(Issuer.cached.get(entity_id=test_issuer.entity_id), Issuer.cached.get(entity_id=test_issuer.entity_id))
+
+            # publishing evicts the object so the next lookup sees the new state
+            other_copy = Issuer.objects.get(pk=test_issuer.pk)
+            other_copy.name = 'Renamed issuer'
+            other_copy.save()
+            self.assertEqual(assertions[0].cached_issuer.name, 'Renamed issuer')
+
+        self.assertIsNone(identity_map.get_identity_map())
+
+    def test_get_many_loads_the_unit_of_work(self):
+        test_user = self.setup_user(authenticate=False)
+        test_issuer = self.setup_issuer(owner=test_user)
+        badgeclasses = [self.setup_badgeclass(issuer=test_issuer) for i in range(3)]
+
+        with identity_map.unit_of_work():
+            found = BadgeClass.cached.get_many([b.pk for b in badgeclasses] + [None])
+            self.assertEqual(set(found.keys()), set(b.pk for b in badgeclasses))
+            with self.assertNumQueries(0):
+                for b in badgeclasses:
+                    self.assertIs(BadgeClass.cached.get(pk=b.pk), found[b.pk])
+                    self.assertIs(BadgeClass.cached.get(id=b.pk), found[b.pk])
+
+        # a later unit of work is served from the cache
+        with identity_map.unit_of_work():
+            with self.assertNumQueries(0):
+                found = BadgeClass.cached.get_many([b.pk for b in badgeclasses])
+            self.assertEqual(len(found), 3)
+
+
+class TestStreamingCSVDictRenderer(SimpleTestCase):
+
+    def test_rows_are_streamed_in_bounded_chunks(self):
+        renderer = StreamingCSVDictRenderer(buffer_size=64)
+        rowdicts = ({'id': i, 'name': u'r\xe9cipient {}'.format(i)} for i in range(100))
+
+        response = renderer.streaming_response(['id', 'name'], rowdicts, filename='report.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report.csv"')
+
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        # a chunk is flushed as soon as it reaches buffer_size, so it holds at most one row more
+        self.assertTrue(all(len(chunk.decode('utf-8')) < 64 + 20 for chunk in chunks))
+
+        lines = b''.join(chunks).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], u'id,name')
+        self.assertEqual(lines[1], u'0,r\xe9cipient 0')
+        self.assertEqual(len(lines), 101)
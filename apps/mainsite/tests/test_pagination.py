@@ -1,12 +1,18 @@
+import base64
 import json
+from datetime import timedelta
+
+from cryptography.fernet import Fernet
 
 from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
 
 from django_mock_queries.query import MockSet, MockModel
 
 from rest_framework.renderers import JSONRenderer
 
-from mainsite.pagination import EncryptedCursorPagination
+from badgeuser.models import TermsVersion
+from mainsite.pagination import EncryptedCursorPagination, DateOrderedCursorPagination
 
 from rest_framework.test import APIRequestFactory
 from rest_framework.request import Request
@@ -170,4 +176,128 @@ class TestEncryptedCursorPagination(TransactionTestCase):
                                          "previousResults": "ddd",
                                          "hasPrevious": "eee",
                                          "previousCursor": "fff",
-                                         "results": "ggg"})
\ No newline at end of file
+                                         "results": "ggg"})
+
+
+class CompoundCursorPagination(EncryptedCursorPagination):
+    ordering = ('created_at', 'pk')
+    encrypt = False
+    page_size = 2
+
+
+class TestCompoundCursorPagination(TestCase):
+    request_factory = APIRequestFactory()
+
+    def setUp(self):
+        # versions 1-3 share a created_at, so pages must be split on pk
+        now = timezone.now()
+        for version, days_ago in ((1, 1), (2, 1), (3, 1), (4, 0), (5, 2)):
+            terms = TermsVersion.objects.create(version=version)
+            TermsVersion.objects.filter(pk=terms.pk).update(created_at=now - timedelta(days=days_ago))
+
+    def _paginate(self, paginator, cursor=None):
+        url = '/' if cursor is None else '/?{}'.format(urlencode({'cursor': cursor}))
+        page = paginator.paginate_queryset(TermsVersion.objects.all(), Request(self.request_factory.get(url)))
+        return [t.version for t in page]
+
+    def _paginate_all(self, paginator_class, **kwargs):
+        versions = []
+        paginator = paginator_class(**kwargs)
+        versions.extend(self._paginate(paginator))
+        while paginator.has_next:
+            cursor = paginator.next_cursor
+            paginator = paginator_class(**kwargs)
+            versions.extend(self._paginate(paginator, cursor))
+        return versions, paginator
+
+    def test_paginate_forward(self):
+        versions, last_paginator = self._paginate_all(CompoundCursorPagination)
+        self.assertEqual(versions, [5, 1, 2, 3, 4])
+
+        paginator = CompoundCursorPagination()
+        self.assertEqual(self._paginate(paginator, last_paginator.prev_cursor), [2, 3])
+        self.assertTrue(paginator.has_prev)
+        self.assertTrue(paginator.has_next)
+
+    def test_paginate_descending(self):
+        versions, _ = self._paginate_all(DateOrderedCursorPagination, descending=True)
+        self.assertEqual(versions, [4, 3, 2, 1, 5])
+
+    def test_paginate_mixed_directions(self):
+        class MixedCursorPagination(CompoundCursorPagination):
+            ordering = ('-created_at', 'pk')
+
+        versions, _ = self._paginate_all(MixedCursorPagination)
+        self.assertEqual(versions, [4, 1, 2, 3, 5])
+
+    def test_skip_adjacent_probe(self):
+        class UnprobedCursorPagination(CompoundCursorPagination):
+            probe_adjacent = False
+
+        first_page = UnprobedCursorPagination()
+        self.assertEqual(self._paginate(first_page), [5, 1])
+        self.assertFalse(first_page.has_prev)
+
+        paginator = UnprobedCursorPagination()
+        self.assertEqual(self._paginate(paginator, first_page.next_cursor), [2, 3])
+        self.assertTrue(paginator.has_prev)
+
+    def test_malformed_compound_cursor_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self._paginate(CompoundCursorPagination(), 'foo:')
+
+        with self.assertRaises(ValueError):
+            self._paginate(CompoundCursorPagination(), '["not a date", "1"]:')
+
+
+class SignedCursorPagination(EncryptedCursorPagination):
+    pagination_secret_key = Fernet.generate_key()
+    crypto = Fernet(pagination_secret_key)
+    encrypt = True
+    sign_cursors = True
+    page_size = 2
+
+
+class TestSignedCursorPagination(TestCase):
+    request_factory = APIRequestFactory()
+
+    def _paginate(self, paginator, url):
+        queryset = MockSet(*[MockModel(pk=str(pk)) for pk in [1, 2, 3, 4, 5]])
+        return [int(e.pk) for e in paginator.paginate_queryset(queryset, Request(self.request_factory.get(url)))]
+
+    def test_signed_cursor_round_trip(self):
+        paginator = SignedCursorPagination()
+        self.assertEqual(self._paginate(paginator, '/'), [1, 2])
+        self.assertEqual(self._paginate(SignedCursorPagination(), paginator.next_link), [3, 4])
+
+    def test_tampered_cursor_is_rejected(self):
+        paginator = SignedCursorPagination()
+        self._paginate(paginator, '/')
+        payload, signature = paginator.next_cursor.split('.')
+        forged = '{}.{}'.format(base64.urlsafe_b64encode(b'3:').rstrip(b'='), signature)
+
+        with self.assertRaises(ValueError):
+            self._paginate(SignedCursorPagination(), '/?{}'.format(urlencode({'cursor': forged})))
+
+    def test_cursor_is_bound_to_query_params(self):
+        class BoundCursorPagination(SignedCursorPagination):
+            bind_query_params = ('since',)
+
+        paginator = BoundCursorPagination()
+        self._paginate(paginator, '/?since=2018')
+        self.assertEqual(self._paginate(BoundCursorPagination(), paginator.next_link), [3, 4])
+
+        with self.assertRaises(ValueError):
+            self._paginate(BoundCursorPagination(), '/?{}'.format(urlencode({
+                'since': '2017', 'cursor': paginator.next_cursor})))
+
+    def test_encrypted_cursors_are_accepted(self):
+        encrypted = SignedCursorPagination.crypto.encrypt(b'2:')
+        self.assertEqual(self._paginate(SignedCursorPagination(), '/?{}'.format(urlencode({'cursor': encrypted}))),
+                         [3, 4])
+
+        class StrictCursorPagination(SignedCursorPagination):
+            accept_encrypted_cursors = False
+
+        with self.assertRaises(ValueError):
+            self._paginate(StrictCursorPagination(), '/?{}'.format(urlencode({'cursor': encrypted})))
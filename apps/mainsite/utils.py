@@ -7,8 +7,10 @@ import StringIO
 import base64
 import hashlib
 import re
+import threading
 import urlparse
 import uuid
+from collections import OrderedDict
 
 import os
 import requests
@@ -152,3 +154,41 @@ def list_of(value):
     elif isinstance(value, list):
         return value
     return [value]
+
+
+class LRUCache(object):
+    """
+    A thread-safe least recently used cache holding at most max_size, as measured by size_of(value)
+    """
+    def __init__(self, max_size, size_of=None):
+        self.max_size = max_size
+        self.size_of = size_of if size_of is not None else (lambda value: 1)
+        self.current_size = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.pop(key, None)
+            if value is not None:
+                self._values[key] = value
+            return value
+
+    def set(self, key, value):
+        size = self.size_of(value)
+        with self._lock:
+            previous = self._values.pop(key, None)
+            if previous is not None:
+                self.current_size -= self.size_of(previous)
+            if size > self.max_size:
+                return
+            self._values[key] = value
+            self.current_size += size
+            while self.current_size > self.max_size:
+                evicted_key, evicted = self._values.popitem(last=False)
+                self.current_size -= self.size_of(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self.current_size = 0
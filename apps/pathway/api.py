@@ -1,8 +1,11 @@
 # Created by wiggins@concentricsky.com on 3/30/16.
+from collections import OrderedDict
+
 from rest_framework import status
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.status import HTTP_201_CREATED
+from rest_framework.utils.urls import replace_query_param
 
 from issuer.api_v1 import AbstractIssuerAPIEndpoint
 from issuer.models import Issuer
@@ -330,6 +333,7 @@ class PathwayElementDetail(PathwayElementAPIEndpoint):
 
 
 class PathwayCompletionDetail(PathwayElementAPIEndpoint):
+    max_recipients_per_page = 1000
 
     def get(self, request, issuer_slug, pathway_slug, element_slug, **kwargs):
         """
@@ -352,6 +356,16 @@ class PathwayCompletionDetail(PathwayElementAPIEndpoint):
               }
               required: false
               paramType: query
+            - name: num
+              description: Paginate the recipients, returning this many per page
+              type: integer
+              required: false
+              paramType: query
+            - name: page
+              description: The page of recipients to return when paginating, starting at 1
+              type: integer
+              required: false
+              paramType: query
         """
         issuer, pathway, element = self._get_issuer_and_pathway_element(issuer_slug, pathway_slug, element_slug)
         if issuer is None or pathway is None or element is None:
@@ -373,15 +387,45 @@ class PathwayCompletionDetail(PathwayElementAPIEndpoint):
             except RecipientGroup.DoesNotExist:
                 return Response(u"Invalid Recipient Group '{}'".format(s), status=status.HTTP_400_BAD_REQUEST)
 
-        for group in groups:
-            recipients.extend([member.recipient_profile for member in group.cached_members()])
-
-        recipient_completions = []
+        named_recipients = list(recipients)
+        memberships = [membership for group in groups for membership in group.cached_members()]
+        profiles = RecipientProfile.cached.get_many([m.recipient_profile_id for m in memberships])
+        recipients.extend(profiles[m.recipient_profile_id] for m in memberships if m.recipient_profile_id in profiles)
+        # a recipient named directly and in a group, or in several groups, is reported once
+        unique_recipients = OrderedDict()
         for recipient in recipients:
-            recipient_completions.append({
-                'recipient': recipient,
-                 'completions': recipient.cached_completions(pathway)
-            })
+            unique_recipients.setdefault(recipient.pk, recipient)
+        recipients = list(unique_recipients.values())
+
+        pagination = None
+        if 'num' in request.query_params:
+            try:
+                per_page = min(max(int(request.query_params.get('num')), 1), self.max_recipients_per_page)
+                page = max(int(request.query_params.get('page', 1)), 1)
+            except ValueError:
+                return Response(u"Invalid num or page", status=status.HTTP_400_BAD_REQUEST)
+            start = (page - 1) * per_page
+            has_next = len(recipients) > start + per_page
+            pagination = OrderedDict([
+                ('page', page),
+                ('num', per_page),
+                ('count', len(recipients)),
+                ('hasNext', has_next),
+            ])
+            if has_next:
+                pagination['nextResults'] = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+            recipients = recipients[start:start + per_page]
+
+        # recipients named directly are served from their cached instances, group members are evaluated in one batch
+        compiled = pathway.cached_compiled()
+        direct_pks = set(r.pk for r in named_recipients)
+        members = [r for r in recipients if r.pk not in direct_pks]
+        completions = dict(zip([r.pk for r in members], compiled.evaluate_recipients(members)))
+        recipient_completions = [{
+            'recipient': recipient,
+            'completions': completions[recipient.pk] if recipient.pk in completions
+                           else compiled.evaluate(recipient.cached_badge_instances())
+        } for recipient in recipients]
 
         serializer = PathwayElementCompletionSerializer(ObjectView({
             'pathway': pathway,
@@ -390,4 +434,7 @@ class PathwayCompletionDetail(PathwayElementAPIEndpoint):
             'recipientGroups': groups
         }))
 
-        return Response(serializer.data)
+        data = serializer.data
+        if pagination is not None:
+            data['pagination'] = pagination
+        return Response(data)
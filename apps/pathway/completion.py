@@ -0,0 +1,177 @@
+from collections import defaultdict
+
+from issuer.models import BadgeClass, BadgeInstance
+from pathway.completionspec import CompletionRequirementSpecFactory
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+class CompiledPathwayNode(object):
+    def __init__(self, index, element, completion_type=None, junction_type=None, required_number=None):
+        self.index = index
+        self.completion_type = completion_type
+        self.junction_type = junction_type
+        self.required_number = required_number
+        self.required = 0  # bitset of badges for a BadgeJunction, of nodes for an ElementJunction
+        self.required_bits = []  # the bits set in required, in the order they are reported
+        self.element = {
+            '@id': element.jsonld_id,
+            'slug': element.slug,
+        }
+        self.completion_badge = None
+        if element.completion_badgeclass_id:
+            completion_badgeclass = BadgeClass.cached.get(pk=element.completion_badgeclass_id)
+            self.completion_badge = {
+                '@id': completion_badgeclass.jsonld_id,
+                'slug': completion_badgeclass.entity_id,
+            }
+
+
+class CompiledPathway(object):
+    """
+    A pathway's element tree with every completion requirement parsed once, so that completions can be evaluated for
+    any number of recipients without rebuilding the tree or serializing badgeclasses.
+
+    Badges are numbered by their IRI and nodes in the order they are reported, children before their parents, so that
+    a recipient's completions are found in one pass of bitset operations over the nodes.
+    """
+
+    def __init__(self, pathway):
+        self.pathway_id = pathway.pk
+        self.nodes = []
+        self.badge_index = {}  # badgeclass IRI -> badge bit
+        self.badgeclass_bits = {}  # badgeclass pk -> badge bit
+        self.badges = []  # badge bit -> badgeclass reference
+
+        badgeclasses = {badgeclass.jsonld_id: badgeclass for badgeclass in pathway.cached_badgeclasses()}
+        self._compile(pathway.element_tree, badgeclasses, is_root=True)
+
+    @property
+    def badgeclass_ids(self):
+        """
+        The pks of the badgeclasses that count towards completing this pathway
+        """
+        return self.badgeclass_bits.keys()
+
+    def _badge_bit(self, iri, badgeclasses):
+        if iri not in self.badge_index:
+            bit = len(self.badges)
+            self.badge_index[iri] = bit
+            badgeclass = badgeclasses.get(iri)
+            if badgeclass is not None:
+                self.badgeclass_bits[badgeclass.pk] = bit
+                self.badges.append({'@id': badgeclass.jsonld_id, 'slug': badgeclass.entity_id})
+            else:
+                # no badgeclass in this pathway has this IRI, so it can never be earned
+                self.badges.append(None)
+        return self.badge_index[iri]
+
+    def _add_requirement(self, node, bit):
+        if not node.required & (1 << bit):
+            node.required |= 1 << bit
+            node.required_bits.append(bit)
+
+    def _compile(self, tree, badgeclasses, is_root=False):
+        element = tree['element']
+        requirements = element.completion_requirements
+        if not requirements and is_root:
+            # if there is no completionspec, infer one of elementjunction of all children elements
+            requirements = {
+                '@type': CompletionRequirementSpecFactory.ELEMENT_JUNCTION,
+                'junctionConfig': {'@type': CompletionRequirementSpecFactory.JUNCTION_TYPE_CONJUNCTION},
+                'elements': list(tree['children'].keys()),
+            }
+        spec = CompletionRequirementSpecFactory.parse_obj(requirements) if requirements else None
+
+        if spec is None:
+            node = CompiledPathwayNode(len(self.nodes), element)
+
+        elif spec.completion_type == CompletionRequirementSpecFactory.ELEMENT_JUNCTION:
+            required_ids = [e for e in requirements.get('elements', []) if e in spec.elements]
+            optional_ids = [c['element'].jsonld_id for c in sorted(tree['children'].values(),
+                                                                   key=lambda c: c['element'].ordering)]
+            child_nodes = {}
+            for element_id in required_ids + optional_ids:
+                if element_id in tree['children'] and element_id not in child_nodes:
+                    child_nodes[element_id] = self._compile(tree['children'][element_id], badgeclasses)
+            node = CompiledPathwayNode(len(self.nodes), element, spec.completion_type, spec.junction_type,
+                                       spec.required_number)
+            for element_id in required_ids:
+                if element_id in child_nodes:
+                    self._add_requirement(node, child_nodes[element_id].index)
+
+        elif spec.completion_type == CompletionRequirementSpecFactory.BADGE_JUNCTION:
+            node = CompiledPathwayNode(len(self.nodes), element, spec.completion_type, spec.junction_type,
+                                       spec.required_number)
+            for iri in requirements.get('badges', []):
+                self._add_requirement(node, self._badge_bit(iri, badgeclasses))
+
+        self.nodes.append(node)
+        return node
+
+    def evaluate(self, instances):
+        """
+        Returns the completion report of every node for a recipient who earned instances, revoked instances and those of
+        badgeclasses outside the pathway are ignored.
+        """
+        earned = 0
+        assertions = {}
+        for instance in instances:
+            bit = self.badgeclass_bits.get(instance.badgeclass_id)
+            if bit is None or instance.revoked or bit in assertions:
+                continue
+            earned |= 1 << bit
+            assertions[bit] = instance.jsonld_id
+
+        completed_nodes = 0
+        completions = []
+        for node in self.nodes:
+            completion = {
+                'element': node.element,
+                'completed': False,
+            }
+            if node.completion_badge is not None:
+                completion['completionBadge'] = node.completion_badge
+
+            if node.completion_type == CompletionRequirementSpecFactory.ELEMENT_JUNCTION:
+                matched = completed_nodes & node.required
+                completion['completedElements'] = [
+                    {'@id': self.nodes[index].element['@id']} for index in node.required_bits if matched & (1 << index)]
+                completion['completedRequirementCount'] = _popcount(matched)
+                completion['completed'] = completion['completedRequirementCount'] >= node.required_number
+
+            elif node.completion_type == CompletionRequirementSpecFactory.BADGE_JUNCTION:
+                matched = earned & node.required
+                completion['completedBadges'] = [
+                    dict(self.badges[bit], assertion=assertions[bit]) for bit in node.required_bits if matched & (1 << bit)]
+                completion['completedRequirementCount'] = _popcount(matched)
+                if node.junction_type == CompletionRequirementSpecFactory.JUNCTION_TYPE_CONJUNCTION:
+                    completion['completed'] = matched == node.required
+                else:
+                    completion['completed'] = completion['completedRequirementCount'] >= node.required_number
+
+            if completion['completed']:
+                completed_nodes |= 1 << node.index
+            completions.append(completion)
+        return completions
+
+    def evaluate_recipients(self, recipient_profiles, batch_size=500):
+        """
+        Returns the completion reports of each of recipient_profiles, in order.  The unrevoked instances of this
+        pathway's badgeclasses are loaded for batch_size recipients at a time rather than per recipient.
+        """
+        recipient_profiles = list(recipient_profiles)
+        identifiers = list(set(p.recipient_identifier for p in recipient_profiles))
+        instances = defaultdict(list)
+        if self.badgeclass_bits:
+            for start in range(0, len(identifiers), batch_size):
+                queryset = BadgeInstance.objects.filter(
+                    revoked=False,
+                    badgeclass_id__in=self.badgeclass_ids,
+                    recipient_identifier__in=identifiers[start:start + batch_size]
+                ).order_by('pk')
+                for instance in queryset:
+                    instances[instance.recipient_identifier].append(instance)
+        return [self.evaluate(instances.get(p.recipient_identifier, ())) for p in recipient_profiles]
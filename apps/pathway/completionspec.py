@@ -127,7 +127,7 @@ class BadgeJunctionCompletionRequirementSpec(CompletionRequirementSpec):
     def check_completion(self, completion, instances=()):
         completion['completedBadges'] = []
         for i in instances:
-            if i.cached_badgeclass.json['id'] in self.badges:
+            if i.cached_badgeclass.jsonld_id in self.badges:
                 completion['completedBadges'].append({
                     '@id': i.cached_badgeclass.jsonld_id,
                     'slug': i.cached_badgeclass.entity_id,
@@ -13,6 +13,7 @@ from django.db import models
 from jsonfield import JSONField
 
 from issuer.models import BadgeClass, Issuer
+from mainsite import identity_map
 from mainsite.managers import SlugOrJsonIdCacheModelManager
 from mainsite.utils import OriginSetting
 
@@ -31,10 +32,12 @@ class Pathway(cachemodel.CacheModel, IsActive):
     def publish(self):
         super(Pathway, self).publish()
         self.publish_by('slug')
+        identity_map.evict(self)
         self.issuer.publish()
 
     def delete(self, *args, **kwargs):
         issuer = self.issuer
+        identity_map.evict(self)
         ret = super(Pathway, self).delete(*args, **kwargs)
         issuer.publish()
         return ret
@@ -82,6 +85,13 @@ class Pathway(cachemodel.CacheModel, IsActive):
             self._cached_badgeclasses = list(itertools.chain.from_iterable(badgeclasses))
         return self._cached_badgeclasses
 
+    @cachemodel.cached_method(auto_publish=True)
+    def cached_compiled(self):
+        """
+        The CompiledPathway used to evaluate completions, recompiled whenever the pathway or one of its elements changes
+        """
+        from pathway.completion import CompiledPathway
+        return CompiledPathway(self)
 
     def populate_slug(self):
         return getattr(self, 'name_hint', str(uuid.uuid4()))
@@ -171,6 +181,7 @@ class PathwayElement(cachemodel.CacheModel, CreatedUpdatedAt, CreatedUpdatedBy,
     def publish(self):
         super(PathwayElement, self).publish()
         self.publish_by('slug')
+        identity_map.evict(self)
         self.cached_pathway.publish()
         if self.parent_element:
             self.parent_element.publish()
@@ -178,6 +189,7 @@ class PathwayElement(cachemodel.CacheModel, CreatedUpdatedAt, CreatedUpdatedBy,
     def delete(self, *args, **kwargs):
         pathway = self.pathway
         parent_element = self.parent_element
+        identity_map.evict(self)
         ret = super(PathwayElement, self).delete(*args, **kwargs)
         pathway.publish()
         if parent_element:
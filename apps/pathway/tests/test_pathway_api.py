@@ -15,7 +15,7 @@ from issuer.serializers_v1 import BadgeInstanceSerializerV1
 from mainsite.tests.base import BadgrTestCase, SetupIssuerHelper
 from mainsite.utils import OriginSetting
 from pathway.completionspec import CompletionRequirementSpecFactory
-from pathway.models import PathwayElement
+from pathway.models import Pathway, PathwayElement
 from pathway.serializers import PathwaySerializer, PathwayElementSerializer
 from recipient.models import RecipientProfile, RecipientGroupMembership, RecipientGroup
 
@@ -437,6 +437,71 @@ class PathwayCompletionTests(SetupIssuerHelper, BadgrTestCase):
         self.assertEqual(len(completions), 1)
         self.assertTrue(completions[0]['completed'])
 
+    def test_compiled_pathway_completions(self):
+        pathway = Pathway.objects.get(pk=self.build_pathway(creator=self.test_user).pk)
+        compiled = pathway.cached_compiled()
+        self.assertEqual(compiled.badgeclass_ids, [self.test_badgeclass.pk])
+
+        recipient = 'testrecipient3@example.com'
+        profile, _ = RecipientProfile.cached.get_or_create(recipient_identifier=recipient)
+        completions = profile.cached_completions(pathway)
+        self.assertEqual(len(completions), 4)
+        self.assertEqual(completions[-1]['element']['@id'], pathway.cached_root_element.jsonld_id)
+        self.assertNotIn(True, [c['completed'] for c in completions])
+
+        badge_instance = self.test_badgeclass.issue(recipient, created_by=self.test_user)
+        completions = compiled.evaluate([badge_instance])
+        self.assertNotIn(False, [c['completed'] for c in completions])
+        self.assertEqual(completions[0]['completedBadges'], [{
+            '@id': self.test_badgeclass.jsonld_id,
+            'slug': self.test_badgeclass.entity_id,
+            'assertion': badge_instance.jsonld_id,
+        }])
+        self.assertEqual(completions[-1]['completedRequirementCount'], 2)
+
+        badge_instance.revoke('Revoked')
+        self.assertNotIn(True, [c['completed'] for c in compiled.evaluate([badge_instance])])
+
+        # changing an element recompiles the pathway, a root without requirements requires all its children
+        root_element = pathway.cached_root_element
+        root_element.completion_requirements = None
+        root_element.save()
+        completions = Pathway.objects.get(pk=pathway.pk).cached_compiled().evaluate([
+            self.test_badgeclass.issue(recipient, created_by=self.test_user)])
+        self.assertEqual(completions[-1]['completedRequirementCount'], 3)
+        self.assertTrue(completions[-1]['completed'])
+
+    def test_completion_detail_evaluates_recipient_groups_in_batch(self):
+        pathway = self.build_single_element_pathway(creator=self.test_user)
+        self.create_group()
+        recipient_group = RecipientGroup.objects.first()
+        recipients = ['member{}@example.com'.format(i) for i in range(3)]
+        for recipient in recipients:
+            profile, _ = RecipientProfile.cached.get_or_create(recipient_identifier=recipient)
+            RecipientGroupMembership.objects.create(recipient_group=recipient_group, recipient_profile=profile)
+        self.test_badgeclass.issue(recipients[1], created_by=self.test_user)
+
+        url = reverse('pathway_completion_detail', kwargs={
+            'issuer_slug': self.test_issuer.entity_id,
+            'pathway_slug': pathway.slug,
+            'element_slug': pathway.root_element.slug
+        }) + '?recipientGroup%5B%5D={}'.format(recipient_group.entity_id)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        completed = [c['completions'][0]['completed'] for c in response.data['recipientCompletions']]
+        self.assertEqual(sorted(completed), [False, False, True])
+        self.assertNotIn('pagination', response.data)
+
+        response = self.client.get(url + '&num=2')
+        self.assertEqual(len(response.data['recipientCompletions']), 2)
+        self.assertEqual(response.data['pagination']['count'], 3)
+        self.assertTrue(response.data['pagination']['hasNext'])
+
+        response = self.client.get(response.data['pagination']['nextResults'])
+        self.assertEqual(len(response.data['recipientCompletions']), 1)
+        self.assertFalse(response.data['pagination']['hasNext'])
+
     def test_completion_badge_awarding(self):
         pathway = self.build_pathway(creator=self.test_user)
         completed_badgeclass = self.setup_badgeclass(issuer=self.test_issuer)
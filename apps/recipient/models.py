@@ -9,7 +9,6 @@ from entity.models import BaseVersionedEntity
 from issuer.models import BadgeInstance, BaseAuditedModel, Issuer
 from mainsite.managers import SlugOrJsonIdCacheModelManager
 from mainsite.utils import OriginSetting
-from pathway.completionspec import CompletionRequirementSpecFactory, ElementJunctionCompletionRequirementSpec
 
 
 class RecipientProfile(BaseVersionedEntity, CreatedUpdatedAt, CreatedUpdatedBy, IsActive):
@@ -28,34 +27,20 @@ class RecipientProfile(BaseVersionedEntity, CreatedUpdatedAt, CreatedUpdatedBy,
             return self.display_name
         return self.recipient_identifier
 
+    def save(self, *args, **kwargs):
+        from badgeuser.models import RecipientIdentifier
+        super(RecipientProfile, self).save(*args, **kwargs)
+        for indexed in RecipientIdentifier.objects.filter(
+                identifier=RecipientIdentifier.normalize(self.recipient_identifier), recipient_profile__isnull=True):
+            indexed.recipient_profile = self
+            indexed.save()
+
     @property
     def jsonld_id(self):
         return u'mailto:{}'.format(self.recipient_identifier)
 
     def cached_completions(self, pathway):
-        # get recipients instances that are aligned to this pathway
-        badgeclasses = pathway.cached_badgeclasses()
-        instances = filter(lambda i: not i.revoked and i.cached_badgeclass in badgeclasses, self.cached_badge_instances())
-
-        # recurse the tree to build completions
-        tree = pathway.element_tree
-        completion_spec = CompletionRequirementSpecFactory.parse_element(tree['element'])
-
-        if not completion_spec:
-            # if there is no completionspec, infer one of elementjunction of all children elements
-            completion_spec = ElementJunctionCompletionRequirementSpec(
-                junction_type=CompletionRequirementSpecFactory.JUNCTION_TYPE_CONJUNCTION,
-                required_number=len(tree['children']),
-                elements=(c['element'].jsonld_id for c in tree['children'].itervalues()))
-            tree['element'].completion_requirements = completion_spec.serialize()
-
-        if completion_spec.completion_type == CompletionRequirementSpecFactory.BADGE_JUNCTION:
-            return [completion_spec.check_completion(tree, instances)]
-        elif completion_spec.completion_type == CompletionRequirementSpecFactory.ELEMENT_JUNCTION:
-            return completion_spec.check_completions(tree, instances)
-        else:
-            # unsupported completion_type
-            return []
+        return pathway.cached_compiled().evaluate(self.cached_badge_instances())
 
     @cachemodel.cached_method(auto_publish=True)
     def cached_group_memberships(self):